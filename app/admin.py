@@ -1,6 +1,16 @@
-from django.contrib import admin
+from decimal import Decimal
 
-from .models import Category, Product, Gallery, Order, OrderProduct, Customer, ShippingAddress
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.db import transaction
+from django.db.models import Count
+from django.template.response import TemplateResponse
+
+from . import tasks
+from .forms import ProductBulkEditForm
+from .models import Category, Product, Gallery, Order, OrderProduct, Customer, ShippingAddress, Task
+from .signals import catalog_changed
+from .utils import bulk_update_products, reprice_cart_lines
 
 
 class GalleryInline(admin.TabularInline):
@@ -13,7 +23,66 @@ class GalleryInline(admin.TabularInline):
     extra = 1
 
 
-class CategoryAdmin(admin.ModelAdmin):
+class CatalogChangeAdminMixin:
+    """
+    Примесь для админ-классов каталога: отправляет сигнал catalog_changed
+    один раз на сохранение формы или на всю пачку строк списка (list_editable),
+    а не на каждую изменённую строку.
+    """
+
+    def notify_catalog_changed(self, pks=None):
+        """ Отправляет сигнал об изменении каталога после фиксации транзакции """
+        transaction.on_commit(
+            lambda: catalog_changed.send(sender=self.model, pks=pks)
+        )
+
+    def save_model(self, request, obj, form, change):
+        """
+        При изменении существующего объекта записывает только изменённые поля
+        (и поля auto_now, например дату изменения товара).
+        """
+        if change and form.changed_data:
+            auto_now = [
+                field.name for field in obj._meta.concrete_fields
+                if getattr(field, 'auto_now', False)
+            ]
+            obj.save(update_fields=[*form.changed_data, *auto_now])
+        else:
+            super().save_model(request, obj, form, change)
+
+    def response_add(self, request, obj, post_url_continue=None):
+        """ Сообщает об изменении каталога после добавления объекта """
+        self.notify_catalog_changed([obj.pk])
+        return super().response_add(request, obj, post_url_continue)
+
+    def response_change(self, request, obj):
+        """ Сообщает об изменении каталога после редактирования объекта """
+        self.notify_catalog_changed([obj.pk])
+        return super().response_change(request, obj)
+
+    def delete_model(self, request, obj):
+        """ Сообщает об изменении каталога после удаления объекта """
+        pk = obj.pk
+        super().delete_model(request, obj)
+        self.notify_catalog_changed([pk])
+
+    def delete_queryset(self, request, queryset):
+        """ Сообщает об изменении каталога один раз после удаления выборки """
+        pks = list(queryset.values_list('pk', flat=True))
+        super().delete_queryset(request, queryset)
+        self.notify_catalog_changed(pks)
+
+    def changelist_view(self, request, extra_context=None):
+        """
+        После сохранения изменений списка (list_editable) отправляет один сигнал на всю пачку.
+        """
+        response = super().changelist_view(request, extra_context)
+        if request.method == 'POST' and '_save' in request.POST and response.status_code == 302:
+            self.notify_catalog_changed()
+        return response
+
+
+class CategoryAdmin(CatalogChangeAdminMixin, admin.ModelAdmin):
     """
     Класс настройки админ-панели для модели Category.
     Позволяет управлять отображением и поведением категорий в админке.
@@ -23,21 +92,88 @@ class CategoryAdmin(admin.ModelAdmin):
         'parent',
         'get_product_count',
     )
+    list_select_related = (
+        'parent',
+    )
     prepopulated_fields = {
         'slug': ('category_name', ),
     }
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """
+        Добавляет к запросу количество товаров категории,
+        чтобы список категорий строился одним запросом с GROUP BY.
+        """
+        return super().get_queryset(request).annotate(
+            product_count=Count('products')
+        )
 
+    @admin.display(
+        description='Количество товаров',
+        ordering='product_count',
+    )
     def get_product_count(self, obj):
         """
         Метод для подсчета количества товаров в текущей категории.
         Возвращает количество товаров, связанных с этой категорией.
         """
-        return str(len(obj.products.all())) if obj.products else '0'
+        return obj.product_count
+
+
+class PriceRangeFilter(admin.SimpleListFilter):
+    """
+    Фильтр товаров по диапазонам цены.
+    Варианты фиксированы, поэтому для их построения не нужен запрос к базе.
+    """
+    title = 'Цена товара'
+    parameter_name = 'price_range'
+    ranges = (
+        ('0-1000', 'до 1 000', 0, 1000),
+        ('1000-5000', '1 000 - 5 000', 1000, 5000),
+        ('5000-20000', '5 000 - 20 000', 5000, 20000),
+        ('20000-', 'от 20 000', 20000, None),
+    )
+
+    def lookups(self, request, model_admin):
+        """ Возвращает варианты фильтра """
+        return [(value, label) for value, label, low, high in self.ranges]
+
+    def queryset(self, request, queryset):
+        """ Ограничивает список товаров выбранным диапазоном цены """
+        for value, label, low, high in self.ranges:
+            if self.value() == value:
+                queryset = queryset.filter(product_price__gte=low)
+                if high is not None:
+                    queryset = queryset.filter(product_price__lt=high)
+                return queryset
+        return queryset
+
 
-    get_product_count.short_description = 'Количество товаров'
+class StockFilter(admin.SimpleListFilter):
+    """
+    Фильтр товаров по наличию на складе.
+    """
+    title = 'Наличие на складе'
+    parameter_name = 'in_stock'
+
+    def lookups(self, request, model_admin):
+        """ Возвращает варианты фильтра """
+        return (
+            ('yes', 'В наличии'),
+            ('no', 'Нет в наличии'),
+        )
+
+    def queryset(self, request, queryset):
+        """ Ограничивает список товаров по остатку на складе """
+        if self.value() == 'yes':
+            return queryset.filter(product_quantity__gt=0)
+        if self.value() == 'no':
+            return queryset.filter(product_quantity__lte=0)
+        return queryset
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CatalogChangeAdminMixin, admin.ModelAdmin):
     """
     Класс настройки админ-панели для модели Product.
     Позволяет добавлять функциональность по отображению, редактированию и фильтрации продуктов.
@@ -61,10 +197,16 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {
         'slug': ('product_name', ),
     }
+    list_select_related = (
+        'product_category',
+    )
     list_filter = (
-        'product_name',
-        'product_price',
+        ('product_created_at', admin.DateFieldListFilter),
+        PriceRangeFilter,
+        StockFilter,
+        'product_category',
     )
+    show_full_result_count = False
     list_display_links = (
         'pk',
         'product_name',
@@ -75,6 +217,114 @@ class ProductAdmin(admin.ModelAdmin):
     inlines = (
         GalleryInline,
     )
+    actions = (
+        'bulk_edit',
+        'reprice_carts',
+    )
+    bulk_edit_chunk_size = 5000
+
+    @admin.action(
+        description='Массово изменить цену, остаток, цвет или размер',
+        permissions=('change', ),
+    )
+    def bulk_edit(self, request, queryset):
+        """
+        Действие админ-панели для массового изменения выбранных товаров.
+        Сначала показывает страницу с формой изменений, после подтверждения
+        применяет их пачками UPDATE в одной транзакции. Выборка больше
+        bulk_edit_chunk_size товаров изменяется фоновой задачей (команда run_worker).
+        """
+        form = ProductBulkEditForm(
+            data=request.POST if 'apply' in request.POST else None
+        )
+        if form.is_bound and form.is_valid():
+            changes = form.get_changes()
+            if queryset.count() > self.bulk_edit_chunk_size:
+                pks = list(queryset.values_list('pk', flat=True))
+                tasks.bulk_edit_products.enqueue(
+                    pks=pks,
+                    # Decimal не сериализуется в JSON аргументов задачи
+                    changes={
+                        field: str(value) if isinstance(value, Decimal) else value
+                        for field, value in changes.items()
+                    },
+                )
+                self.message_user(
+                    request,
+                    f'Изменение товаров ({len(pks)}) поставлено в очередь фоновых задач',
+                    messages.INFO,
+                )
+                return None
+
+            updated = bulk_update_products(
+                queryset=queryset,
+                changes=changes,
+                chunk_size=self.bulk_edit_chunk_size,
+            )
+            self.message_user(
+                request,
+                f'Изменено товаров: {updated}',
+                messages.SUCCESS,
+            )
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Массовое изменение товаров',
+            'opts': self.model._meta,
+            'form': form,
+            'selected_count': queryset.count(),
+            'selected_pks': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action': 'bulk_edit',
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(
+            request=request,
+            template='admin/app/product/bulk_edit.html',
+            context=context,
+        )
+
+    @admin.action(
+        description='Пересчитать корзины по текущим ценам',
+        permissions=('change', ),
+    )
+    def reprice_carts(self, request, queryset):
+        """
+        Действие админ-панели: переносит текущие цены выбранных товаров
+        в корзины покупателей (оформленные заказы не меняются).
+        """
+        updated = reprice_cart_lines(product_ids=queryset.values('pk'))
+        self.message_user(
+            request,
+            f'Пересчитано строк корзин: {updated}',
+            messages.SUCCESS,
+        )
+
+
+class TaskAdmin(admin.ModelAdmin):
+    """
+    Класс настройки админ-панели для модели Task: просмотр очереди фоновых задач
+    и ошибок выполнения.
+    """
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'run_at',
+        'attempts',
+        'max_attempts',
+        'locked_by',
+        'finished_at',
+    )
+    list_filter = (
+        'status',
+        'name',
+    )
+    search_fields = (
+        'dedup_key',
+    )
+    show_full_result_count = False
 
 
 admin.site.register(Category, CategoryAdmin)
@@ -84,3 +334,4 @@ admin.site.register(Order)
 admin.site.register(OrderProduct)
 admin.site.register(Customer)
 admin.site.register(ShippingAddress)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,295 @@
+import base64
+import binascii
+import json
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from . import slugs
+from .feeds import media_url
+from .models import DEFAULT_IMAGE, Category, Gallery, Product
+from .signals import get_catalog_version, get_stock_version
+from .sitemaps import route_template
+
+
+# JSON API каталога только для чтения: дерево категорий, список товаров
+# (фильтры, сортировка, курсорная пагинация) и карточка товара.
+# Параметр fields= задаёт набор полей ответа: из базы через values_list читаются
+# только нужные столбцы, поэтому описание и информация о товаре (TextField)
+# не загружаются, пока их не запросили.
+# ETag ответа строится из версий данных (get_catalog_version, get_stock_version)
+# до обращения к базе: повторный запрос с If-None-Match получает 304 без SQL-запросов.
+
+# Поле ответа -> столбец Product (None - вычисляемое поле)
+PRODUCT_FIELDS = {
+    'id': 'pk',
+    'slug': 'slug',
+    'name': 'product_name',
+    'price': 'product_price',
+    'quantity': 'product_quantity',
+    'category': 'product_category_id',
+    'size': 'product_size',
+    'color': 'product_color',
+    'description': 'product_description',
+    'info': 'product_info',
+    'created_at': 'product_created_at',
+    'updated_at': 'product_updated_at',
+    'url': None,
+    'image': None,
+    'images': None,
+}
+LIST_FIELDS = ('id', 'slug', 'name', 'price', 'quantity', 'image', 'url')
+DETAIL_FIELDS = tuple(PRODUCT_FIELDS)
+
+# Сортировка списка -> поле модели (с "-" по убыванию); при равенстве - по pk
+SORTS = {
+    'id': 'pk',
+    'price': 'product_price',
+    '-price': '-product_price',
+    'new': '-product_created_at',
+}
+
+
+class ApiError(Exception):
+    """ Ошибка в параметрах запроса (ответ 400 или 404 с описанием) """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@cache
+def orjson_module():
+    """
+    Возвращает модуль orjson или None, если пакет не установлен
+    (тогда ответы кодируются стандартным модулем json).
+    """
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def dumps(data):
+    """
+    Кодирует данные в JSON (UTF-8, без пробелов). Decimal - строкой без потери точности.
+    """
+    orjson = orjson_module()
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+def error_response(error):
+    return json_response({'error': str(error)}, status=error.status)
+
+
+def conditional_response(request, version, build):
+    """
+    Ответ с ETag из версии данных version: если у клиента та же версия - 304,
+    иначе JSON из build(). Клиент должен перепроверять ответ при каждом запросе.
+    """
+    etag = quote_etag(version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = json_response(build())
+        response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def data_version(fields=(), stock=False):
+    """
+    Версия данных ответа: версия каталога, а если ответ зависит от остатков
+    (поле quantity или фильтр по наличию) - ещё и версия остатков.
+    """
+    version = f'{get_catalog_version()}'
+    if stock or 'quantity' in fields:
+        version += f'-{get_stock_version()}'
+    return version
+
+
+def parse_fields(value, default):
+    """ Набор полей из параметра fields= ("id,name,price") """
+    if not value:
+        return default
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def parse_int(params, name, default, minimum, maximum):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(f'Параметр {name} должен быть целым числом')
+    return max(minimum, min(value, maximum))
+
+
+def encode_cursor(value, pk):
+    """ Курсор следующей страницы: значение поля сортировки и pk последнего товара """
+    return base64.urlsafe_b64encode(json.dumps([str(value), pk]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """ Значение поля сортировки и pk из курсора; значение приводится к типу поля """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return Product._meta.get_field(field).to_python(value), int(pk)
+    except (binascii.Error, ValueError, TypeError, ValidationError):
+        raise ApiError('Некорректный курсор')
+
+
+def category_tree(base_url):
+    """
+    Дерево категорий одним запросом: [{id, slug, name, image, url, children: [...]}, ...].
+    """
+    prefix, suffix = route_template('category')
+    image_url = media_url(base_url)
+    nodes, roots = {}, []
+    rows = Category.objects.order_by('pk').values_list('pk', 'slug', 'category_name', 'category_image', 'parent_id')
+    for pk, slug, name, image, parent_id in rows:
+        nodes[pk] = {
+            'id': pk,
+            'slug': slug,
+            'name': name,
+            'image': image_url(image) if image else DEFAULT_IMAGE,
+            'url': base_url + prefix + slug + suffix if slug else None,
+            'children': [],
+            'parent_id': parent_id,
+        }
+    for node in nodes.values():
+        parent = nodes.get(node.pop('parent_id'))
+        (parent['children'] if parent else roots).append(node)
+    return roots
+
+
+def product_columns(fields, *required):
+    """ Столбцы values_list для полей ответа (и обязательных столбцов required) """
+    columns = dict.fromkeys(required)
+    for field in fields:
+        if field == 'url':
+            columns['slug'] = None
+        elif PRODUCT_FIELDS[field]:
+            columns[PRODUCT_FIELDS[field]] = None
+    columns.setdefault('pk')
+    return tuple(columns)
+
+
+def serialize_products(rows, columns, fields, base_url):
+    """
+    Преобразует строки values_list в словари с полями fields.
+    Изображения (image, images) загружаются одним запросом на все строки.
+    """
+    images = {}
+    if 'image' in fields or 'images' in fields:
+        for product_id, image in (
+            Gallery.objects
+            .filter(product_id__in=[row[columns.index('pk')] for row in rows])
+            .order_by('pk')
+            .values_list('product_id', 'image')
+        ):
+            images.setdefault(product_id, []).append(image)
+
+    prefix, suffix = route_template('product')
+    image_url = media_url(base_url)
+    results = []
+    for row in rows:
+        values = dict(zip(columns, row))
+        item = {}
+        for field in fields:
+            if field == 'url':
+                item[field] = base_url + prefix + values['slug'] + suffix if values['slug'] else None
+            elif field == 'image':
+                product_images = images.get(values['pk'])
+                item[field] = image_url(product_images[0]) if product_images else DEFAULT_IMAGE
+            elif field == 'images':
+                item[field] = [image_url(image) for image in images.get(values['pk'], [])]
+            else:
+                value = values[PRODUCT_FIELDS[field]]
+                item[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+        results.append(item)
+    return results
+
+
+def filter_products(params):
+    """
+    Товары по фильтрам списка:
+    category (slug; товары категории и её подкатегорий), min_price, max_price, in_stock=1.
+    """
+    products = Product.objects.all()
+    if category := params.get('category'):
+        category_id = slugs.categories.resolve(category)
+        if category_id is None:
+            raise ApiError('Категория не найдена', status=404)
+        products = products.filter(
+            Q(product_category_id=category_id) | Q(product_category__parent_id=category_id)
+        )
+    for name, lookup in (('min_price', 'product_price__gte'), ('max_price', 'product_price__lte')):
+        if value := params.get(name):
+            try:
+                products = products.filter(**{lookup: Product._meta.get_field('product_price').to_python(value)})
+            except ValidationError:
+                raise ApiError(f'Параметр {name} должен быть числом')
+    if params.get('in_stock') == '1':
+        products = products.filter(product_quantity__gt=0)
+    return products
+
+
+def product_list(params, fields, base_url):
+    """
+    Страница списка товаров с курсорной пагинацией по полю сортировки и pk:
+    {"results": [...], "next": курсор следующей страницы или null}.
+    Страница читается одним запросом независимо от её номера (без OFFSET).
+    """
+    sort = params.get('sort', 'id')
+    if sort not in SORTS:
+        raise ApiError(f'Сортировка должна быть одной из: {", ".join(SORTS)}')
+    descending = SORTS[sort].startswith('-')
+    field = SORTS[sort].lstrip('-')
+    limit = parse_int(params, 'limit', settings.CATALOG_API_PAGE_SIZE, 1, settings.CATALOG_API_MAX_PAGE_SIZE)
+
+    products = filter_products(params)
+    if cursor := params.get('cursor'):
+        value, pk = decode_cursor(cursor, field)
+        after = 'lt' if descending else 'gt'
+        products = products.filter(
+            Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'pk__{after}': pk})
+        )
+    ordering = ('-' if descending else '') + 'pk'
+    columns = product_columns(fields, field, 'pk')
+    rows = list(products.order_by(SORTS[sort], ordering).values_list(*columns)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[columns.index(field)], last[columns.index('pk')])
+    return {
+        'results': serialize_products(rows, columns, fields, base_url),
+        'next': next_cursor,
+    }
+
+
+def product_detail(pk, fields, base_url):
+    """ Карточка товара или ApiError(404) """
+    columns = product_columns(fields)
+    rows = list(Product.objects.filter(pk=pk).values_list(*columns))
+    if not rows:
+        raise ApiError('Товар не найден', status=404)
+    return serialize_products(rows, columns, fields, base_url)[0]
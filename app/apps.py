@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        """ Подключает обработчики сигналов приложения """
+        from . import leaderboard, signals, slugs, tasks  # noqa: F401
+        from .db import apply_sqlite_pragmas
+
+        connection_created.connect(
+            apply_sqlite_pragmas,
+            dispatch_uid='app.apply_sqlite_pragmas',
+        )
@@ -0,0 +1,155 @@
+import gzip
+import re
+from functools import cache
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+# Сборка статики выполняется командой collectstatic с хранилищем
+# CompressedManifestStaticFilesStorage (config/settings/prod.py):
+# исходные CSS/JS объединяются в бандлы из settings.STATIC_BUNDLES и минифицируются,
+# к именам всех файлов добавляется хэш содержимого, а рядом с текстовыми файлами
+# записываются сжатые варианты .gz и .br (см. StaticFilesMiddleware).
+
+# Файлы, которые имеет смысл сжимать; изображения и шрифты woff/woff2 уже сжаты
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html',
+    '.ico', '.ttf', '.otf', '.eot',
+)
+# Сжатый вариант сохраняется, только если он меньше исходного хотя бы на 5%
+COMPRESSION_MIN_RATIO = 0.95
+
+STRING_OR_COMMENT_RE = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*(?!!).*?\*/',
+    re.DOTALL,
+)
+SOURCE_MAP_RE = re.compile(r'^[ \t]*(?://|/\*)# sourceMappingURL=[^\n]*\n?', re.MULTILINE)
+
+
+@cache
+def brotli_module():
+    """
+    Возвращает модуль brotli или None, если пакет Brotli не установлен
+    (тогда сохраняются только варианты .gz).
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def minify_css(source):
+    """
+    Удаляет из CSS комментарии (кроме /*! ... */) и лишние пробелы.
+    Содержимое строк не изменяется.
+    """
+    parts = []
+    position = 0
+    for match in STRING_OR_COMMENT_RE.finditer(source):
+        parts.append(compact_css(source[position:match.start()]))
+        # Строка сохраняется как есть, комментарий заменяется ничем
+        parts.append(match.group(1) or '')
+        position = match.end()
+    parts.append(compact_css(source[position:]))
+    return ''.join(parts).strip()
+
+
+def compact_css(code):
+    """
+    Сжимает пробелы в CSS без строк и комментариев.
+    Пробелы вокруг ":" не трогаются: в селекторах "a :hover" и "a:hover" различаются.
+    """
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r' ?([{};,]) ?', r'\1', code)
+    return code.replace(';}', '}')
+
+
+def minify_js(source):
+    """
+    Консервативная минификация JavaScript: удаляет отступы и пустые строки.
+    Переводы строк сохраняются, поэтому автоматическая расстановка ";" не меняется.
+    """
+    return '\n'.join(line.strip() for line in source.splitlines() if line.strip())
+
+
+def build_bundle(storage, name, sources):
+    """
+    Собирает бандл name из исходных файлов хранилища и сохраняет его в хранилище.
+    Уже минифицированные файлы (*.min.css, *.min.js) не обрабатываются повторно.
+    Ссылки на source map удаляются: к объединённому файлу они не относятся.
+    """
+    is_css = PurePosixPath(name).suffix == '.css'
+    minify = minify_css if is_css else minify_js
+    parts = []
+    for source in sources:
+        if not storage.exists(source):
+            raise ValueError(f'Файл {source!r} из бандла {name!r} не найден')
+        with storage.open(source) as file:
+            content = SOURCE_MAP_RE.sub('', file.read().decode('utf-8'))
+        parts.append(content.strip() if '.min.' in source else minify(content))
+    # ";" между скриптами защищает от файлов, не завершённых точкой с запятой
+    content = ('\n' if is_css else ';\n').join(parts) + '\n'
+    save_file(storage, name, content.encode('utf-8'))
+
+
+def compress_file(storage, name):
+    """
+    Записывает рядом с файлом сжатые варианты name.gz и name.br.
+    Возвращает список сохранённых имён.
+    """
+    with storage.open(name) as file:
+        data = file.read()
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    brotli = brotli_module()
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+
+    saved = []
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data) * COMPRESSION_MIN_RATIO:
+            save_file(storage, name + suffix, compressed)
+            saved.append(name + suffix)
+    return saved
+
+
+def save_file(storage, name, content):
+    """
+    Сохраняет файл под точным именем, заменяя существующий
+    (save() хранилища выбрал бы для существующего имени другое).
+    """
+    if storage.exists(name):
+        storage.delete(name)
+    storage._save(name, ContentFile(content))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хранилище статики с бандлами, хэшами в именах файлов и предварительно
+    сжатыми вариантами .gz/.br.
+    """
+    # Обрабатываются только url() и @import в CSS: ссылки sourceMappingURL
+    # указывают на файлы .map, которых в поставке библиотек часто нет,
+    # а из бандлов эти ссылки удаляются
+    patterns = (
+        ('*.css', ManifestStaticFilesStorage.patterns[0][1][:2]),
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        # Бандлы собираются из уже скопированных файлов и хэшируются вместе с остальными
+        for name, sources in settings.STATIC_BUNDLES.items():
+            build_bundle(self, name, sources)
+            paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                compress_file(self, name)
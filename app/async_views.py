@@ -0,0 +1,172 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+
+from . import views
+from .models import Category, Product
+from . import leaderboard, slugs, tasks
+from .recommendations import aget_similar_products
+from .utils import CartForAuthenticatedUser, CartError, get_cart, get_cart_data
+
+
+# Асинхронные версии представлений каталога и корзины (включаются настройкой ASYNC_VIEWS).
+# Шаблоны отдаются через TemplateResponse: Django отрисовывает их в потоке уже после
+# представления, поэтому ленивые запросы внутри шаблонов остаются допустимыми.
+
+
+async def alist(queryset):
+    """ Выполняет запрос асинхронно и возвращает список объектов """
+    return [obj async for obj in queryset]
+
+
+class CountedPaginator(Paginator):
+    """
+    Пагинатор с заранее посчитанным количеством объектов,
+    чтобы при разбиении на страницы не выполнялся синхронный COUNT.
+    """
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self.__dict__['count'] = count
+
+
+class MainPage(views.MainPage):
+    """
+    Асинхронная главная страница: категории верхнего уровня и популярные товары
+    запрашиваются одновременно.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        categories, top = await asyncio.gather(
+            alist(self.get_queryset()),
+            alist(leaderboard.top_queryset(limit=3)),
+        )
+        context = {
+            **self.extra_context,
+            'categories': categories,
+            'top': top,
+        }
+        return TemplateResponse(request, self.template_name, context)
+
+
+class SubCategories(views.SubCategories):
+    """
+    Асинхронная страница категории с товарами её подкатегорий.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        parent_category = await slugs.aget_object_by_slug(Category.objects, self.kwargs['slug'])
+        type_field = request.GET.get('type')
+        if type_field:
+            category_id = await slugs.categories.aresolve(type_field)
+            products = Product.objects.filter(product_category_id=category_id)
+        else:
+            products = Product.objects.filter(product_category__parent=parent_category)
+        products = products.order_by('pk').prefetch_related('images')
+
+        if type_field:
+            if category_id is None:
+                top = Product.objects.none()
+            else:
+                top = leaderboard.top_queryset(limit=3, category=category_id)
+        else:
+            top = leaderboard.top_queryset(limit=3, root_category=parent_category)
+        filters, count, top = await asyncio.gather(
+            alist(Category.objects.filter(parent=parent_category)),
+            products.acount(),
+            alist(top),
+        )
+        paginator = CountedPaginator(products, self.paginate_by, count)
+        try:
+            page = paginator.page(request.GET.get('page') or 1)
+        except InvalidPage:
+            raise Http404('Неверная страница')
+
+        context = {
+            'category': parent_category,
+            'title': parent_category.category_name,
+            'filters': filters,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'products': page.object_list,
+            'top': top if page.number == 1 else [],
+        }
+        return TemplateResponse(request, self.template_name, context)
+
+
+class ProductPage(views.ProductPage):
+    """
+    Асинхронная страница товара: просмотр учитывается в памяти
+    и записывается фоновой задачей (app/tasks.py).
+    """
+
+    async def get(self, request, *args, **kwargs):
+        product = await slugs.aget_object_by_slug(Product.objects, self.kwargs['slug'])
+        await tasks.views.arecord(product.pk)
+        products = await aget_similar_products(product)
+        context = {
+            'product': product,
+            'title': product.product_name,
+            'products': products,
+        }
+        return TemplateResponse(request, self.template_name, context)
+
+
+async def search(request):
+    """ Асинхронный поиск товара по названию; пустой запрос - пустой результат """
+    query = request.GET.get('q')
+    products = []
+    if query:
+        products = await alist(
+            Product.objects
+            .filter(product_name__icontains=query)
+            .prefetch_related('images')
+        )
+    context = {
+        'title': 'Результаты поиска',
+        'products': products,
+    }
+    return TemplateResponse(request, 'category.html', context)
+
+
+async def cart(request):
+    """
+    Асинхронное отображение страницы корзины.
+    Корзина гостя хранится в сессии и читается в потоке.
+    """
+    request.user = await request.auser()
+    if request.user.is_authenticated:
+        cart_info = await CartForAuthenticatedUser(request=request).aget_cart_info()
+    else:
+        cart_info = await sync_to_async(get_cart_data)(request=request)
+
+    context = {
+        'title': 'Корзина',
+        'order': cart_info['order'],
+        'order_products': cart_info['order_products'],
+        'cart_total_quantity': cart_info['cart_total_quantity'],
+    }
+    return TemplateResponse(request, 'cart.html', context)
+
+
+async def to_cart(request, product_id, action):
+    """
+    Асинхронное добавление, удаление или полное удаление продукта из корзины.
+    Изменение корзины выполняется в потоке: транзакции и блокировки
+    асинхронным ORM пока не поддерживаются.
+    """
+    request.user = await request.auser()
+    try:
+        await sync_to_async(get_cart)(
+            request=request,
+            product_id=product_id,
+            action=action,
+        )
+    except CartError:
+        raise Http404('Неизвестное действие или товар')
+    return redirect('cart')
@@ -0,0 +1,232 @@
+import importlib
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import clear_url_caches
+
+from django.contrib.auth.models import User
+
+from .catalog_io import batched
+from .models import Category, Customer, FavoriteProduct, Gallery, Order, OrderProduct, Product
+
+
+@contextmanager
+def benchmark_database(verbosity=0, on_disk=False):
+    """
+    Создаёт временную тестовую базу данных на время замера,
+    чтобы бенчмарки не трогали рабочие данные.
+    on_disk=True размещает тестовую базу SQLite в файле вместо памяти:
+    общая база в памяти блокирует таблицы целиком при параллельной записи.
+    Ограничение частоты запросов на время замера отключается: бенчмарки шлют
+    запросы от одного клиента и иначе измеряли бы ответы 429.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        test_settings = connections['default'].settings_dict['TEST']
+        old_name = test_settings['NAME']
+        if on_disk and connections['default'].vendor == 'sqlite':
+            test_settings['NAME'] = str(Path(directory) / 'benchmark.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=verbosity,
+            interactive=False,
+        )
+        try:
+            with override_settings(RATELIMITS={}):
+                yield
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=verbosity)
+            teardown_test_environment()
+            test_settings['NAME'] = old_name
+
+
+def reload_urlconf():
+    """
+    Перечитывает модули маршрутов после изменения настроек или регистраций в админ-панели.
+    """
+    if 'app.urls' in sys.modules:
+        importlib.reload(sys.modules['app.urls'])
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+def percentile(values, percent):
+    """
+    Возвращает перцентиль percent (0-100) отсортированного списка значений.
+    """
+    if not values:
+        return 0
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def latency_stats(timings):
+    """
+    Возвращает перцентили и среднее списка времён выполнения (в мс).
+    """
+    timings = sorted(timings)
+    return {
+        'min_ms': round(timings[0], 2),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+    }
+
+
+def measure(func, repeat=10, warmup=1):
+    """
+    Выполняет func несколько раз и возвращает статистику времени (в мс)
+    и количество SQL-запросов одного вызова.
+    """
+    for _ in range(warmup):
+        func()
+
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    query_count = len(queries)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return {
+        **latency_stats(timings),
+        'queries': query_count,
+    }
+
+
+def seed_products(count, categories=10, batch_size=5000, using='default'):
+    """
+    Быстро наполняет базу категориями и товарами для замеров.
+    Возвращает список созданных подкатегорий.
+    """
+    root = Category.objects.using(using).create(
+        category_name='Каталог',
+        slug='bench-root',
+    )
+    subcategories = Category.objects.using(using).bulk_create([
+        Category(
+            category_name=f'Категория {number}',
+            slug=f'bench-category-{number}',
+            parent=root,
+        )
+        for number in range(categories)
+    ])
+    for start in range(0, count, batch_size):
+        Product.objects.using(using).bulk_create([
+            Product(
+                product_name=f'Товар {number}',
+                slug=f'bench-product-{number}',
+                product_price=Decimal(number % 50000),
+                product_quantity=number % 20,
+                product_watched=number % 1000,
+                product_category=subcategories[number % categories],
+            )
+            for number in range(start, min(start + batch_size, count))
+        ])
+    return subcategories
+
+
+def seed_storefront(categories=10, subcategories=5, products=5000, images=2, users=50,
+                    carts=20, favorites=5, seed=42, batch_size=5000):
+    """
+    Детерминированно наполняет базу магазином для сценарных замеров:
+    при одинаковых параметрах и seed данные (включая slug и id) совпадают.
+
+    Создаются категории верхнего уровня bench-root-N с подкатегориями bench-category-N-M,
+    товары bench-product-N (по images изображений галереи у каждого), пользователи
+    bench-user-N с паролем bench, открытые заказы-корзины у первых carts пользователей
+    и по favorites избранных товаров у каждого пользователя.
+    Возвращает словарь с количеством созданных объектов.
+    """
+    rng = random.Random(seed)
+    roots = Category.objects.bulk_create([
+        Category(category_name=f'Каталог {number}', slug=f'bench-root-{number}')
+        for number in range(categories)
+    ])
+    leaves = Category.objects.bulk_create([
+        Category(
+            category_name=f'Категория {root_number}-{number}',
+            slug=f'bench-category-{root_number}-{number}',
+            parent=root,
+        )
+        for root_number, root in enumerate(roots)
+        for number in range(subcategories)
+    ])
+
+    for batch in batched(range(products), batch_size):
+        created = Product.objects.bulk_create([
+            Product(
+                product_name=f'Товар {number}',
+                slug=f'bench-product-{number}',
+                product_price=Decimal(rng.randint(100, 100000)),
+                product_quantity=rng.randint(100, 1000),
+                product_watched=rng.randint(0, 5000),
+                product_description=f'Описание товара {number}',
+                product_category=leaves[number % len(leaves)],
+            )
+            for number in batch
+        ])
+        Gallery.objects.bulk_create([
+            Gallery(image=f'products/bench-{product.slug}-{image}.jpg', product=product)
+            for product in created
+            for image in range(images)
+        ])
+    prices = dict(Product.objects.filter(slug__startswith='bench-product-').values_list('pk', 'product_price'))
+    product_ids = list(prices)
+
+    # Хэш пароля один на всех: вычисление PBKDF2 для каждого пользователя заняло бы минуты
+    password = User(username='bench')
+    password.set_password('bench')
+    created_users = User.objects.bulk_create([
+        User(username=f'bench-user-{number}', password=password.password)
+        for number in range(users)
+    ])
+    customers = Customer.objects.bulk_create([
+        Customer(user=user, first_name=user.username, email=f'{user.username}@example.com')
+        for user in created_users
+    ])
+    orders = Order.objects.bulk_create([Order(customer=customer) for customer in customers[:carts]])
+    OrderProduct.objects.bulk_create([
+        OrderProduct.for_product(
+            Product(pk=product_id, product_price=prices[product_id]),
+            rng.randint(1, 3),
+            order=order,
+        )
+        for order in orders
+        for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(1, 5)))
+    ])
+    FavoriteProduct.objects.bulk_create([
+        FavoriteProduct(user=user, product_id=product_id)
+        for user in created_users
+        for product_id in rng.sample(product_ids, min(len(product_ids), favorites))
+    ])
+
+    return {
+        'categories': len(roots) + len(leaves),
+        'products': len(product_ids),
+        'images': len(product_ids) * images,
+        'users': len(created_users),
+        'carts': len(orders),
+        'favorites': len(created_users) * min(len(product_ids), favorites),
+    }
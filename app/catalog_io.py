@@ -0,0 +1,504 @@
+import csv
+import json
+import math
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Category, Product, Gallery
+from .signals import catalog_changed
+
+
+# Разделитель списка изображений в CSV-файлах
+IMAGE_SEPARATOR = '|'
+
+# Кандидатов slug в одном запросе занятых slug: условие OR на каждого кандидата,
+# а глубина дерева выражения в SQLite ограничена 1000
+SLUG_LOOKUP_CHUNK_SIZE = 100
+
+# Порядок колонок при экспорте товаров и категорий
+PRODUCT_COLUMNS = (
+    'slug',
+    'name',
+    'category',
+    'price',
+    'quantity',
+    'size',
+    'color',
+    'description',
+    'info',
+    'images',
+)
+CATEGORY_COLUMNS = (
+    'slug',
+    'name',
+    'parent',
+    'image',
+)
+
+TRANSLIT_TABLE = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+def make_slug(value, max_length=50):
+    """
+    Формирует ASCII-slug из наименования (с транслитерацией кириллицы),
+    пригодный для маршрутов вида <slug:slug>.
+    """
+    slug = slugify(str(value).lower().translate(TRANSLIT_TABLE))
+    return slug[:max_length].strip('-') or 'item'
+
+
+def iter_csv_rows(file):
+    """
+    Генератор строк CSV-файла в виде словарей.
+    Файл читается построчно, поэтому расход памяти не зависит от его размера.
+    """
+    for row in csv.DictReader(file):
+        yield {key: value for key, value in row.items() if key}
+
+
+def iter_jsonl_rows(file):
+    """
+    Генератор строк JSONL-файла (один JSON-объект на строку).
+    Пустые строки пропускаются.
+    """
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_rows(file, file_format):
+    """
+    Возвращает генератор строк для указанного формата ('csv' или 'jsonl').
+    """
+    if file_format == 'csv':
+        return iter_csv_rows(file)
+    if file_format == 'jsonl':
+        return iter_jsonl_rows(file)
+    raise ValueError(f'Неизвестный формат файла: {file_format}')
+
+
+def detect_format(path):
+    """
+    Определяет формат файла по расширению.
+    """
+    suffix = Path(path).suffix.lower()
+    return 'jsonl' if suffix in ('.jsonl', '.ndjson') else 'csv'
+
+
+def batched(iterable, size):
+    """
+    Разбивает поток на списки длиной не более size элементов.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def split_images(value):
+    """
+    Приводит поле изображений к списку путей: в JSONL это список,
+    в CSV - строка с разделителем IMAGE_SEPARATOR.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(IMAGE_SEPARATOR)
+    return [image.strip() for image in value if image and image.strip()]
+
+
+def parse_price(value):
+    """
+    Цена товара из поля файла (пусто - 0) или None, если это не неотрицательное
+    число, помещающееся в поле product_price ("12,5", "abc", "NaN").
+    """
+    try:
+        price = Decimal(str(value or 0)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    if not price.is_finite() or price < 0 or price >= 10 ** 8:
+        return None
+    return price
+
+
+def parse_quantity(value):
+    """
+    Количество на складе из поля файла (пусто - 0) или None, если это не целое
+    неотрицательное число ("2.5", "много", "-1").
+    """
+    try:
+        quantity = int(str(value or 0).strip())
+    except ValueError:
+        return None
+    if quantity < 0 or quantity >= 2 ** 31:
+        return None
+    return quantity
+
+
+def parse_size(value):
+    """
+    Размер товара из поля файла или None, если это не конечное неотрицательное число.
+    Пустое поле не разбирается: размер товара в этом случае не меняется.
+    """
+    try:
+        size = float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+    if not math.isfinite(size) or size < 0:
+        return None
+    return size
+
+
+class Checkpoint:
+    """
+    Контрольная точка импорта: хранит количество уже обработанных строк файла
+    и ещё не проставленных родителей категорий, чтобы прерванный импорт можно
+    было продолжить с того же места.
+    """
+
+    def __init__(self, path, source):
+        self.path = Path(path) if path else None
+        self.source = str(source)
+
+    def load(self):
+        """
+        Возвращает количество обработанных строк и словарь slug категории -> slug
+        ещё не встреченного родителя ((0, {}), если контрольной точки нет
+        или она относится к другому файлу).
+        """
+        if not self.path or not self.path.exists():
+            return 0, {}
+        data = json.loads(self.path.read_text(encoding='utf-8'))
+        if data.get('source') != self.source:
+            return 0, {}
+        return data['rows'], data.get('pending_parents', {})
+
+    def save(self, rows, pending_parents=None):
+        """
+        Атомарно записывает количество обработанных строк и ожидающих родителей категорий.
+        """
+        if not self.path:
+            return
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp_path.write_text(
+            json.dumps({'source': self.source, 'rows': rows, 'pending_parents': pending_parents or {}}),
+            encoding='utf-8',
+        )
+        tmp_path.replace(self.path)
+
+    def clear(self):
+        """ Удаляет контрольную точку после успешного завершения импорта """
+        if self.path and self.path.exists():
+            self.path.unlink()
+
+
+class CatalogImporter:
+    """
+    Пакетный импорт категорий и товаров из потока строк.
+    Каждая пачка записывается через bulk_create/bulk_update в отдельной транзакции.
+    """
+
+    def __init__(self, batch_size=1000, report=None):
+        self.batch_size = batch_size
+        self.report = report or (lambda message: None)
+        # slug -> pk всех категорий; категорий на порядки меньше, чем товаров
+        self.categories = dict(
+            Category.objects.values_list('slug', 'pk')
+        )
+        # slug категории -> slug родителя, который ещё не встречался в файле
+        self.pending_parents = {}
+
+    def run(self, rows, model='product', skip=0, checkpoint=None, pending_parents=None):
+        """
+        Импортирует строки потока, пропуская первые skip уже обработанных строк.
+        pending_parents - родители категорий, не найденные до прерывания импорта
+        (из контрольной точки). Возвращает общее количество обработанных строк.
+        """
+        self.pending_parents.update(pending_parents or {})
+        if model == 'product':
+            import_batch, sender = self.import_products, Product
+        else:
+            import_batch, sender = self.import_categories, Category
+        processed = skip
+        started = time.monotonic()
+
+        for batch in batched(islice(rows, skip, None), self.batch_size):
+            with transaction.atomic():
+                import_batch(batch)
+            catalog_changed.send(sender=sender, pks=None)
+            processed += len(batch)
+            if checkpoint:
+                checkpoint.save(processed, self.pending_parents)
+
+            elapsed = time.monotonic() - started
+            rate = (processed - skip) / elapsed if elapsed else 0
+            self.report(f'Обработано строк: {processed} ({rate:.0f} строк/с)')
+
+        if model == 'category':
+            self.resolve_pending_parents()
+
+        return processed
+
+    def import_categories(self, batch):
+        """
+        Создаёт или обновляет пачку категорий по slug.
+        Родитель, который ещё не встречался в файле, проставляется в конце импорта.
+        """
+        rows = {}
+        for row in batch:
+            slug = row.get('slug') or make_slug(row['name'])
+            rows[slug] = row
+
+        existing = Category.objects.in_bulk(list(rows), field_name='slug')
+        to_create, to_update = [], []
+        for slug, row in rows.items():
+            category = existing.get(slug) or Category(slug=slug)
+            category.category_name = row['name']
+            if row.get('image'):
+                category.category_image = row['image']
+
+            parent_slug = row.get('parent') or None
+            category.parent_id = self.categories.get(parent_slug)
+            if parent_slug and category.parent_id is None:
+                self.pending_parents[slug] = parent_slug
+
+            (to_update if category.pk else to_create).append(category)
+
+        Category.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Category.objects.bulk_update(
+            to_update,
+            fields=('category_name', 'category_image', 'parent'),
+            batch_size=self.batch_size,
+        )
+        # На SQLite и PostgreSQL bulk_create проставляет pk созданным объектам
+        for category in to_create + to_update:
+            self.categories[category.slug] = category.pk
+
+    def resolve_pending_parents(self):
+        """
+        Проставляет родителей категориям, которые встретились в файле раньше родителя.
+        """
+        categories = []
+        for slug, parent_slug in self.pending_parents.items():
+            if parent_slug not in self.categories:
+                self.report(f'Категория {slug}: родитель {parent_slug} не найден')
+                continue
+            categories.append(Category(
+                pk=self.categories[slug],
+                parent_id=self.categories[parent_slug],
+            ))
+        Category.objects.bulk_update(categories, fields=('parent', ), batch_size=self.batch_size)
+        self.pending_parents = {}
+
+    def unique_slugs(self, names):
+        """
+        Генерирует уникальные slug для товаров без явного slug.
+        Занятые slug (включая с числовым суффиксом) читаются запросом
+        на каждые SLUG_LOOKUP_CHUNK_SIZE кандидатов.
+        """
+        candidates = [make_slug(name)[:44] for name in names]
+        taken = set()
+        for chunk in batched(set(candidates), SLUG_LOOKUP_CHUNK_SIZE):
+            query = Q()
+            for candidate in chunk:
+                query |= Q(slug=candidate) | Q(slug__startswith=f'{candidate}-')
+            taken.update(Product.objects.filter(query).values_list('slug', flat=True))
+        slugs = []
+        for candidate in candidates:
+            slug, suffix = candidate, 1
+            while slug in taken:
+                suffix += 1
+                slug = f'{candidate}-{suffix}'
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+    def import_products(self, batch):
+        """
+        Создаёт или обновляет пачку товаров по slug и прикрепляет изображения галереи.
+        Строки без slug всегда создают новый товар со сгенерированным slug.
+        """
+        without_slug = [row for row in batch if not row.get('slug')]
+        for row, slug in zip(without_slug, self.unique_slugs(row['name'] for row in without_slug)):
+            row['slug'] = slug
+
+        rows = {row['slug']: row for row in batch}
+        existing = Product.objects.in_bulk(list(rows), field_name='slug')
+        # bulk_update не обновляет поле auto_now
+        now = timezone.now()
+        to_create, to_update = [], []
+        for slug, row in rows.items():
+            category_id = self.categories.get(row.get('category'))
+            if category_id is None:
+                self.report(f'Товар {slug}: категория {row.get("category")} не найдена, пропущен')
+                continue
+            price = parse_price(row.get('price'))
+            if price is None:
+                self.report(f'Товар {slug}: некорректная цена {row.get("price")!r}, пропущен')
+                continue
+            quantity = parse_quantity(row.get('quantity'))
+            if quantity is None:
+                self.report(f'Товар {slug}: некорректное количество {row.get("quantity")!r}, пропущен')
+                continue
+            size = None
+            if row.get('size') not in (None, ''):
+                size = parse_size(row['size'])
+                if size is None:
+                    self.report(f'Товар {slug}: некорректный размер {row.get("size")!r}, пропущен')
+                    continue
+
+            product = existing.get(slug) or Product(slug=slug)
+            product.product_name = row['name']
+            product.product_category_id = category_id
+            product.product_price = price
+            product.product_quantity = quantity
+            if size is not None:
+                product.product_size = size
+            for field, key in (
+                ('product_color', 'color'),
+                ('product_description', 'description'),
+                ('product_info', 'info'),
+            ):
+                if row.get(key):
+                    setattr(product, field, row[key])
+            product.product_updated_at = now
+
+            (to_update if product.pk else to_create).append(product)
+
+        Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Product.objects.bulk_update(
+            to_update,
+            fields=(
+                'product_name',
+                'product_category',
+                'product_price',
+                'product_quantity',
+                'product_size',
+                'product_color',
+                'product_description',
+                'product_info',
+                'product_updated_at',
+            ),
+            batch_size=self.batch_size,
+        )
+        self.attach_images(to_create + to_update, rows)
+
+    def attach_images(self, products, rows):
+        """
+        Прикрепляет изображения к товарам пачки, пропуская уже прикреплённые.
+        """
+        product_ids = [product.pk for product in products]
+        attached = set(
+            Gallery.objects
+            .filter(product_id__in=product_ids)
+            .values_list('product_id', 'image')
+        )
+        images = [
+            Gallery(product_id=product.pk, image=image)
+            for product in products
+            for image in split_images(rows[product.slug].get('images'))
+            if (product.pk, image) not in attached
+        ]
+        Gallery.objects.bulk_create(images, batch_size=self.batch_size)
+
+
+def export_categories(chunk_size=2000):
+    """
+    Генератор строк для экспорта категорий.
+    """
+    rows = (
+        Category.objects
+        .order_by('pk')
+        .values_list('slug', 'category_name', 'parent__slug', 'category_image')
+        .iterator(chunk_size=chunk_size)
+    )
+    for slug, name, parent, image in rows:
+        yield {
+            'slug': slug,
+            'name': name,
+            'parent': parent or '',
+            'image': image or '',
+        }
+
+
+def export_products(chunk_size=2000):
+    """
+    Генератор строк для экспорта товаров.
+    Товары читаются курсором пачками, изображения подгружаются одним запросом на пачку.
+    """
+    rows = (
+        Product.objects
+        .order_by('pk')
+        .values_list(
+            'pk',
+            'slug',
+            'product_name',
+            'product_category__slug',
+            'product_price',
+            'product_quantity',
+            'product_size',
+            'product_color',
+            'product_description',
+            'product_info',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for chunk in batched(rows, chunk_size):
+        images = {}
+        for product_id, image in (
+            Gallery.objects
+            .filter(product_id__in=[row[0] for row in chunk])
+            .order_by('pk')
+            .values_list('product_id', 'image')
+        ):
+            images.setdefault(product_id, []).append(image)
+
+        for pk, slug, name, category, price, quantity, size, color, description, info in chunk:
+            yield {
+                'slug': slug,
+                'name': name,
+                'category': category,
+                'price': str(price),
+                'quantity': quantity,
+                'size': size,
+                'color': color,
+                'description': description,
+                'info': info,
+                'images': images.get(pk, []),
+            }
+
+
+def write_rows(file, rows, file_format, columns):
+    """
+    Построчно записывает поток словарей в CSV или JSONL.
+    Возвращает количество записанных строк.
+    """
+    count = 0
+    if file_format == 'jsonl':
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False))
+            file.write('\n')
+            count += 1
+        return count
+
+    writer = csv.DictWriter(file, fieldnames=columns)
+    writer.writeheader()
+    for row in rows:
+        if isinstance(row.get('images'), list):
+            row['images'] = IMAGE_SEPARATOR.join(row['images'])
+        writer.writerow(row)
+        count += 1
+    return count
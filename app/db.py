@@ -0,0 +1,12 @@
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Обработчик сигнала connection_created: применяет к новому соединению SQLite
+    PRAGMA-настройки из ключа PRAGMAS описания базы в settings.DATABASES.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = connection.settings_dict.get('PRAGMAS') or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,218 @@
+import csv
+import gzip
+import io
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+
+from .catalog_io import batched
+from .middleware import StreamCompressor
+from .models import DEFAULT_IMAGE, Category, Gallery, Product
+from .sitemaps import XML_HEADER, route_template
+
+
+# Товарный фид для маркетплейсов в форматах YML (Яндекс Маркет) и CSV.
+# Товары читаются курсором пачками по chunk_size строк (values_list + iterator),
+# первое изображение загружается одним запросом на пачку, путь категории берётся
+# из словаря Category.parent, загруженного один раз. В памяти находится одна пачка,
+# поэтому расход памяти не зависит от размера каталога.
+
+# Формат -> тип содержимого
+FORMATS = {
+    'yml': 'application/xml',
+    'csv': 'text/csv',
+}
+
+CSV_COLUMNS = ('id', 'name', 'price', 'stock', 'category', 'image', 'url')
+CATEGORY_SEPARATOR = ' > '
+
+
+def load_categories():
+    """ Словарь всех категорий: pk -> (наименование, pk родителя или None) """
+    return {
+        pk: (name, parent_id)
+        for pk, name, parent_id in Category.objects.values_list('pk', 'category_name', 'parent_id')
+    }
+
+
+def category_paths(categories):
+    """
+    Пути категорий от корня ("Каталог > Обувь > Кеды") по словарю load_categories().
+    Путь каждого родителя вычисляется один раз.
+    """
+    paths = {}
+    for pk in categories:
+        chain, current = [], pk
+        # Поднимаемся до корня или до категории с уже известным путём
+        while current is not None and current not in paths and current not in chain:
+            chain.append(current)
+            current = categories[current][1]
+        prefix = paths.get(current)
+        for node in reversed(chain):
+            name = categories[node][0]
+            prefix = paths[node] = f'{prefix}{CATEGORY_SEPARATOR}{name}' if prefix else name
+    return paths
+
+
+def iter_offers(base_url, chunk_size=2000):
+    """
+    Генератор предложений фида: кортежи
+    (pk, наименование, цена, остаток, pk категории, адрес изображения, адрес страницы).
+    Товары без slug (без страницы на сайте) пропускаются.
+    """
+    prefix, suffix = route_template('product')
+    product_url = base_url + prefix
+    image_url = media_url(base_url)
+    rows = (
+        Product.objects
+        .exclude(slug__isnull=True)
+        .exclude(slug='')
+        .order_by('pk')
+        .values_list('pk', 'product_name', 'product_price', 'product_quantity', 'product_category_id', 'slug')
+        .iterator(chunk_size=chunk_size)
+    )
+    for chunk in batched(rows, chunk_size):
+        images = {}
+        for product_id, image in (
+            Gallery.objects
+            .filter(product_id__in=[row[0] for row in chunk])
+            .order_by('-pk')
+            .values_list('product_id', 'image')
+        ):
+            # Выборка по убыванию pk: последним записывается первое изображение
+            images[product_id] = image
+
+        for pk, name, price, quantity, category_id, slug in chunk:
+            image = images.get(pk)
+            yield (
+                pk,
+                name,
+                price,
+                quantity,
+                category_id,
+                image_url(image) if image else DEFAULT_IMAGE,
+                product_url + slug + suffix,
+            )
+
+
+def absolute_url(url, base_url):
+    """ Дополняет адресом сайта относительные адреса хранилища файлов """
+    return url if '://' in url else base_url + url
+
+
+def media_url(base_url):
+    """
+    Функция: путь файла в хранилище -> абсолютный адрес. Для файловой системы
+    адрес собирается из префикса (urljoin в Storage.url на каждую строку - треть времени фида).
+    """
+    if isinstance(default_storage, FileSystemStorage):
+        prefix = absolute_url(default_storage.base_url, base_url)
+        return lambda name: prefix + filepath_to_uri(name)
+    return lambda name: absolute_url(default_storage.url(name), base_url)
+
+
+def render_yml(offers, categories, base_url, batch_size=1000):
+    """
+    Генератор фида YML по частям (по batch_size предложений).
+    """
+    yield (
+        f'{XML_HEADER}<yml_catalog date="{timezone.localtime().isoformat(timespec="minutes")}">\n'
+        f'<shop><name>{escape(settings.FEED_SHOP_NAME)}</name>'
+        f'<company>{escape(settings.FEED_COMPANY)}</company>'
+        f'<url>{escape(base_url)}/</url>\n'
+        f'<currencies><currency id="{settings.FEED_CURRENCY}" rate="1"/></currencies>\n'
+        '<categories>\n'
+    )
+    yield ''.join(format_category(pk, name, parent_id) for pk, (name, parent_id) in categories.items())
+    yield '</categories>\n<offers>\n'
+    currency = settings.FEED_CURRENCY
+    for batch in batched(offers, batch_size):
+        yield ''.join(
+            f'<offer id="{pk}" available="{"true" if quantity > 0 else "false"}">'
+            f'<url>{escape(url)}</url><price>{price}</price><currencyId>{currency}</currencyId>'
+            f'<categoryId>{category_id}</categoryId><picture>{escape(image)}</picture>'
+            f'<name>{escape(name)}</name><count>{quantity}</count></offer>\n'
+            for pk, name, price, quantity, category_id, image, url in batch
+        )
+    yield '</offers>\n</shop>\n</yml_catalog>\n'
+
+
+def format_category(pk, name, parent_id):
+    parent = f' parentId="{parent_id}"' if parent_id else ''
+    return f'<category id="{pk}"{parent}>{escape(name)}</category>\n'
+
+
+def render_csv(offers, categories, batch_size=1000):
+    """
+    Генератор фида CSV по частям (по batch_size строк); первая часть - заголовок.
+    """
+    paths = category_paths(categories)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+    for batch in batched(offers, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (pk, name, price, quantity, paths.get(category_id, ''), image, url)
+            for pk, name, price, quantity, category_id, image, url in batch
+        )
+        yield buffer.getvalue()
+
+
+def render_feed(file_format, base_url, chunk_size=2000, stats=None):
+    """
+    Генератор фида в формате file_format ('yml' или 'csv') по частям.
+    Если передан словарь stats, в stats['count'] считается количество предложений.
+    """
+    categories = load_categories()
+    offers = iter_offers(base_url, chunk_size)
+    if stats is not None:
+        offers = count_offers(offers, stats)
+    if file_format == 'yml':
+        return render_yml(offers, categories, base_url)
+    return render_csv(offers, categories)
+
+
+def count_offers(offers, stats):
+    """ Пропускает через себя предложения, считая их количество """
+    stats['count'] = 0
+    for offer in offers:
+        stats['count'] += 1
+        yield offer
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Сжимает части фида в gzip по мере формирования (для файла .gz в ответе).
+    """
+    compressor = StreamCompressor('gzip', level)
+    for chunk in chunks:
+        if data := compressor.compress(chunk.encode()):
+            yield data
+    yield compressor.finish()
+
+
+def write_feed(path, file_format, base_url, chunk_size=2000, level=6):
+    """
+    Записывает фид в файл path (со сжатием gzip, если имя оканчивается на .gz)
+    через временный файл, который затем атомарно заменяет прежний.
+    Возвращает количество предложений.
+    """
+    stats = {}
+    chunks = render_feed(file_format, base_url, chunk_size, stats)
+    temporary = f'{path}.tmp'
+    if str(path).endswith('.gz'):
+        file = gzip.open(temporary, 'wt', compresslevel=level, encoding='utf-8', newline='')
+    else:
+        file = open(temporary, 'w', encoding='utf-8', newline='')
+    with file:
+        for chunk in chunks:
+            file.write(chunk)
+    os.replace(temporary, path)
+    return stats['count']
@@ -2,7 +2,7 @@ from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 
 
-from .models import User, Customer, ShippingAddress
+from .models import User, Customer, ShippingAddress, Product
 
 
 class LoginForm(AuthenticationForm):
@@ -144,3 +144,54 @@ class ShippingForm(forms.ModelForm):
                 }
             ),
         }
+
+
+class ProductBulkEditForm(forms.Form):
+    """
+    Форма массового изменения выбранных товаров в админ-панели.
+    Пустые поля не изменяются.
+    """
+    price_percent = forms.DecimalField(
+        required=False,
+        max_digits=6,
+        decimal_places=2,
+        min_value=-99,
+        max_value=1000,
+        label='Изменить цену, %',
+        help_text='Например, 10 - поднять цену на 10%, -15 - снизить на 15%',
+    )
+    restock = forms.IntegerField(
+        required=False,
+        min_value=-1_000_000,
+        max_value=1_000_000,
+        label='Пополнить склад, шт.',
+        help_text='Отрицательное значение списывает товар (остаток не станет меньше нуля)',
+    )
+    product_color = forms.CharField(
+        required=False,
+        max_length=Product._meta.get_field('product_color').max_length,
+        label='Цвет',
+    )
+    product_size = forms.FloatField(
+        required=False,
+        label='Размер',
+    )
+
+    def get_changes(self):
+        """
+        Возвращает заполненные поля формы.
+        """
+        return {
+            field: value
+            for field, value in self.cleaned_data.items()
+            if value not in (None, '')
+        }
+
+    def clean(self):
+        """
+        Проверяет, что заполнено хотя бы одно поле.
+        """
+        cleaned_data = super().clean()
+        if not self.get_changes():
+            raise forms.ValidationError('Укажите хотя бы одно изменение')
+        return cleaned_data
@@ -0,0 +1,314 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+
+from .catalog_io import batched
+from .models import OrderProduct, Product, ProductPopularity
+
+
+# Популярность товара - сумма весов событий (просмотр, добавление в корзину, покупка),
+# каждое из которых затухает вдвое за LEADERBOARD_HALF_LIFE_DAYS.
+# Вместо уменьшения всех оценок со временем вес нового события увеличивается
+# в 2 ** ((t - начало эпохи) / период полураспада) раз: порядок товаров тот же,
+# а обновление - это одно атомарное прибавление к строке товара.
+# Чтобы множитель не переполнял float, время делится на эпохи по ERA_HALF_LIVES
+# периодов полураспада. Первая запись в новой эпохе переводит оценки прежних эпох
+# в её масштаб (renormalise), поэтому все строки рейтинга сравнимы между собой.
+
+EPOCH = 1735689600  # 2025-01-01 00:00 UTC
+# Периодов полураспада в эпохе: множитель события не превышает 2 ** ERA_HALF_LIVES
+ERA_HALF_LIVES = 64
+
+# Последняя эпоха, в масштаб которой процесс уже перевёл рейтинг
+renormalised_era = None
+
+
+def half_life():
+    """
+    Период полураспада популярности в секундах.
+    """
+    seconds = settings.LEADERBOARD_HALF_LIFE_DAYS * 24 * 60 * 60
+    # Условие отрицательное, чтобы отсечь и NaN
+    if not seconds > 0:
+        raise ImproperlyConfigured('LEADERBOARD_HALF_LIFE_DAYS должен быть положительным числом')
+    return seconds
+
+
+def current_era(now=None):
+    """
+    Возвращает номер эпохи момента now (по умолчанию - сейчас).
+    """
+    if now is None:
+        now = time.time()
+    return max(int((now - EPOCH) // (half_life() * ERA_HALF_LIVES)), 0)
+
+
+def decay_factor(now=None):
+    """
+    Возвращает вес события, произошедшего в момент now (по умолчанию - сейчас),
+    в масштабе эпохи этого момента.
+    """
+    if now is None:
+        now = time.time()
+    seconds = half_life()
+    era_start = EPOCH + current_era(now) * seconds * ERA_HALF_LIVES
+    return 2 ** ((now - era_start) / seconds)
+
+
+def event_score(event, amount=1, now=None):
+    """
+    Возвращает прибавку к популярности товара за событие.
+    """
+    return settings.LEADERBOARD_WEIGHTS[event] * amount * decay_factor(now)
+
+
+def era_scale(era, target):
+    """ Множитель перевода оценки из эпохи era в эпоху target (0.0 при исчезающе малом) """
+    return 2.0 ** (-ERA_HALF_LIVES * (target - era))
+
+
+def renormalise(era):
+    """
+    Переводит оценки прежних эпох в масштаб эпохи era. Выполняется один раз
+    на эпоху в процессе; каждый UPDATE меняет только строки своей прежней эпохи,
+    поэтому повтор в другом процессе ничего не изменит.
+    """
+    global renormalised_era
+    if renormalised_era == era:
+        return
+    old_eras = set(ProductPopularity.objects.filter(era__lt=era).values_list('era', flat=True))
+    for old_era in old_eras:
+        ProductPopularity.objects.filter(era=old_era).update(
+            score=F('score') * era_scale(old_era, era),
+            era=era,
+        )
+    renormalised_era = era
+
+
+async def arenormalise(era):
+    """
+    Асинхронный вариант renormalise.
+    """
+    global renormalised_era
+    if renormalised_era == era:
+        return
+    old_eras = {
+        old_era async for old_era in
+        ProductPopularity.objects.filter(era__lt=era).values_list('era', flat=True)
+    }
+    for old_era in old_eras:
+        await ProductPopularity.objects.filter(era=old_era).aupdate(
+            score=F('score') * era_scale(old_era, era),
+            era=era,
+        )
+    renormalised_era = era
+
+
+def categories_of(product_id):
+    """
+    Возвращает (id категории, id родительской категории) товара.
+    """
+    return (
+        Product.objects
+        .filter(pk=product_id)
+        .values_list('product_category_id', 'product_category__parent_id')
+        .first()
+    ) or (None, None)
+
+
+def record(product_id, event, amount=1):
+    """
+    Учитывает событие с товаром в рейтинге.
+    Строка рейтинга создаётся при первом событии с товаром.
+    """
+    now = time.time()
+    era, score = current_era(now), event_score(event, amount, now)
+    renormalise(era)
+    if ProductPopularity.objects.filter(product_id=product_id).update(score=F('score') + score):
+        return
+
+    category_id, root_category_id = categories_of(product_id)
+    try:
+        with transaction.atomic():
+            ProductPopularity.objects.create(
+                product_id=product_id,
+                category_id=category_id,
+                root_category_id=root_category_id,
+                score=score,
+                era=era,
+            )
+    except IntegrityError:
+        # Строку уже создал параллельный запрос (или товар удалён)
+        ProductPopularity.objects.filter(product_id=product_id).update(score=F('score') + score)
+
+
+def record_many(amounts, event):
+    """
+    Учитывает событие сразу для нескольких товаров {id товара: количество}
+    постоянным числом запросов, независимо от количества товаров.
+    """
+    amounts = {product_id: amount for product_id, amount in amounts.items() if amount}
+    if not amounts:
+        return
+
+    now = time.time()
+    era = current_era(now)
+    renormalise(era)
+    scores = {product_id: event_score(event, amount, now) for product_id, amount in amounts.items()}
+    ProductPopularity.objects.filter(product_id__in=list(scores)).update(
+        score=F('score') + Case(
+            *(When(product_id=product_id, then=Value(score)) for product_id, score in scores.items()),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+    existing = set(
+        ProductPopularity.objects
+        .filter(product_id__in=list(scores))
+        .values_list('product_id', flat=True)
+    )
+    missing = (
+        Product.objects
+        .filter(pk__in=[product_id for product_id in scores if product_id not in existing])
+        .values_list('pk', 'product_category_id', 'product_category__parent_id')
+    )
+    # Строки, созданные параллельно, пропускаются: событие в них не попадёт,
+    # что для рейтинга популярности допустимо
+    ProductPopularity.objects.bulk_create(
+        [
+            ProductPopularity(
+                product_id=product_id,
+                category_id=category_id,
+                root_category_id=root_category_id,
+                score=scores[product_id],
+                era=era,
+            )
+            for product_id, category_id, root_category_id in missing
+        ],
+        ignore_conflicts=True,
+    )
+
+
+async def arecord(product_id, event, amount=1):
+    """
+    Асинхронный вариант record.
+    """
+    now = time.time()
+    era, score = current_era(now), event_score(event, amount, now)
+    await arenormalise(era)
+    if await ProductPopularity.objects.filter(product_id=product_id).aupdate(score=F('score') + score):
+        return
+
+    category_id, root_category_id = await (
+        Product.objects
+        .filter(pk=product_id)
+        .values_list('product_category_id', 'product_category__parent_id')
+        .afirst()
+    ) or (None, None)
+    try:
+        await ProductPopularity.objects.acreate(
+            product_id=product_id,
+            category_id=category_id,
+            root_category_id=root_category_id,
+            score=score,
+            era=era,
+        )
+    except IntegrityError:
+        await ProductPopularity.objects.filter(product_id=product_id).aupdate(score=F('score') + score)
+
+
+def top_queryset(limit=3, category=None, root_category=None):
+    """
+    Самые популярные товары: всего магазина, категории или родительской категории.
+    Читаются первые limit записей индекса по популярности.
+    """
+    products = Product.objects.filter(popularity__isnull=False)
+    if category is not None:
+        products = products.filter(popularity__category=category)
+    if root_category is not None:
+        products = products.filter(popularity__root_category=root_category)
+    return products.order_by('-popularity__score').prefetch_related('images')[:limit]
+
+
+def top_products(limit=3, category=None, root_category=None):
+    """
+    Возвращает список самых популярных товаров (см. top_queryset).
+    """
+    return list(top_queryset(limit, category, root_category))
+
+
+@transaction.atomic
+def rebuild(batch_size=5000):
+    """
+    Пересчитывает рейтинг с нуля по накопленным счётчикам просмотров и покупкам,
+    считая их произошедшими сейчас. Возвращает количество товаров в рейтинге.
+    """
+    now = time.time()
+    era, factor = current_era(now), decay_factor(now)
+    weights = settings.LEADERBOARD_WEIGHTS
+    purchased = (
+        OrderProduct.objects
+        .filter(product=OuterRef('pk'), order__is_completed=True)
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    products = (
+        Product.objects
+        .annotate(purchased=Subquery(purchased))
+        .filter(Q(product_watched__gt=0) | Q(purchased__gt=0))
+        .values_list(
+            'pk',
+            'product_category_id',
+            'product_category__parent_id',
+            'product_watched',
+            'purchased',
+        )
+    )
+
+    ProductPopularity.objects.all().delete()
+    popularity = (
+        ProductPopularity(
+            product_id=pk,
+            category_id=category_id,
+            root_category_id=root_category_id,
+            score=(watched * weights['view'] + (purchased_count or 0) * weights['purchase']) * factor,
+            era=era,
+        )
+        for pk, category_id, root_category_id, watched, purchased_count
+        in products.iterator(chunk_size=batch_size)
+    )
+    total = 0
+    for batch in batched(popularity, batch_size):
+        ProductPopularity.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def prune(half_lives=30):
+    """
+    Удаляет товары, популярность которых затухла более чем в 2 ** half_lives раз
+    по сравнению с одним просмотром сейчас. Возвращает количество удалённых записей.
+    """
+    renormalise(current_era())
+    threshold = event_score('view') * 2 ** -half_lives
+    deleted, _ = ProductPopularity.objects.filter(score__lt=threshold).delete()
+    return deleted
+
+
+def sync_categories(pks=None):
+    """
+    Обновляет продублированные в рейтинге категории товаров pks (None - всех)
+    после изменения каталога (задача app.tasks.sync_leaderboard_categories).
+    """
+    popularity = ProductPopularity.objects.all()
+    if pks is not None:
+        popularity = popularity.filter(product_id__in=pks)
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    popularity.update(
+        category_id=Subquery(product.values('product_category_id')[:1]),
+        root_category_id=Subquery(product.values('product_category__parent_id')[:1]),
+    )
@@ -0,0 +1,107 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from app.admin import CategoryAdmin, ProductAdmin
+from app.benchmarks import benchmark_database, measure, reload_urlconf, seed_products
+from app.models import Category, Product
+
+
+class LegacyCategoryAdmin(admin.ModelAdmin):
+    """ Прежняя настройка списка категорий, для сравнения """
+    list_display = (
+        'category_name',
+        'parent',
+        'get_product_count',
+    )
+
+    def get_product_count(self, obj):
+        return str(len(obj.products.all())) if obj.products else '0'
+
+
+class LegacyProductAdmin(ProductAdmin):
+    """ Прежняя настройка списка товаров, для сравнения """
+    list_select_related = False
+    list_filter = (
+        'product_name',
+        'product_price',
+    )
+    show_full_result_count = True
+
+
+class Command(BaseCommand):
+    """
+    Замер времени отрисовки списков товаров и категорий в админ-панели
+    на временной базе с большим количеством товаров.
+
+    Пример:
+        python manage.py bench_admin --products 100000
+    """
+    help = 'Бенчмарк страниц списков Category и Product в админ-панели'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100000,
+            help='Количество товаров во временной базе',
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=50,
+            help='Количество категорий во временной базе',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Количество замеров каждой страницы',
+        )
+        parser.add_argument(
+            '--compare-legacy',
+            action='store_true',
+            help='Дополнительно замерить прежние настройки админ-панели',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed_products(
+                count=options['products'],
+                categories=options['categories'],
+            )
+            client = Client()
+            client.force_login(
+                User.objects.create_superuser(username='bench', password='bench')
+            )
+
+            variants = [('текущая', CategoryAdmin, ProductAdmin)]
+            if options['compare_legacy']:
+                variants.append(('прежняя', LegacyCategoryAdmin, LegacyProductAdmin))
+
+            for name, category_admin, product_admin in variants:
+                self.register(Category, category_admin)
+                self.register(Product, product_admin)
+                for url in ('/admin/app/category/', '/admin/app/product/'):
+                    result = measure(
+                        lambda: client.get(url),
+                        repeat=options['repeat'],
+                    )
+                    self.stdout.write(
+                        f'[{name}] {url}: p50={result["p50_ms"]} мс, '
+                        f'p95={result["p95_ms"]} мс, запросов={result["queries"]}'
+                    )
+
+            self.register(Category, CategoryAdmin)
+            self.register(Product, ProductAdmin)
+
+    @staticmethod
+    def register(model, model_admin):
+        """
+        Перерегистрирует модель в админ-панели с другим классом настройки.
+        Маршруты админки привязаны к экземплярам ModelAdmin, поэтому URLconf перечитывается.
+        """
+        admin.site.unregister(model)
+        admin.site.register(model, model_admin)
+        reload_urlconf()
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from app import api
+from app.benchmarks import benchmark_database, measure, seed_storefront
+
+# Запрос -> адрес
+REQUESTS = {
+    'список, поля по умолчанию': '/api/products/?category=bench-root-0&limit=100',
+    'список, все поля': '/api/products/?category=bench-root-0&limit=100&fields=' + ','.join(api.PRODUCT_FIELDS),
+    'список, id и цена': '/api/products/?category=bench-root-0&limit=100&fields=id,price&sort=-price',
+    'карточка товара': '/api/products/bench-product-0/',
+    'дерево категорий': '/api/categories/',
+}
+
+
+class Command(BaseCommand):
+    """
+    Замер JSON API каталога: задержка p50, SQL-запросы и размер ответа
+    для разных наборов полей, а также повторного запроса с If-None-Match (304).
+
+    Пример:
+        python manage.py bench_api --repeat 50
+    """
+    help = 'Бенчмарк JSON API каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Количество замеров каждого запроса',
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=5000,
+            help='Количество товаров в тестовом каталоге',
+        )
+
+    def handle(self, *args, **options):
+        encoder = 'orjson' if api.orjson_module() else 'json'
+        with benchmark_database():
+            seed_storefront(products=options['products'], users=0, carts=0, favorites=0)
+            client = Client()
+            for name, url in REQUESTS.items():
+                response = client.get(url)
+                etag = response['ETag']
+                full = measure(lambda: client.get(url), repeat=options['repeat'])
+                cached = measure(lambda: client.get(url, HTTP_IF_NONE_MATCH=etag), repeat=options['repeat'])
+                self.stdout.write(
+                    f'[{encoder}] {name}: p50 {full["p50_ms"]:.2f} мс, запросов {full["queries"]}, '
+                    f'{len(response.content) / 1024:.1f} КБ; '
+                    f'304: p50 {cached["p50_ms"]:.2f} мс, запросов {cached["queries"]}'
+                )
@@ -0,0 +1,114 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from app.benchmarks import benchmark_database, reload_urlconf, seed_products
+
+
+class Command(BaseCommand):
+    """
+    Сравнение пропускной способности представлений каталога и корзины под WSGI и ASGI.
+
+    Под WSGI запросы выполняют N потоков, под ASGI - N одновременных задач
+    в одном цикле событий; оба варианта работают в одном процессе без сети.
+
+    Пример:
+        python manage.py bench_asgi --workers 8 --requests 400
+    """
+    help = 'Бенчмарк пропускной способности WSGI и ASGI при одинаковом числе обработчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Количество потоков (WSGI) или одновременных задач (ASGI)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=400,
+            help='Количество запросов в каждом режиме',
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=2000,
+            help='Количество товаров во временной базе',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True):
+            seed_products(options['products'], categories=10)
+            user = User.objects.create_user(username='bench', password='bench')
+            urls = [
+                '/',
+                '/category/bench-root/',
+                '/category/bench-root/?page=2',
+                '/product/bench-product-5/',
+                '/search/?q=Товар 199',
+                '/cart/',
+            ]
+
+            modes = (
+                ('WSGI, синхронные представления', False, self.run_wsgi),
+                ('ASGI, синхронные представления', False, self.run_asgi),
+                ('ASGI, асинхронные представления', True, self.run_asgi),
+            )
+            for name, async_views, runner in modes:
+                with override_settings(ASYNC_VIEWS=async_views):
+                    reload_urlconf()
+                    elapsed, errors = runner(user, urls, options)
+                self.stdout.write(
+                    f'[{name}] {options["requests"] / elapsed:.0f} запросов/с, '
+                    f'ошибок: {errors}'
+                )
+            reload_urlconf()
+
+    @staticmethod
+    def run_wsgi(user, urls, options):
+        """ Выполняет запросы через WSGI-обработчик в пуле потоков """
+        client = Client()
+        client.force_login(user)
+        cookies = client.cookies
+
+        def request(url):
+            thread_client = Client(raise_request_exception=False)
+            thread_client.cookies = cookies
+            status = thread_client.get(url).status_code
+            connections.close_all()
+            return status
+
+        urls = itertools.islice(itertools.cycle(urls), options['requests'])
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            statuses = list(executor.map(request, urls))
+        elapsed = time.perf_counter() - started
+        return elapsed, sum(status >= 400 for status in statuses)
+
+    @staticmethod
+    def run_asgi(user, urls, options):
+        """ Выполняет запросы через ASGI-обработчик несколькими задачами """
+        client = AsyncClient(raise_request_exception=False)
+        client.force_login(user)
+        queue = itertools.islice(itertools.cycle(urls), options['requests'])
+        statuses = []
+
+        async def worker():
+            for url in queue:
+                response = await client.get(url)
+                statuses.append(response.status_code)
+
+        async def run():
+            await asyncio.gather(*(worker() for _ in range(options['workers'])))
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        return elapsed, sum(status >= 400 for status in statuses)
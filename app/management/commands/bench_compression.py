@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from app.assets import brotli_module
+from app.benchmarks import benchmark_database, measure, seed_storefront
+from app.middleware import compress_content
+
+# Страницы каталога: представление -> адрес
+PAGES = {
+    'SubCategories': '/category/bench-root-0/',
+    'ProductPage': '/product/bench-product-0/',
+}
+
+LEVELS = {
+    'gzip': (1, 3, 6, 9),
+    'br': (1, 4, 6, 9, 11),
+}
+
+
+class Command(BaseCommand):
+    """
+    Замер сжатия страниц каталога (SubCategories и ProductPage) на разных уровнях:
+    размер ответа, процессорное время сжатия одного ответа и задержка запроса
+    целиком через CompressionMiddleware.
+
+    Пример:
+        python manage.py bench_compression --repeat 50
+    """
+    help = 'Бенчмарк сжатия HTML-страниц каталога на разных уровнях'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=30,
+            help='Количество замеров каждого варианта',
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=500,
+            help='Количество товаров в тестовом каталоге',
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        encodings = [
+            encoding for encoding in LEVELS
+            if encoding != 'br' or brotli_module() is not None
+        ]
+        if 'br' not in encodings:
+            self.stdout.write('Пакет Brotli не установлен, замеряется только gzip')
+
+        with benchmark_database():
+            seed_storefront(categories=2, subcategories=2, products=options['products'], users=1)
+            client = Client()
+            for view, url in PAGES.items():
+                content = client.get(url).content
+                result = measure(lambda: client.get(url), repeat=repeat)
+                self.stdout.write(f'\n{view} ({url})')
+                self.write_row('без сжатия', len(content), len(content), 0, result['p50_ms'])
+
+                for encoding in encodings:
+                    for level in LEVELS[encoding]:
+                        self.measure_level(client, url, content, encoding, level, repeat)
+
+    def measure_level(self, client, url, content, encoding, level, repeat):
+        """
+        Замеряет размер и стоимость сжатия страницы с заданной кодировкой и уровнем.
+        """
+        started = time.process_time()
+        for _ in range(repeat):
+            compressed = compress_content(content, encoding, level)
+        cpu_ms = (time.process_time() - started) / repeat * 1000
+
+        levels = {'text/html': {encoding: level}}
+        with override_settings(COMPRESSION_LEVELS=levels):
+            response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            assert response['Content-Encoding'] == encoding
+            result = measure(lambda: client.get(url, HTTP_ACCEPT_ENCODING=encoding), repeat=repeat)
+        self.write_row(f'{encoding} {level}', len(content), len(compressed), cpu_ms, result['p50_ms'])
+
+    def write_row(self, name, original, size, cpu_ms, p50_ms):
+        self.stdout.write(
+            f'  {name:<12} {size:>8} байт ({size / original:>6.1%})  '
+            f'сжатие={cpu_ms:.3f} мс ЦП  запрос p50={p50_ms} мс'
+        )
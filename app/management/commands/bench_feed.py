@@ -0,0 +1,77 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from app.benchmarks import benchmark_database, seed_storefront
+from app.feeds import FORMATS, gzip_chunks, render_feed
+
+
+class Command(BaseCommand):
+    """
+    Замер формирования товарного фида: строк в секунду и размер для каждого
+    формата без сжатия и с gzip, а также пик памяти Python (tracemalloc),
+    который не должен зависеть от количества товаров.
+
+    Пример:
+        python manage.py bench_feed --products 1000000
+    """
+    help = 'Бенчмарк формирования товарного фида (YML/CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100000,
+            help='Количество товаров в тестовом каталоге',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк, читаемых из базы за один раз',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # При DEBUG=True соединение запоминает текст каждого запроса (connection.queries),
+        # что искажает замер памяти; в рабочем окружении журнала запросов нет
+        with benchmark_database(on_disk=True), override_settings(DEBUG=False):
+            started = time.monotonic()
+            seed_storefront(
+                categories=20,
+                subcategories=10,
+                products=options['products'],
+                images=2,
+                users=0,
+                carts=0,
+                favorites=0,
+                batch_size=10000,
+            )
+            self.stdout.write(f'Каталог создан за {time.monotonic() - started:.1f} с')
+
+            for file_format in FORMATS:
+                for gzip in (False, True):
+                    stats = {}
+                    started = time.monotonic()
+                    size = consume(render_feed(file_format, 'https://shop.example.com', chunk_size, stats), gzip)
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'[{file_format}{".gz" if gzip else ""}] строк: {stats["count"]}, '
+                        f'{stats["count"] / elapsed:.0f} строк/с, '
+                        f'размер: {size / 1024 / 1024:.1f} МБ'
+                    )
+
+            # Отдельный проход: трассировка выделений памяти замедляет формирование
+            tracemalloc.start()
+            consume(render_feed('yml', 'https://shop.example.com', chunk_size), gzip=True)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(f'Пик памяти при формировании фида: {peak / 1024 / 1024:.1f} МБ')
+
+
+def consume(chunks, gzip):
+    """ Формирует фид целиком, не сохраняя его; возвращает размер в байтах """
+    chunks = gzip_chunks(chunks) if gzip else (chunk.encode() for chunk in chunks)
+    return sum(len(chunk) for chunk in chunks)
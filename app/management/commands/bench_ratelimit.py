@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from app.ratelimit import TokenBucket
+
+
+class Command(BaseCommand):
+    """
+    Замер ограничения частоты запросов для маршрутов из settings.RATELIMITS:
+    время одной проверки (токен взят и отклонено) в кэше settings.RATELIMIT_CACHE_ALIAS
+    и пропускная способность при нагрузке в три раза выше лимита (модельное время).
+
+    Пример:
+        python manage.py bench_ratelimit --repeat 100000
+    """
+    help = 'Бенчмарк ограничения частоты запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=100000,
+            help='Количество проверок в замере времени',
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        cache = caches[settings.RATELIMIT_CACHE_ALIAS]
+
+        # Корзина, в которой токены не кончаются, и корзина, отклоняющая всё после первого
+        for name, bucket in (('взят', TokenBucket('bench', 1e9, 1e9)), ('отклонён', TokenBucket('bench', 1e-9, 1))):
+            cache.clear()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                bucket.consume('ip:127.0.0.1')
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'Проверка ({name}): {elapsed / repeat * 1e6:.1f} мкс')
+
+        rng = random.Random(42)
+        for route, (rate, burst) in settings.RATELIMITS.items():
+            cache.clear()
+            bucket = TokenBucket(route, rate, burst)
+            now, allowed = 1_000_000.0, 0
+            for _ in range(20000):
+                now += rng.expovariate(rate * 3)
+                allowed += not bucket.consume('ip:127.0.0.1', now=now)
+            self.stdout.write(
+                f'{route}: лимит {rate}/с (запас {burst}), '
+                f'пропущено {allowed / (now - 1_000_000):.3f}/с при нагрузке {rate * 3:g}/с'
+            )
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from app.benchmarks import benchmark_database, measure, seed_storefront
+
+# Страницы, которые просматривает вошедший пользователь
+PAGES = (
+    '/',
+    '/category/bench-root-0/',
+    '/product/bench-product-0/',
+    '/cart/',
+    '/user_favorites/',
+)
+
+
+class Command(BaseCommand):
+    """
+    Замер обращений к таблице django_session при разных профилях хранения сессий
+    (settings.SESSION_PROFILES): SQL-запросы на просмотр страницы вошедшим
+    пользователем, на неудачный вход (сообщение об ошибке) и задержка p50.
+
+    Пример:
+        python manage.py bench_sessions --repeat 20
+    """
+    help = 'Бенчмарк профилей хранения сессий'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Количество замеров каждой страницы',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed_storefront(categories=2, subcategories=2, products=200, users=2, carts=1, favorites=5)
+            baseline = None
+            for profile, profile_settings in settings.SESSION_PROFILES.items():
+                with override_settings(**profile_settings):
+                    caches['sessions'].clear()
+                    result = self.measure_profile(options['repeat'])
+                if baseline is None:
+                    baseline = result
+                self.stdout.write(
+                    f'[{profile}] запросов на страницу: {result["queries"]:.1f} '
+                    f'(к django_session: {result["session_queries"]:.1f}), '
+                    f'неудачный вход: {result["login_queries"]} '
+                    f'(к django_session: {result["login_session_queries"]}), '
+                    f'p50 страницы: {result["p50_ms"]:.2f} мс, '
+                    f'экономия: {baseline["queries"] - result["queries"]:.1f} запроса на страницу'
+                )
+
+    def measure_profile(self, repeat):
+        """
+        Входит пользователем bench-user-0, просматривает страницы и возвращает
+        среднее количество запросов на страницу, запросы неудачного входа и задержку.
+        """
+        client = Client()
+        client.login(username='bench-user-0', password='bench')
+        # Первые просмотры заполняют кэш сессии и запоминают id корзины
+        for url in PAGES:
+            client.get(url)
+
+        queries, session_queries, timings = [], [], []
+        for url in PAGES:
+            with CaptureQueriesContext(connection) as captured:
+                client.get(url)
+            queries.append(len(captured))
+            session_queries.append(count_session_queries(captured))
+            timings.append(measure(lambda: client.get(url), repeat=repeat)['p50_ms'])
+
+        guest = Client()
+        guest.get('/auth/')
+        with CaptureQueriesContext(connection) as captured:
+            guest.post('/login', {'username': 'bench-user-1', 'password': 'wrong'})
+
+        return {
+            'queries': sum(queries) / len(queries),
+            'session_queries': sum(session_queries) / len(session_queries),
+            'login_queries': len(captured),
+            'login_session_queries': count_session_queries(captured),
+            'p50_ms': sum(timings) / len(timings),
+        }
+
+
+def count_session_queries(captured):
+    """ Количество запросов к таблице сессий """
+    return sum('django_session' in query['sql'] for query in captured)
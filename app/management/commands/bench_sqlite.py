@@ -0,0 +1,156 @@
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+from django.db.models import F
+
+from app.benchmarks import percentile, seed_products
+from app.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Смешанная нагрузка чтения и записи на файловую базу SQLite
+    для сравнения профилей из settings.SQLITE_PROFILES.
+
+    Пример:
+        python manage.py bench_sqlite --threads 8 --duration 10 --write-ratio 0.2
+    """
+    help = 'Бенчмарк профилей настройки SQLite под смешанной нагрузкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            default=list(settings.SQLITE_PROFILES),
+            help='Сравниваемые профили из settings.SQLITE_PROFILES',
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=20000,
+            help='Количество товаров в базе',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Количество параллельных потоков',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Длительность нагрузки на профиль, секунд',
+        )
+        parser.add_argument(
+            '--write-ratio',
+            type=float,
+            default=0.2,
+            help='Доля операций записи (0..1)',
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in options['profiles']:
+                alias = self.create_database(profile, Path(directory))
+                seed_products(
+                    count=options['products'],
+                    categories=50,
+                    using=alias,
+                )
+                connections[alias].close()
+
+                result = self.run_load(alias, options)
+                self.stdout.write(
+                    f'[{profile}] {result["ops"] / options["duration"]:.0f} оп/с, '
+                    f'чтение p50={result["read_p50"]} p95={result["read_p95"]} мс, '
+                    f'запись p50={result["write_p50"]} p95={result["write_p95"]} мс, '
+                    f'ошибок блокировки: {result["errors"]}'
+                )
+                connections[alias].close()
+
+    @staticmethod
+    def create_database(profile, directory):
+        """
+        Регистрирует отдельную файловую базу с настройками профиля и создаёт в ней таблицы.
+        """
+        alias = f'bench_{profile}'
+        configured = connections.configure_settings({
+            'default': settings.DATABASES['default'],
+            alias: {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': directory / f'{profile}.sqlite3',
+                **settings.SQLITE_PROFILES[profile],
+            },
+        })
+        connections.settings[alias] = configured[alias]
+        call_command('migrate', database=alias, verbosity=0)
+        return alias
+
+    @staticmethod
+    def run_load(alias, options):
+        """
+        Запускает потоки, которые читают страницы категорий и увеличивают
+        счётчик просмотров товаров, пока не истечёт время нагрузки.
+        """
+        products = Product.objects.using(alias)
+        max_pk = products.order_by('-pk').values_list('pk', flat=True).first()
+        category_ids = list(products.values_list('product_category_id', flat=True).distinct())
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        stats = {'read': [], 'write': [], 'errors': 0}
+
+        def worker():
+            rnd = random.Random()
+            reads, writes, errors = [], [], 0
+            while time.monotonic() < deadline:
+                is_write = rnd.random() < options['write_ratio']
+                started = time.perf_counter()
+                try:
+                    if is_write:
+                        products.filter(pk=rnd.randint(1, max_pk)).update(
+                            product_watched=F('product_watched') + 1
+                        )
+                    else:
+                        category_products = products.filter(
+                            product_category_id=rnd.choice(category_ids)
+                        )
+                        category_products.count()
+                        list(category_products.order_by('-product_watched')[:9])
+                except OperationalError:
+                    errors += 1
+                else:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    (writes if is_write else reads).append(elapsed)
+                # Как в конце HTTP-запроса: соединение закрывается согласно CONN_MAX_AGE
+                close_old_connections()
+
+            connections[alias].close()
+            with lock:
+                stats['read'] += reads
+                stats['write'] += writes
+                stats['errors'] += errors
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        reads, writes = sorted(stats['read']), sorted(stats['write'])
+        return {
+            'ops': len(reads) + len(writes),
+            'read_p50': round(statistics.median(reads), 2) if reads else 0,
+            'read_p95': round(percentile(reads, 95), 2),
+            'write_p50': round(statistics.median(writes), 2) if writes else 0,
+            'write_p95': round(percentile(writes, 95), 2),
+            'errors': stats['errors'],
+        }
@@ -0,0 +1,122 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Модули, которые не должны загружаться при запуске веб-процесса
+HEAVY_MODULES = (
+    'stripe',
+    'numpy',
+    'scipy',
+    'dotenv',
+)
+
+# Маршруты (а с ними представления) Django загружает при первом запросе, их загрузка
+# замеряется отдельно
+STARTUP_SCRIPT = f'''
+import json, sys, time
+started = time.perf_counter()
+import config.wsgi
+imported = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({{
+    'import': imported - started,
+    'urls': time.perf_counter() - imported,
+    'modules': len(sys.modules),
+    'heavy': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+
+class Command(BaseCommand):
+    """
+    Замер холодного запуска config.wsgi.application в новом процессе:
+    время импорта (включая django.setup и прогрев шаблонов), количество
+    загруженных модулей и самые долгие импорты по данным python -X importtime.
+
+    Пример:
+        python manage.py bench_startup --repeat 10
+        python manage.py bench_startup --settings-module config.settings.dev
+    """
+    help = 'Бенчмарк времени запуска WSGI-приложения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module',
+            action='append',
+            help='Модуль настроек для замера (можно повторять, по умолчанию config.settings.prod)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Количество запусков для каждого модуля настроек',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Сколько самых долгих импортов показать',
+        )
+
+    def handle(self, *args, **options):
+        for module in options['settings_module'] or ['config.settings.prod']:
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': module,
+                'SECRET_KEY': settings.SECRET_KEY or 'bench',
+                'ALLOWED_HOSTS': os.getenv('ALLOWED_HOSTS', 'localhost'),
+                # Замеряется только импорт: общий кэш не нужен
+                'CACHE_PROCESS_LOCAL': os.getenv('CACHE_PROCESS_LOCAL', '1'),
+            }
+            runs = [
+                json.loads(self.run(('-c', STARTUP_SCRIPT), env).stdout)
+                for _ in range(options['repeat'])
+            ]
+            imports = [run['import'] * 1000 for run in runs]
+            urls = [run['urls'] * 1000 for run in runs]
+            self.stdout.write(
+                f'[{module}] импорт config.wsgi: p50={statistics.median(imports):.0f} мс, '
+                f'мин.={min(imports):.0f} мс; загрузка маршрутов: p50={statistics.median(urls):.0f} мс; '
+                f'модулей: {runs[-1]["modules"]}, '
+                f'тяжёлые модули: {", ".join(runs[-1]["heavy"]) or "нет"}'
+            )
+
+            importtime = self.run(('-X', 'importtime', '-c', 'import config.wsgi'), env)
+            for cumulative, name in self.slowest_imports(importtime.stderr, options['top']):
+                self.stdout.write(f'    {cumulative / 1000:8.1f} мс  {name}')
+
+    @staticmethod
+    def run(arguments, env):
+        """ Запускает интерпретатор в каталоге проекта """
+        process = subprocess.run(
+            (sys.executable, *arguments),
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr.strip().splitlines()[-1])
+        return process
+
+    @staticmethod
+    def slowest_imports(output, top):
+        """
+        Возвращает [(накопленное время в мкс, модуль), ...] из вывода python -X importtime
+        по убыванию времени. Время модуля включает его вложенные импорты;
+        сам config.wsgi (в нём выполняется django.setup) не выводится.
+        """
+        imports = []
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.removeprefix('import time:').split('|')
+            if name.strip() != 'config.wsgi':
+                imports.append((int(cumulative), name.strip()))
+        return sorted(imports, reverse=True)[:top]
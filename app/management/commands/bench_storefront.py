@@ -0,0 +1,314 @@
+import itertools
+import json
+import platform
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import django
+import stripe
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from app import views
+from app.benchmarks import benchmark_database, latency_stats, percentile, seed_storefront
+from app.models import Product
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """
+    Минимальная заглушка API Stripe: создание платёжной сессии Checkout.
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path != '/v1/checkout/sessions':
+            self.send_error(404)
+            return
+        session_id = f'cs_test_{uuid.uuid4().hex}'
+        body = json.dumps({
+            'id': session_id,
+            'object': 'checkout.session',
+            'url': f'http://{self.headers["Host"]}/pay/{session_id}',
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Не выводит журнал запросов заглушки """
+
+
+@contextmanager
+def stripe_stub():
+    """
+    Запускает локальную заглушку Stripe и направляет в неё запросы библиотеки stripe.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StripeStubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with mock.patch.object(stripe, 'api_base', f'http://127.0.0.1:{server.server_port}'), \
+                mock.patch.object(views.settings, 'STRIPE_SECRET_KEY', 'sk_test_bench'):
+            yield
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def git_revision():
+    """ Возвращает хэш текущего коммита или None вне репозитория git """
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """
+    Сценарные замеры витрины на детерминированно сгенерированной временной базе.
+
+    Для каждого сценария записываются перцентили задержки (p50/p95/p99),
+    пропускная способность и количество SQL-запросов за итерацию.
+    Результат сохраняется в JSON и может сравниваться с результатом другого коммита.
+
+    Пример:
+        python manage.py bench_storefront --output bench.json
+        python manage.py bench_storefront --output new.json --compare bench.json
+    """
+    help = 'Сценарный бенчмарк витрины с сохранением результатов в JSON'
+
+    scenarios = (
+        'home',
+        'category',
+        'subcategory',
+        'category_last_page',
+        'product',
+        'search',
+        'favorite_toggle',
+        'add_to_cart',
+        'cart',
+        'checkout',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10, help='Категорий верхнего уровня')
+        parser.add_argument('--subcategories', type=int, default=5, help='Подкатегорий в каждой категории')
+        parser.add_argument('--products', type=int, default=5000, help='Количество товаров')
+        parser.add_argument('--images', type=int, default=2, help='Изображений галереи у товара')
+        parser.add_argument('--users', type=int, default=50, help='Количество пользователей')
+        parser.add_argument('--carts', type=int, default=20, help='Пользователей с непустой корзиной')
+        parser.add_argument('--favorites', type=int, default=5, help='Избранных товаров у пользователя')
+        parser.add_argument('--seed', type=int, default=42, help='Начальное значение генератора данных')
+        parser.add_argument('--iterations', type=int, default=50, help='Замеров каждого сценария')
+        parser.add_argument('--warmup', type=int, default=5, help='Прогревочных итераций сценария')
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=self.scenarios,
+            help='Выполнить только указанные сценарии (можно повторять)',
+        )
+        parser.add_argument('--output', help='Путь к JSON-файлу с результатами')
+        parser.add_argument('--compare', help='JSON-файл предыдущего замера для сравнения')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {error}')
+
+        dataset = {
+            name: options[name]
+            for name in ('categories', 'subcategories', 'products', 'images',
+                         'users', 'carts', 'favorites', 'seed')
+        }
+        with benchmark_database(), stripe_stub():
+            created = seed_storefront(**dataset)
+            results = {}
+            for name in self.scenarios:
+                if options['scenario'] and name not in options['scenario']:
+                    continue
+                steps = getattr(self, f'scenario_{name}')(options)
+                results[name] = self.run_scenario(steps, options['iterations'], options['warmup'])
+                self.stdout.write(self.format_result(name, results[name], baseline))
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'dataset': dataset,
+                'created': created,
+                'iterations': options['iterations'],
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+
+    @staticmethod
+    def run_scenario(steps, iterations, warmup):
+        """
+        Выполняет итерации сценария и возвращает статистику.
+        steps - бесконечный итератор функций, каждая из которых выполняет одну итерацию
+        и возвращает список кодов ответов.
+        """
+        for _ in range(warmup):
+            next(steps)()
+
+        timings, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            step = next(steps)
+            with CaptureQueriesContext(connection) as captured:
+                step_started = time.perf_counter()
+                statuses = step()
+                timings.append((time.perf_counter() - step_started) * 1000)
+            queries.append(len(captured))
+            errors += sum(status >= 400 for status in statuses)
+        elapsed = time.perf_counter() - started
+
+        queries.sort()
+        return {
+            **latency_stats(timings),
+            'throughput_rps': round(iterations / elapsed, 1),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': queries[-1],
+            'errors': errors,
+        }
+
+    @staticmethod
+    def format_result(name, result, baseline):
+        """ Строка отчёта по сценарию; при наличии прошлого замера - с изменением p50 """
+        line = (
+            f'{name:<20} p50={result["p50_ms"]:>8} мс  p95={result["p95_ms"]:>8} мс  '
+            f'p99={result["p99_ms"]:>8} мс  {result["throughput_rps"]:>7} ит/с  '
+            f'запросов={result["queries_p50"]} (макс. {result["queries_max"]})'
+        )
+        if result['errors']:
+            line += f'  ошибок={result["errors"]}'
+        previous = (baseline or {}).get('scenarios', {}).get(name)
+        if previous and previous['p50_ms']:
+            change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100
+            line += f'  p50 {change:+.1f}%, запросов {result["queries_p50"] - previous["queries_p50"]:+d}'
+        return line
+
+    # Сценарии: каждый возвращает бесконечный итератор шагов
+
+    @staticmethod
+    def get_client(user_number=None):
+        """ Клиент гостя или вошедшего пользователя bench-user-N """
+        client = Client(raise_request_exception=False)
+        if user_number is not None:
+            client.login(username=f'bench-user-{user_number}', password='bench')
+        return client
+
+    @staticmethod
+    def get_requests(client, urls):
+        """ Шаги GET-запросов по кругу из списка адресов """
+        return (
+            lambda url=url: [client.get(url).status_code]
+            for url in itertools.cycle(urls)
+        )
+
+    def scenario_home(self, options):
+        return self.get_requests(self.get_client(), ['/'])
+
+    def scenario_category(self, options):
+        urls = [f'/category/bench-root-{number}/' for number in range(options['categories'])]
+        return self.get_requests(self.get_client(), urls)
+
+    def scenario_subcategory(self, options):
+        urls = [
+            f'/category/bench-root-{number}/?type=bench-category-{number}-{sub}'
+            for number in range(options['categories'])
+            for sub in range(options['subcategories'])
+        ]
+        return self.get_requests(self.get_client(), urls)
+
+    def scenario_category_last_page(self, options):
+        per_category = options['products'] // max(options['categories'], 1)
+        last_page = max(1, -(-per_category // views.SubCategories.paginate_by))
+        urls = [
+            f'/category/bench-root-{number}/?page={last_page}'
+            for number in range(options['categories'])
+        ]
+        return self.get_requests(self.get_client(), urls)
+
+    def scenario_product(self, options):
+        urls = [f'/product/bench-product-{number}/' for number in range(0, options['products'], 7)]
+        return self.get_requests(self.get_client(), urls)
+
+    def scenario_search(self, options):
+        urls = [f'/search/?q=Товар {number}' for number in (1234, 99, 5, 4321)]
+        return self.get_requests(self.get_client(), urls)
+
+    def scenario_favorite_toggle(self, options):
+        client = self.get_client(0)
+        # Как и браузер, передаём страницу, на которую представление вернёт пользователя
+        return (
+            lambda number=number: [client.get(
+                f'/add_favorite/bench-product-{number}/',
+                HTTP_REFERER=f'/product/bench-product-{number}/',
+            ).status_code]
+            for number in itertools.cycle(range(10))
+        )
+
+    def scenario_add_to_cart(self, options):
+        client = self.get_client(1)
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:50])
+        urls = [f'/to_cart/{product_id}/add/' for product_id in product_ids]
+        return self.get_requests(client, urls)
+
+    def scenario_cart(self, options):
+        return self.get_requests(self.get_client(2), ['/cart/'])
+
+    def scenario_checkout(self, options):
+        """
+        Оформление заказа: страница оформления, создание платёжной сессии
+        в заглушке Stripe и возврат после оплаты; корзина пополняется перед каждой итерацией.
+        """
+        client = self.get_client(3)
+        product_ids = itertools.cycle(Product.objects.order_by('pk').values_list('pk', flat=True)[:50])
+        data = {
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'email': 'bench@example.com',
+            'phone': '+79990000000',
+            'city': 'Москва',
+            'state': 'Москва',
+            'street': 'Тверская, 1',
+        }
+
+        def step():
+            return [
+                client.get(f'/to_cart/{next(product_ids)}/add/').status_code,
+                client.get('/checkout/').status_code,
+                client.post('/payment/', data).status_code,
+                client.get('/success/').status_code,
+            ]
+
+        return itertools.repeat(step)
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.management.base import BaseCommand
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from app.benchmarks import benchmark_database, measure, seed_products
+from app.models import Category, Product
+from app.warmup import iter_template_names
+
+BASE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+CARD_TEMPLATE = 'components/__product_cart.html'
+
+
+def make_engine(cached, debug):
+    """
+    Создаёт движок шаблонов с настройками проекта и указанным загрузчиком.
+    """
+    loaders = [('django.template.loaders.cached.Loader', BASE_LOADERS)] if cached else BASE_LOADERS
+    return DjangoTemplates({
+        'NAME': 'bench',
+        'DIRS': [],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'loaders': loaders,
+            'debug': debug,
+            'context_processors': settings.TEMPLATES[0]['OPTIONS']['context_processors'],
+        },
+    })
+
+
+class Command(BaseCommand):
+    """
+    Замер отрисовки страницы категории из 9 карточек товаров:
+    без кэширования шаблонов, с кэширующим загрузчиком до и после прогрева,
+    а также стоимость {% include %} карточки по сравнению с разметкой, встроенной в цикл.
+
+    Пример:
+        python manage.py bench_templates --repeat 200
+    """
+    help = 'Бенчмарк отрисовки шаблонов с кэширующим загрузчиком и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=100,
+            help='Количество замеров каждого варианта',
+        )
+        parser.add_argument(
+            '--cards',
+            type=int,
+            default=9,
+            help='Количество карточек на странице (по умолчанию как в пагинации категории)',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed_products(100)
+            category = Category.objects.get(slug='bench-root')
+            products = list(Product.objects.prefetch_related('images')[:options['cards']])
+            request = RequestFactory().get('/category/bench-root/')
+            request.user = AnonymousUser()
+            request.session = SessionStore()
+            context = {
+                'title': category.category_name,
+                'category': category,
+                'filters': list(category.subcategories.all()),
+                'products': products,
+            }
+            repeat = options['repeat']
+
+            self.stdout.write(f'Страница категории, карточек: {len(products)}')
+            variants = (
+                ('без кэша (разбор при каждом запросе)', lambda: make_engine(cached=False, debug=True)),
+                ('кэш, первый запрос процесса', lambda: make_engine(cached=True, debug=False)),
+            )
+            for name, factory in variants:
+                result = measure(
+                    lambda: factory().get_template('category.html').render(context, request),
+                    repeat=repeat,
+                )
+                self.write_result(name, result)
+
+            warmed = make_engine(cached=True, debug=False)
+            for template_name in iter_template_names():
+                warmed.get_template(template_name)
+            result = measure(
+                lambda: warmed.get_template('category.html').render(context, request),
+                repeat=repeat,
+            )
+            self.write_result('кэш после прогрева', result)
+
+            self.measure_include(warmed, context, request, repeat)
+
+    def measure_include(self, engine, context, request, repeat):
+        """
+        Сравнивает цикл карточек через {% include %} с той же разметкой, встроенной в цикл.
+        """
+        card_source = engine.engine.find_template(CARD_TEMPLATE)[0].source
+        card_source = card_source.replace('{% load app_tags %}', '')
+        included = engine.from_string(
+            f'{{% for product in products %}}{{% include "{CARD_TEMPLATE}" %}}{{% endfor %}}'
+        )
+        inlined = engine.from_string(
+            '{% load app_tags %}{% for product in products %}' + card_source + '{% endfor %}'
+        )
+        include_result = measure(lambda: included.render(context, request), repeat=repeat)
+        inline_result = measure(lambda: inlined.render(context, request), repeat=repeat)
+        self.write_result('карточки через include', include_result)
+        self.write_result('карточки встроены в цикл', inline_result)
+
+        cards = len(context['products']) or 1
+        overhead = (include_result['p50_ms'] - inline_result['p50_ms']) / cards * 1000
+        self.stdout.write(f'Накладные расходы include на карточку: {overhead:.1f} мкс')
+
+    def write_result(self, name, result):
+        self.stdout.write(
+            f'[{name}] p50={result["p50_ms"]} мс, p95={result["p95_ms"]} мс, '
+            f'запросов={result["queries"]}'
+        )
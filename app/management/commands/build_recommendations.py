@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import recommendations
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт таблицы похожих товаров по заказам и избранному.
+
+    Пример:
+        python manage.py build_recommendations --top-k 10
+    """
+    help = 'Пересчитывает похожие товары по совместным покупкам и избранному'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=10,
+            help='Количество соседей, сохраняемых для каждого товара',
+        )
+        parser.add_argument(
+            '--favorite-weight',
+            type=float,
+            default=recommendations.FAVORITE_WEIGHT,
+            help='Вес корзин из избранного относительно заказов',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество записей в одной пачке вставки',
+        )
+        parser.add_argument(
+            '--pure-python',
+            action='store_true',
+            help='Считать без NumPy и SciPy, даже если они установлены',
+        )
+
+    def handle(self, *args, **options):
+        vectorized = recommendations.sparse_modules()[1] is not None and not options['pure_python']
+        started = time.perf_counter()
+        neighbours = recommendations.compute_neighbours(
+            top_k=options['top_k'],
+            favorite_weight=options['favorite_weight'],
+            vectorized=vectorized,
+        )
+        computed = time.perf_counter()
+        total = recommendations.store_neighbours(neighbours, batch_size=options['batch_size'])
+        stored = time.perf_counter()
+
+        self.stdout.write(
+            f'Расчёт ({"SciPy" if vectorized else "Python"}): {computed - started:.2f} с, '
+            f'сохранение: {stored - computed:.2f} с'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Товаров с соседями: {len(neighbours)}, записей: {total}'
+        ))
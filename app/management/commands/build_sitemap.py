@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.sitemaps import write_sitemaps
+
+
+class Command(BaseCommand):
+    """
+    Формирование файлов карты сайта (индекс и файлы разделов) в settings.SITEMAP_ROOT.
+    Пока файлы существуют, /sitemap.xml и файлы разделов отдаются из них.
+
+    Пример:
+        python manage.py build_sitemap --base-url https://shop.example.com
+    """
+    help = 'Формирование файлов карты сайта по всему каталогу'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default=settings.SITE_URL,
+            help='Адрес сайта для ссылок (по умолчанию settings.SITE_URL)',
+        )
+        parser.add_argument(
+            '--output',
+            default=settings.SITEMAP_ROOT,
+            help='Каталог для файлов (по умолчанию settings.SITEMAP_ROOT)',
+        )
+        parser.add_argument(
+            '--max-urls',
+            type=int,
+            default=settings.SITEMAP_MAX_URLS,
+            help='Адресов в одном файле раздела',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Количество строк, читаемых из базы за один раз',
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options['max_urls'] <= 50000:
+            raise CommandError('--max-urls должен быть от 1 до 50000')
+
+        started = time.monotonic()
+        totals = write_sitemaps(
+            options['output'],
+            options['base_url'].rstrip('/'),
+            max_urls=options['max_urls'],
+            chunk_size=options['chunk_size'],
+        )
+        summary = ', '.join(f'{section}: {count}' for section, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Карта сайта записана в {options["output"]} ({summary}) '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
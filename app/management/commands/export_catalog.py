@@ -0,0 +1,65 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.catalog_io import (
+    CATEGORY_COLUMNS,
+    PRODUCT_COLUMNS,
+    detect_format,
+    export_categories,
+    export_products,
+    write_rows,
+)
+
+
+class Command(BaseCommand):
+    """
+    Потоковый экспорт категорий или товаров в CSV/JSONL файл.
+
+    Пример:
+        python manage.py export_catalog products.csv --model product
+    """
+    help = 'Экспорт каталога (категорий или товаров) в CSV/JSONL файл'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу CSV или JSONL ("-" для вывода в stdout)',
+        )
+        parser.add_argument(
+            '--model',
+            choices=('product', 'category'),
+            default='product',
+            help='Что экспортировать: товары или категории',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'jsonl'),
+            help='Формат файла (по умолчанию определяется по расширению)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк, читаемых из базы за один раз',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path == '-' else detect_format(path))
+        if options['model'] == 'product':
+            rows, columns = export_products(options['chunk_size']), PRODUCT_COLUMNS
+        else:
+            rows, columns = export_categories(options['chunk_size']), CATEGORY_COLUMNS
+
+        started = time.monotonic()
+        if path == '-':
+            count = write_rows(sys.stdout, rows, file_format, columns)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as file:
+                count = write_rows(file, rows, file_format, columns)
+
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        self.stderr.write(f'Экспортировано строк: {count} ({rate:.0f} строк/с)')
@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.feeds import FORMATS, write_feed
+
+
+class Command(BaseCommand):
+    """
+    Запись товарного фида для маркетплейсов в файл YML или CSV
+    (со сжатием gzip, если имя файла оканчивается на .gz).
+
+    Пример:
+        python manage.py export_feed feed.yml.gz --base-url https://shop.example.com
+    """
+    help = 'Экспорт товарного фида (YML/CSV) для маркетплейсов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу: feed.yml, feed.csv, feed.yml.gz, feed.csv.gz',
+        )
+        parser.add_argument(
+            '--format',
+            choices=tuple(FORMATS),
+            help='Формат фида (по умолчанию определяется по расширению)',
+        )
+        parser.add_argument(
+            '--base-url',
+            default=settings.SITE_URL,
+            help='Адрес сайта для ссылок (по умолчанию settings.SITE_URL)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк, читаемых из базы за один раз',
+        )
+        parser.add_argument(
+            '--level',
+            type=int,
+            default=6,
+            choices=range(1, 10),
+            help='Уровень сжатия gzip',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+
+        started = time.monotonic()
+        count = write_feed(
+            path,
+            file_format,
+            options['base_url'].rstrip('/'),
+            chunk_size=options['chunk_size'],
+            level=options['level'],
+        )
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Фид записан в {path}: предложений {count} за {elapsed:.1f} с ({rate:.0f} строк/с)'
+        ))
+
+
+def detect_format(path):
+    """ Формат фида по расширению файла (без учёта .gz) """
+    extension = str(path).removesuffix('.gz').rpartition('.')[2].lower()
+    if extension == 'xml':
+        return 'yml'
+    if extension not in FORMATS:
+        raise CommandError('Не удалось определить формат по расширению, укажите --format')
+    return extension
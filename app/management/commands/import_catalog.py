@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.catalog_io import CatalogImporter, Checkpoint, detect_format, iter_rows
+
+
+class Command(BaseCommand):
+    """
+    Потоковый импорт категорий или товаров из CSV/JSONL файла.
+
+    Пример:
+        python manage.py import_catalog products.jsonl --model product --checkpoint import.ckpt
+    """
+    help = 'Импорт каталога (категорий или товаров) из CSV/JSONL файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу CSV или JSONL',
+        )
+        parser.add_argument(
+            '--model',
+            choices=('product', 'category'),
+            default='product',
+            help='Что импортировать: товары или категории',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'jsonl'),
+            help='Формат файла (по умолчанию определяется по расширению)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одной транзакции',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки для продолжения прерванного импорта',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        checkpoint = Checkpoint(
+            path=options['checkpoint'],
+            source=path,
+        )
+        skip, pending_parents = checkpoint.load()
+        if skip:
+            self.stdout.write(f'Продолжение импорта со строки {skip + 1}')
+
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            report=self.stdout.write,
+        )
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                processed = importer.run(
+                    rows=iter_rows(file, file_format),
+                    model=options['model'],
+                    skip=skip,
+                    checkpoint=checkpoint,
+                    pending_parents=pending_parents,
+                )
+        except FileNotFoundError:
+            raise CommandError(f'Файл не найден: {path}')
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Ошибка в данных файла: {error!r}')
+
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS(f'Импорт завершён, строк обработано: {processed}'))
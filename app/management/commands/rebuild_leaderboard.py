@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from app import leaderboard
+
+
+class Command(BaseCommand):
+    """
+    Обслуживание рейтинга популярных товаров.
+
+    Без параметров пересчитывает рейтинг с нуля по счётчикам просмотров и покупкам
+    (например, после первого развёртывания или смены весов событий).
+    С --prune только удаляет из рейтинга давно затухшие товары.
+
+    Пример:
+        python manage.py rebuild_leaderboard
+        python manage.py rebuild_leaderboard --prune 30
+    """
+    help = 'Пересчитывает рейтинг популярных товаров или удаляет из него затухшие товары'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune',
+            type=int,
+            metavar='HALF_LIVES',
+            help='Удалить товары, популярность которых затухла больше чем на HALF_LIVES периодов',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество записей в одной пачке вставки',
+        )
+
+    def handle(self, *args, **options):
+        if options['prune'] is not None:
+            deleted = leaderboard.prune(half_lives=options['prune'])
+            self.stdout.write(self.style.SUCCESS(f'Удалено из рейтинга: {deleted}'))
+            return
+
+        total = leaderboard.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Товаров в рейтинге: {total}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from app.utils import reprice_cart_lines
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт корзин покупателей по текущим ценам товаров. Строки заказа хранят цену
+    на момент добавления товара, поэтому изменение цены попадает в корзины только
+    после пересчёта. Оформленные заказы не меняются.
+
+    Пример:
+        python manage.py reprice_carts
+        python manage.py reprice_carts --product 12 --product 15
+    """
+    help = 'Пересчитывает корзины покупателей по текущим ценам товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='products',
+            help='id товара (можно указать несколько раз; по умолчанию все товары)',
+        )
+
+    def handle(self, *args, **options):
+        updated = reprice_cart_lines(product_ids=options['products'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано строк корзин: {updated}'))
@@ -0,0 +1,108 @@
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app import taskqueue
+
+
+class Command(BaseCommand):
+    """
+    Обработчик очереди фоновых задач (app/taskqueue.py): выполняет задачи в пуле потоков,
+    с --processes - в пуле процессов (os.fork), каждый со своим пулом потоков: задачи,
+    нагружающие процессор, не упираются в GIL. Должен работать рядом с веб-сервером:
+    без него, в частности, просмотры товаров не записываются в базу.
+    Останавливается по SIGTERM/SIGINT, дождавшись выполнения начатых задач.
+
+    Пример:
+        python manage.py run_worker --threads 8 --processes 2
+        python manage.py run_worker --once
+        python manage.py run_worker --stats
+    """
+    help = 'Выполнение фоновых задач из очереди в базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Потоков выполнения задач в процессе',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help='Процессов обработчика, каждый со своим пулом потоков (для задач, нагружающих процессор)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза между проверками очереди, когда задач нет, в секундах',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и завершиться (для запуска по расписанию)',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Показать глубину очереди и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for key, value in taskqueue.stats().items():
+                self.stdout.write(f'{key}: {value}')
+            return
+
+        worker = taskqueue.Worker(threads=options['threads'], poll_interval=options['poll_interval'])
+        if options['once']:
+            total = worker.run_once()
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {total}'))
+            return
+
+        if options['processes'] > 1:
+            self.run_processes(options)
+            return
+
+        self.handle_signals(lambda signum, frame: worker.stop())
+        self.stdout.write(f'Обработчик {worker.id}: потоков {worker.threads}')
+        worker.run()
+        self.stdout.write('Обработчик остановлен')
+
+    def run_processes(self, options):
+        """
+        Запускает дочерние процессы обработчика и ждёт их завершения,
+        передавая им сигнал остановки.
+        """
+        # Дочерние процессы не должны унаследовать открытые соединения с базой
+        connections.close_all()
+        children = []
+        for _ in range(options['processes']):
+            pid = os.fork()
+            if pid == 0:
+                worker = taskqueue.Worker(threads=options['threads'], poll_interval=options['poll_interval'])
+                self.handle_signals(lambda signum, frame: worker.stop())
+                try:
+                    worker.run()
+                finally:
+                    os._exit(0)
+            children.append(pid)
+
+        def stop(signum, frame):
+            for child in children:
+                os.kill(child, signal.SIGTERM)
+
+        self.handle_signals(stop)
+        self.stdout.write(f'Запущено процессов обработчика: {len(children)}, потоков в каждом: {options["threads"]}')
+        for child in children:
+            os.waitpid(child, 0)
+        self.stdout.write('Обработчики остановлены')
+
+    @staticmethod
+    def handle_signals(handler):
+        signal.signal(signal.SIGTERM, handler)
+        signal.signal(signal.SIGINT, handler)
@@ -0,0 +1,434 @@
+import gzip
+import mimetypes
+import os
+import secrets
+import zlib
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date, parse_etags
+from django.views.static import was_modified_since
+
+from . import ratelimit
+from .assets import brotli_module
+from .routers import use_primary, use_replica
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Направляет чтение каталога (маршруты из settings.REPLICA_READ_ROUTES) в реплики.
+
+    После изменяющего запроса (маршруты из settings.PRIMARY_STICKY_ROUTES или
+    любой не-GET/HEAD запрос) пользователь на settings.PRIMARY_STICKY_SECONDS
+    закрепляется за основной базой, чтобы сразу видеть свои изменения
+    (корзина, избранное) несмотря на задержку репликации.
+    """
+    cookie_name = 'primary_pin'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Иначе Django выполнял бы синхронный process_view в отдельном потоке
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        use_primary()
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        """ Асинхронный вариант обработки запроса (ASGI) """
+        use_primary()
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        """
+        Сбрасывает выбор реплики и при необходимости закрепляет пользователя за основной базой.
+        """
+        use_primary()
+        if getattr(request, 'pin_primary', False):
+            response.set_cookie(
+                self.cookie_name,
+                '1',
+                max_age=settings.PRIMARY_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Выбирает базу для чтения по имени маршрута после его разрешения.
+        """
+        self.select_database(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        """ Асинхронный вариант process_view (ASGI) """
+        self.select_database(request)
+
+    def select_database(self, request):
+        """
+        Выбирает базу для чтения текущего запроса и отмечает изменяющие запросы.
+        """
+        url_name = request.resolver_match.url_name
+        if request.method not in ('GET', 'HEAD') or url_name in settings.PRIMARY_STICKY_ROUTES:
+            request.pin_primary = True
+            use_primary()
+        elif url_name in settings.REPLICA_READ_ROUTES and self.cookie_name not in request.COOKIES:
+            use_replica()
+        else:
+            use_primary()
+
+
+class RateLimitMiddleware:
+    """
+    Ограничивает частоту запросов к маршрутам из settings.RATELIMITS (app/ratelimit.py).
+    Сверх лимита отвечает 429 с заголовком Retry-After. Подключается после
+    AuthenticationMiddleware: вошедшие пользователи ограничиваются и по IP-адресу, и по id.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Иначе Django выполнял бы синхронный process_view в отдельном потоке
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limit = settings.RATELIMITS.get(request.resolver_match.url_name)
+        if limit is None:
+            return None
+        bucket = ratelimit.get_bucket(request.resolver_match.url_name, *limit)
+        retry_after = bucket.consume_all(ratelimit.identities(request, request.user))
+        return self.too_many_requests(retry_after) if retry_after else None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        """ Асинхронный вариант process_view (ASGI) """
+        limit = settings.RATELIMITS.get(request.resolver_match.url_name)
+        if limit is None:
+            return None
+        bucket = ratelimit.get_bucket(request.resolver_match.url_name, *limit)
+        retry_after = await bucket.aconsume_all(ratelimit.identities(request, await request.auser()))
+        return self.too_many_requests(retry_after) if retry_after else None
+
+    @staticmethod
+    def too_many_requests(retry_after):
+        response = HttpResponse(
+            'Слишком много запросов, повторите позже',
+            status=429,
+            content_type='text/plain; charset=utf-8',
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+def accepted_encodings(header):
+    """
+    Возвращает множество кодировок из заголовка Accept-Encoding, кроме отключённых через q=0.
+    """
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        quality = params.strip().lower()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+class StaticFilesMiddleware:
+    """
+    Раздаёт собранную статику из settings.STATIC_ROOT (python manage.py collectstatic).
+
+    Список файлов читается один раз при запуске процесса. Если клиент принимает
+    сжатие, отдаётся предварительно сжатый вариант (.br, затем .gz).
+    Файлы с хэшем содержимого в имени (из манифеста хранилища) кэшируются
+    браузером на год без повторной проверки, остальные - на STATIC_MAX_AGE секунд.
+    """
+    # (суффикс сжатого файла, значение Content-Encoding) в порядке предпочтения
+    encodings = (('.br', 'br'), ('.gz', 'gzip'))
+    immutable_max_age = 365 * 24 * 60 * 60
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+        static_url = urlsplit(settings.STATIC_URL)
+        if static_url.netloc or not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+            # Статика раздаётся с другого домена (CDN) или ещё не собрана
+            raise MiddlewareNotUsed
+        self.prefix = static_url.path
+        self.files = self.scan(settings.STATIC_ROOT)
+
+    def scan(self, root):
+        """
+        Возвращает {путь в URL: (тип содержимого, неизменяемый ли файл, варианты)},
+        где варианты - список (Content-Encoding или None, путь, размер, время изменения)
+        в порядке предпочтения.
+        """
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        paths = set()
+        for directory, _, names in os.walk(root):
+            for name in names:
+                paths.add(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/'))
+
+        compressed = {name + suffix for name in paths for suffix, _ in self.encodings}
+        files = {}
+        for name in paths - compressed:
+            variants = []
+            for suffix, encoding in (*self.encodings, ('', None)):
+                if name + suffix in paths:
+                    path = os.path.join(root, name + suffix)
+                    stat = os.stat(path)
+                    variants.append((encoding, path, stat.st_size, stat.st_mtime))
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type.endswith(('javascript', 'json')):
+                content_type += '; charset=utf-8'
+            files[self.prefix + name] = (content_type, name in hashed, variants)
+        return files
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        static_file = self.find(request)
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, *static_file)
+
+    async def __acall__(self, request):
+        """ Асинхронный вариант обработки запроса (ASGI) """
+        static_file = self.find(request)
+        if static_file is None:
+            return await self.get_response(request)
+        return self.serve(request, *static_file)
+
+    def find(self, request):
+        """ Возвращает описание запрошенного файла статики или None """
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        return self.files.get(request.path_info)
+
+    def serve(self, request, content_type, immutable, variants):
+        """
+        Отдаёт файл в лучшей из принимаемых клиентом кодировок.
+        """
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding, path, size, mtime = next(
+            variant for variant in variants
+            if variant[0] is None or variant[0] in accepted
+        )
+        etag = f'"{int(mtime):x}-{size:x}{"-" + encoding if encoding else ""}"'
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+        else:
+            not_modified = not was_modified_since(request.headers.get('If-Modified-Since'), mtime)
+
+        if not_modified:
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response.headers['Content-Length'] = size
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            # FileResponse подставил бы имя сжатого файла
+            response.headers.pop('Content-Disposition', None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if len(variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(mtime)
+        if immutable:
+            response.headers['Cache-Control'] = f'public, max-age={self.immutable_max_age}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}'
+        return response
+
+
+class StreamCompressor:
+    """
+    Потоковое сжатие в формате gzip или brotli с заданным уровнем.
+    При max_random_bytes в заголовок gzip записывается имя файла случайной длины
+    (как в GZipMiddleware): длина ответа перестаёт точно отражать степень сжатия,
+    что затрудняет атаку BREACH на секреты в странице.
+    """
+
+    def __init__(self, encoding, level, max_random_bytes=0):
+        self.encoding = encoding
+        self.filename = None
+        if encoding == 'br':
+            self.compressor = brotli_module().Compressor(quality=level)
+        else:
+            # 16 + MAX_WBITS - формат gzip (заголовок и контрольная сумма)
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            if max_random_bytes:
+                self.filename = b'a' * secrets.randbelow(max_random_bytes) + b'\x00'
+
+    def output(self, data):
+        """ Добавляет имя файла в заголовок gzip, который zlib выдаёт первым целиком """
+        if self.filename is None or not data:
+            return data
+        header = bytearray(data[:10])
+        header[3] |= gzip.FNAME
+        data, self.filename = bytes(header) + self.filename + data[10:], None
+        return data
+
+    def compress(self, data):
+        """ Сжимает очередной фрагмент; часть результата может остаться в буфере """
+        if self.encoding == 'br':
+            return self.compressor.process(data)
+        return self.output(self.compressor.compress(data))
+
+    def flush(self):
+        """ Возвращает всё сжатое к этому моменту, не завершая поток """
+        if self.encoding == 'br':
+            return self.compressor.flush()
+        return self.output(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self):
+        """ Завершает поток """
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.output(self.compressor.flush())
+
+
+def compress_content(content, encoding, level, max_random_bytes=0):
+    """ Сжимает строку байтов целиком """
+    compressor = StreamCompressor(encoding, level, max_random_bytes)
+    return compressor.compress(content) + compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжимает ответы в brotli (если установлен пакет Brotli) или gzip с уровнем,
+    заданным для типа содержимого в settings.COMPRESSION_LEVELS.
+
+    Не сжимаются: типы содержимого, которых нет в COMPRESSION_LEVELS (изображения,
+    архивы и другие уже сжатые данные), ответы с заголовком Content-Encoding
+    (например, статика из StaticFilesMiddleware) и ответы короче
+    settings.COMPRESSION_MIN_LENGTH байт. Потоковые ответы сжимаются по фрагментам
+    и отправляются клиенту, как только накопится settings.COMPRESSION_STREAM_FLUSH_SIZE
+    несжатых байт.
+
+    Защита от BREACH: ответ gzip дополняется случайными байтами, как в GZipMiddleware,
+    а ответы, в которые отрисован токен CSRF (они устанавливают cookie CSRF),
+    не сжимаются в brotli, где такого дополнения нет.
+    """
+    # Кодировки в порядке предпочтения
+    encodings = ('br', 'gzip')
+    max_random_bytes = 100
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        levels = settings.COMPRESSION_LEVELS.get(content_type)
+        if not levels:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_LENGTH:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if settings.CSRF_COOKIE_NAME in response.cookies:
+            levels = {**levels, 'br': None}
+        encoding = self.select_encoding(request, levels)
+        if encoding is None:
+            return response
+        level = levels[encoding]
+
+        if response.streaming:
+            compressor = StreamCompressor(encoding, level, self.max_random_bytes)
+            if response.is_async:
+                response.streaming_content = self.acompress_stream(response.streaming_content, compressor)
+            else:
+                response.streaming_content = self.compress_stream(response.streaming_content, compressor)
+            # Размер после сжатия заранее неизвестен
+            response.headers.pop('Content-Length', None)
+        else:
+            compressed = compress_content(response.content, encoding, level, self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Сжатое представление не совпадает побайтно с исходным: сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def select_encoding(self, request, levels):
+        """
+        Выбирает кодировку, которую принимает клиент и для которой задан уровень сжатия.
+        """
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for encoding in self.encodings:
+            if encoding in accepted and levels.get(encoding) is not None:
+                if encoding == 'br' and brotli_module() is None:
+                    continue
+                return encoding
+        return None
+
+    @staticmethod
+    def compress_stream(chunks, compressor):
+        """
+        Сжимает фрагменты потокового ответа. Сжатое отправляется, как только его
+        выдаёт компрессор, и принудительно - после каждых COMPRESSION_STREAM_FLUSH_SIZE
+        несжатых байт: сброс после каждого мелкого фрагмента ухудшал бы сжатие.
+        """
+        pending = 0
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= settings.COMPRESSION_STREAM_FLUSH_SIZE:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def acompress_stream(chunks, compressor):
+        """ Асинхронный вариант compress_stream """
+        pending = 0
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= settings.COMPRESSION_STREAM_FLUSH_SIZE:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
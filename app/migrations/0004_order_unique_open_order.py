@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+def complete_duplicate_open_orders(apps, schema_editor):
+    """
+    Перед добавлением ограничения оставляет у каждого покупателя один открытый заказ
+    (самый ранний, именно его находил прежний Order.objects.get_or_create),
+    остальные открытые заказы помечаются завершёнными.
+    """
+    Order = apps.get_model('app', 'Order')
+    kept = {}
+    for order_id, customer_id in (
+        Order.objects
+        .filter(is_completed=False, customer__isnull=False)
+        .order_by('customer_id', 'pk')
+        .values_list('pk', 'customer_id')
+    ):
+        if customer_id in kept:
+            Order.objects.filter(pk=order_id).update(is_completed=True)
+        else:
+            kept[customer_id] = order_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_customer_order_orderproduct_shippingaddress'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            complete_duplicate_open_orders,
+            migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_completed', False)), fields=('customer',), name='unique_open_order_per_customer'),
+        ),
+    ]
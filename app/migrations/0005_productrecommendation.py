@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_order_unique_open_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Позиция')),
+                ('score', models.FloatField(verbose_name='Близость')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='app.product', verbose_name='Товар')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_for', to='app.product', verbose_name='Похожий товар')),
+            ],
+            options={
+                'verbose_name': 'Похожий товар',
+                'verbose_name_plural': 'Похожие товары',
+                'ordering': ('product', 'rank'),
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='unique_recommendation_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_productrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='app.product', verbose_name='Товар')),
+                ('score', models.FloatField(default=0, verbose_name='Популярность')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.category', verbose_name='Категория')),
+                ('root_category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.category', verbose_name='Родительская категория')),
+            ],
+            options={
+                'verbose_name': 'Популярность товара',
+                'verbose_name_plural': 'Популярность товаров',
+                'indexes': [models.Index(fields=['-score'], name='popularity_score_idx'), models.Index(fields=['category', '-score'], name='popularity_category_idx'), models.Index(fields=['root_category', '-score'], name='popularity_root_idx')],
+            },
+        ),
+    ]
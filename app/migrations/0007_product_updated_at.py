@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-19 06:14
+
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    """
+    Дата изменения существующих товаров неизвестна: берётся дата создания
+    (иначе у всех товаров она совпала бы с моментом миграции).
+    """
+    Product = apps.get_model('app', 'Product')
+    Product.objects.update(product_updated_at=models.F('product_created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_productpopularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='product_updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(
+            copy_created_at,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-19 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, verbose_name='Задача')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Аргументы')),
+                ('dedup_key', models.CharField(blank=True, max_length=200, null=True, verbose_name='Ключ уникальности')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Состояние')),
+                ('run_at', models.DateTimeField(verbose_name='Выполнить не раньше')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(verbose_name='Наибольшее число попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('locked_by', models.CharField(blank=True, max_length=64, verbose_name='Обработчик')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взята в работу')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+                'indexes': [models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('dedup_key',), name='unique_pending_task_dedup_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-19 06:52
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Round
+
+
+def backfill_prices(apps, schema_editor):
+    """
+    Цена на момент добавления существующих строк неизвестна: берётся текущая цена товара
+    (её же раньше показывала корзина). Строки удалённых товаров остаются с нулевой ценой.
+    """
+    OrderProduct = apps.get_model('app', 'OrderProduct')
+    Product = apps.get_model('app', 'Product')
+    price = Product.objects.filter(pk=models.OuterRef('product_id')).values('product_price')[:1]
+    OrderProduct.objects.filter(product__isnull=False).update(unit_price=models.Subquery(price))
+    OrderProduct.objects.update(
+        total_price=Round(models.F('unit_price') * Coalesce('quantity', 0), 2),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Стоимость'),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Цена за единицу'),
+        ),
+        migrations.RunPython(
+            backfill_prices,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,69 @@
+import time
+
+from django.db import migrations, models
+
+
+# Замороженная копия формулы app/leaderboard.py на момент миграции: код приложения
+# и настройки могут измениться, а миграция должна давать тот же результат.
+# Оценки записываются в масштабе эпохи 0 (от EPOCH), которую назначит миграция 0011.
+EPOCH = 1735689600
+HALF_LIFE = 7 * 24 * 60 * 60
+WEIGHTS = {
+    'view': 1,
+    'purchase': 20,
+}
+
+
+def seed_popularity(apps, schema_editor):
+    """
+    Заполняет пустой рейтинг популярности по накопленным счётчикам просмотров и покупкам
+    (как команда rebuild_leaderboard): без этого блоки популярных товаров на главной
+    и в категориях пусты до ручного пересчёта.
+    """
+    Product = apps.get_model('app', 'Product')
+    OrderProduct = apps.get_model('app', 'OrderProduct')
+    ProductPopularity = apps.get_model('app', 'ProductPopularity')
+    if ProductPopularity.objects.exists():
+        return
+
+    factor = 2 ** ((time.time() - EPOCH) / HALF_LIFE)
+    weights = WEIGHTS
+    purchased = (
+        OrderProduct.objects
+        .filter(product=models.OuterRef('pk'), order__is_completed=True)
+        .values('product')
+        .annotate(total=models.Sum('quantity'))
+        .values('total')
+    )
+    products = (
+        Product.objects
+        .annotate(purchased=models.Subquery(purchased))
+        .filter(models.Q(product_watched__gt=0) | models.Q(purchased__gt=0))
+        .values_list('pk', 'product_category_id', 'product_category__parent_id', 'product_watched', 'purchased')
+    )
+    batch = []
+    for pk, category_id, root_category_id, watched, purchased_count in products.iterator(chunk_size=5000):
+        batch.append(ProductPopularity(
+            product_id=pk,
+            category_id=category_id,
+            root_category_id=root_category_id,
+            score=(watched * weights['view'] + (purchased_count or 0) * weights['purchase']) * factor,
+        ))
+        if len(batch) == 5000:
+            ProductPopularity.objects.bulk_create(batch)
+            batch = []
+    ProductPopularity.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_orderproduct_unit_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            seed_popularity,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_seed_productpopularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productpopularity',
+            name='era',
+            field=models.PositiveIntegerField(default=0, help_text='Эпоха, в масштабе которой записана популярность (см. app/leaderboard.py)', verbose_name='Эпоха'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Sum
 from django.urls import reverse
 from django.contrib.auth.models import User
 
@@ -75,6 +78,11 @@ class Product(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания',
     )
+    # Массовые изменения (update, bulk_update) обходят auto_now и задают значение явно
+    product_updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
     product_watched = models.IntegerField(
         default=0,
         verbose_name='Просмотры',
@@ -125,8 +133,13 @@ class Product(models.Model):
         """
         Метод для получения URL первого изображения из связанных изображений продукта.
         Если изображений нет, возвращает изображение по умолчанию.
+        Изображения, загруженные заранее через prefetch_related('images'),
+        используются без дополнительного запроса.
         """
-        first_image = self.images.first() 
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            first_image = min(self.images.all(), key=lambda image: image.pk, default=None)
+        else:
+            first_image = self.images.first()
         return first_image.image.url if first_image else DEFAULT_IMAGE
 
     def get_absolute_url(self):
@@ -266,20 +279,42 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        constraints = (
+            # У покупателя может быть только один незавершённый заказ (корзина)
+            models.UniqueConstraint(
+                fields=('customer', ),
+                condition=models.Q(is_completed=False),
+                name='unique_open_order_per_customer',
+            ),
+        )
+
+    def get_totals(self):
+        """
+        Количество и стоимость товаров заказа: по загруженным строкам (prefetch_related),
+        иначе одним агрегирующим запросом к таблице строк без соединения с товарами.
+        """
+        if 'ordered' in getattr(self, '_prefetched_objects_cache', {}):
+            lines = self.ordered.all()
+            return (
+                sum(line.quantity or 0 for line in lines),
+                sum((line.total_price for line in lines), Decimal(0)),
+            )
+        totals = self.ordered.aggregate(quantity=Sum('quantity'), price=Sum('total_price'))
+        return totals['quantity'] or 0, totals['price'] or Decimal(0)
 
     @property
     def get_cart_total_price(self):
         """
         Возвращает общую стоимость корзины заказа.
         """
-        return sum([product.get_total_price for product in self.ordered.all()])
+        return self.get_totals()[1]
 
     @property
     def get_cart_total_quantity(self):
         """
         Возвращает общее количество товаров в корзине.
         """
-        return sum([product.quantity for product in self.ordered.all()])
+        return self.get_totals()[0]
 
 
 class OrderProduct(models.Model):
@@ -305,6 +340,20 @@ class OrderProduct(models.Model):
         null=True,
         verbose_name='Количество товаров',
     )
+    # Цена запоминается при добавлении товара: изменение цены товара не меняет
+    # корзины и оформленные заказы, пока их не пересчитают (utils.reprice_cart_lines)
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name='Цена за единицу',
+    )
+    total_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name='Стоимость',
+    )
     added_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата добавления',
@@ -314,12 +363,28 @@ class OrderProduct(models.Model):
         verbose_name = 'Товар в заказе'
         verbose_name_plural = 'Товары в заказе'
 
+    @classmethod
+    def for_product(cls, product, quantity=0, **kwargs):
+        """
+        Строка заказа с ценой товара на момент добавления.
+        """
+        line = cls(product=product, unit_price=product.product_price, **kwargs)
+        line.set_quantity(quantity)
+        return line
+
+    def set_quantity(self, quantity):
+        """
+        Меняет количество и пересчитывает стоимость строки по запомненной цене.
+        """
+        self.quantity = quantity
+        self.total_price = self.unit_price * (quantity or 0)
+
     @property
     def get_total_price(self):
         """
-        Вычисляет общую стоимость данного товара в заказе.
+        Возвращает общую стоимость данного товара в заказе (без обращения к товару).
         """
-        return self.product.product_price * self.quantity
+        return self.total_price
 
 
 class ShippingAddress(models.Model):
@@ -360,3 +425,192 @@ class ShippingAddress(models.Model):
         """Метаданные для модели."""
         verbose_name = 'Адрес доставки'
         verbose_name_plural = 'Адреса доставки'
+
+
+class ProductRecommendation(models.Model):
+    """
+    Предрасчитанный похожий товар: соседи товара по совместным покупкам
+    и добавлениям в избранное. Таблица пересчитывается командой build_recommendations.
+    """
+    product = models.ForeignKey(
+        to=Product,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Товар',
+    )
+    recommended = models.ForeignKey(
+        to=Product,
+        on_delete=models.CASCADE,
+        related_name='recommended_for',
+        verbose_name='Похожий товар',
+    )
+    rank = models.PositiveSmallIntegerField(
+        verbose_name='Позиция',
+    )
+    score = models.FloatField(
+        verbose_name='Близость',
+    )
+
+    def __str__(self):
+        """
+        Возвращает строковое представление объекта ProductRecommendation.
+        """
+        return f'{self.product_id} -> {self.recommended_id}'
+
+    class Meta:
+        verbose_name = 'Похожий товар'
+        verbose_name_plural = 'Похожие товары'
+        ordering = ('product', 'rank')
+        constraints = (
+            # Индекс (product, rank) отдаёт соседей товара одним запросом
+            models.UniqueConstraint(
+                fields=('product', 'rank'),
+                name='unique_recommendation_rank',
+            ),
+        )
+
+
+class ProductPopularity(models.Model):
+    """
+    Популярность товара с затуханием во времени (см. app/leaderboard.py).
+    Категория и родительская категория товара продублированы,
+    чтобы рейтинг категории читался по индексу без соединения таблиц.
+    """
+    product = models.OneToOneField(
+        to=Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name='Товар',
+    )
+    category = models.ForeignKey(
+        to=Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Категория',
+    )
+    root_category = models.ForeignKey(
+        to=Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Родительская категория',
+    )
+    score = models.FloatField(
+        default=0,
+        verbose_name='Популярность',
+    )
+    era = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Эпоха',
+        help_text='Эпоха, в масштабе которой записана популярность (см. app/leaderboard.py)',
+    )
+
+    def __str__(self):
+        """
+        Возвращает строковое представление объекта ProductPopularity.
+        """
+        return f'{self.product_id}: {self.score}'
+
+    class Meta:
+        verbose_name = 'Популярность товара'
+        verbose_name_plural = 'Популярность товаров'
+        indexes = (
+            models.Index(fields=('-score', ), name='popularity_score_idx'),
+            models.Index(fields=('category', '-score'), name='popularity_category_idx'),
+            models.Index(fields=('root_category', '-score'), name='popularity_root_idx'),
+        )
+
+
+class Task(models.Model):
+    """
+    Фоновая задача очереди (см. app/taskqueue.py), выполняемая командой run_worker.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        max_length=150,
+        verbose_name='Задача',
+    )
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Аргументы',
+    )
+    dedup_key = models.CharField(
+        max_length=200,
+        null=True,
+        blank=True,
+        verbose_name='Ключ уникальности',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Состояние',
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Выполнить не раньше',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток',
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Наибольшее число попыток',
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+    )
+    locked_by = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name='Обработчик',
+    )
+    locked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Взята в работу',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана',
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Завершена',
+    )
+
+    def __str__(self):
+        """
+        Возвращает строковое представление объекта Task.
+        """
+        return f'{self.name} #{self.pk} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = (
+            # Выборка готовых к выполнению задач и подсчёт глубины очереди
+            models.Index(fields=('status', 'run_at'), name='task_status_run_at_idx'),
+        )
+        constraints = (
+            # Одна ожидающая задача на ключ: повторная постановка ничего не добавляет
+            models.UniqueConstraint(
+                fields=('dedup_key', ),
+                condition=models.Q(status='pending'),
+                name='unique_pending_task_dedup_key',
+            ),
+        )
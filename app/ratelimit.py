@@ -0,0 +1,154 @@
+import math
+import time
+from functools import cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Ограничение частоты запросов к маршрутам из settings.RATELIMITS: корзина токенов
+# ёмкостью burst, пополняемая со скоростью rate токенов в секунду, на каждого
+# IP-адрес и маршрут, а для вошедшего пользователя - ещё и на его id: запрос проходит,
+# только если токен есть в обеих корзинах (смена IP не обходит лимит пользователя,
+# а много учётных записей с одного адреса - лимит адреса).
+# Состояние хранится в кэше settings.RATELIMIT_CACHE_ALIAS только атомарными
+# incr/decr, без чтения-изменения-записи: расход токенов считается в окнах длиной
+# burst / rate секунд, а уровень корзины оценивается по счётчикам текущего
+# и предыдущего окна (доля предыдущего убывает линейно - пополнение корзины).
+# Проверка стоит два обращения к кэшу: incr текущего окна и get предыдущего.
+
+
+class TokenBucket:
+    """
+    Корзина токенов одного маршрута.
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.period = burst / rate
+        # Счётчик окна нужен ещё одно окно как предыдущий
+        self.timeout = math.ceil(2 * self.period) + 1
+
+    def window(self, identity, now):
+        """ Ключи текущего и предыдущего окна и пройденная доля текущего окна """
+        slot, offset = divmod(now, self.period)
+        prefix = f'ratelimit:{self.name}:{identity}:'
+        return f'{prefix}{int(slot)}', f'{prefix}{int(slot) - 1}', offset / self.period
+
+    def consume(self, identity, now=None):
+        """
+        Берёт токен для identity. Возвращает 0, если токен взят,
+        иначе - через сколько секунд стоит повторить запрос.
+        """
+        cache = caches[settings.RATELIMIT_CACHE_ALIAS]
+        key, previous_key, elapsed = self.window(identity, time.time() if now is None else now)
+        try:
+            current = cache.incr(key)
+        except ValueError:
+            # Первый запрос окна; add не затрёт счётчик, созданный параллельным запросом
+            current = 1 if cache.add(key, 1, self.timeout) else cache.incr(key)
+        previous = cache.get(previous_key, 0)
+        if self.allowed(previous, current, elapsed):
+            return 0
+        # Отклонённый запрос токен не расходует
+        cache.decr(key)
+        return self.retry_after(previous, current - 1, elapsed)
+
+    async def aconsume(self, identity, now=None):
+        """
+        Асинхронный вариант consume.
+        """
+        cache = caches[settings.RATELIMIT_CACHE_ALIAS]
+        key, previous_key, elapsed = self.window(identity, time.time() if now is None else now)
+        try:
+            current = await cache.aincr(key)
+        except ValueError:
+            current = 1 if await cache.aadd(key, 1, self.timeout) else await cache.aincr(key)
+        previous = await cache.aget(previous_key, 0)
+        if self.allowed(previous, current, elapsed):
+            return 0
+        await cache.adecr(key)
+        return self.retry_after(previous, current - 1, elapsed)
+
+    def consume_all(self, identities, now=None):
+        """
+        Берёт по токену для каждого из identities. Если хотя бы для одного токена
+        нет, уже взятые возвращаются; результат - как у consume.
+        """
+        now = time.time() if now is None else now
+        for number, identity in enumerate(identities):
+            retry_after = self.consume(identity, now)
+            if retry_after:
+                for taken in identities[:number]:
+                    self.refund(taken, now)
+                return retry_after
+        return 0
+
+    async def aconsume_all(self, identities, now=None):
+        """
+        Асинхронный вариант consume_all.
+        """
+        now = time.time() if now is None else now
+        for number, identity in enumerate(identities):
+            retry_after = await self.aconsume(identity, now)
+            if retry_after:
+                for taken in identities[:number]:
+                    await self.arefund(taken, now)
+                return retry_after
+        return 0
+
+    def refund(self, identity, now):
+        """ Возвращает токен, взятый в момент now """
+        caches[settings.RATELIMIT_CACHE_ALIAS].decr(self.window(identity, now)[0])
+
+    async def arefund(self, identity, now):
+        """ Асинхронный вариант refund """
+        await caches[settings.RATELIMIT_CACHE_ALIAS].adecr(self.window(identity, now)[0])
+
+    def allowed(self, previous, current, elapsed):
+        """
+        Есть ли токен для запроса: оценка расхода до него (current включает сам запрос)
+        меньше ёмкости корзины. Сравнение до запроса, а не после, не даёт округлению
+        терять токен в каждом окне при постоянной нагрузке.
+        """
+        return previous * (1 - elapsed) + current - 1 < self.burst
+
+    def retry_after(self, previous, current, elapsed):
+        """
+        Секунды до момента, когда оценка расхода previous * (1 - доля окна) + current
+        станет меньше ёмкости корзины.
+        """
+        if current < self.burst and previous:
+            # Освободится в текущем окне по мере убывания доли предыдущего
+            wait = 1 - (self.burst - current) / previous - elapsed
+        else:
+            # Текущее окно станет предыдущим: ждём его конца и убывания его доли
+            wait = 1 - elapsed + max(0, 1 - self.burst / current)
+        return math.floor(wait * self.period) + 1
+
+
+@cache
+def get_bucket(name, rate, burst):
+    return TokenBucket(name, rate, burst)
+
+
+def client_ip(request):
+    """
+    IP-адрес клиента: REMOTE_ADDR или, за обратным прокси, последний адрес
+    из заголовка settings.RATELIMIT_IP_HEADER (его дописывает сам прокси).
+    """
+    if settings.RATELIMIT_IP_HEADER:
+        value = request.META.get(settings.RATELIMIT_IP_HEADER, '')
+        if value:
+            return value.rpartition(',')[2].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def identities(request, user):
+    """ Ключи ограничения: IP-адрес клиента и id вошедшего пользователя """
+    keys = [f'ip:{client_ip(request)}']
+    if user.is_authenticated:
+        keys.append(f'user:{user.pk}')
+    return keys
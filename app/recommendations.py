@@ -0,0 +1,239 @@
+import heapq
+import math
+from collections import defaultdict
+from functools import cache
+
+from django.db import transaction
+
+from .catalog_io import batched
+from .models import FavoriteProduct, OrderProduct, Product, ProductRecommendation
+
+
+# Похожие товары считаются по совместной встречаемости: товары близки, если их
+# покупают в одном заказе или добавляет в избранное один пользователь.
+# Близость - косинусная мера между столбцами матрицы "корзина x товар",
+# корзины из избранного учитываются с весом FAVORITE_WEIGHT.
+
+FAVORITE_WEIGHT = 0.5
+# Близость округляется, чтобы равные значения, посчитанные в разном порядке,
+# совпадали и упорядочивались по id соседа
+SCORE_PRECISION = 9
+
+
+def iter_baskets_rows():
+    """
+    Возвращает пары (id корзины, id товара) заказов и избранного.
+    Каждая пара встречается один раз, даже если товар добавлен в заказ несколькими строками.
+    """
+    orders = (
+        OrderProduct.objects
+        .filter(order__isnull=False, product__isnull=False)
+        .values_list('order_id', 'product_id')
+        .distinct()
+        .iterator(chunk_size=10000)
+    )
+    favorites = (
+        FavoriteProduct.objects
+        .values_list('user_id', 'product_id')
+        .distinct()
+        .iterator(chunk_size=10000)
+    )
+    return orders, favorites
+
+
+@cache
+def sparse_modules():
+    """
+    Возвращает модули (numpy, scipy.sparse) или (None, None), если они не установлены.
+    Импорт отложен до расчёта, чтобы NumPy и SciPy не замедляли запуск веб-процессов.
+    """
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        return None, None
+    return numpy, sparse
+
+
+def compute_neighbours(top_k=10, favorite_weight=FAVORITE_WEIGHT, vectorized=None):
+    """
+    Вычисляет для каждого товара top_k ближайших соседей.
+    Возвращает словарь {id товара: [(id соседа, близость), ...]} по убыванию близости.
+    При установленных NumPy и SciPy расчёт выполняется разреженными матрицами,
+    иначе - на чистом Python.
+    """
+    if vectorized is None:
+        vectorized = sparse_modules()[1] is not None
+    orders, favorites = iter_baskets_rows()
+    if vectorized:
+        return compute_neighbours_sparse(orders, favorites, top_k, favorite_weight)
+    return compute_neighbours_python(orders, favorites, top_k, favorite_weight)
+
+
+def basket_matrix(rows, product_ids, weight):
+    """
+    Строит разреженную матрицу "корзина x товар" из массива пар (id корзины, id товара).
+    """
+    np, sparse = sparse_modules()
+    baskets = np.unique(rows[:, 0], return_inverse=True)[1]
+    return sparse.csr_matrix(
+        (
+            np.full(len(rows), weight, dtype=np.float64),
+            (baskets, np.searchsorted(product_ids, rows[:, 1])),
+        ),
+        shape=(baskets.max() + 1, len(product_ids)),
+    )
+
+
+def compute_neighbours_sparse(orders, favorites, top_k, favorite_weight):
+    """
+    Векторизованный расчёт соседей: C = X^T X, нормировка на норму столбцов
+    и выбор top_k наибольших значений в каждой строке C.
+    """
+    np, sparse = sparse_modules()
+    orders = np.array(list(orders), dtype=np.int64).reshape(-1, 2)
+    favorites = np.array(list(favorites), dtype=np.int64).reshape(-1, 2)
+    product_ids = np.unique(np.concatenate((orders[:, 1], favorites[:, 1])))
+    if not len(product_ids):
+        return {}
+
+    matrices = [
+        basket_matrix(rows, product_ids, weight)
+        for rows, weight in ((orders, 1.0), (favorites, favorite_weight))
+        if len(rows)
+    ]
+    matrix = sparse.vstack(matrices).tocsr()
+
+    cooccurrence = (matrix.T @ matrix).tocsr()
+    norms = np.sqrt(cooccurrence.diagonal())
+    inverse_norms = sparse.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0))
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+    similarity = (inverse_norms @ cooccurrence @ inverse_norms).tocsr()
+    similarity.data = np.round(similarity.data, SCORE_PRECISION)
+    # Сортировка соседей по id делает порядок при равной близости детерминированным
+    similarity.sort_indices()
+
+    neighbours = {}
+    indptr, indices, data = similarity.indptr, similarity.indices, similarity.data
+    for row in range(similarity.shape[0]):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        scores = data[start:end]
+        if end - start > top_k:
+            # Все претенденты не хуже k-го, чтобы равные значения на границе отбирались по id
+            threshold = np.partition(scores, end - start - top_k)[end - start - top_k]
+            best = np.flatnonzero(scores >= threshold)
+        else:
+            best = np.arange(end - start)
+        best = best[np.lexsort((indices[start:end][best], -scores[best]))][:top_k]
+        neighbours[int(product_ids[row])] = [
+            (int(product_ids[indices[start + column]]), float(scores[column]))
+            for column in best
+        ]
+    return neighbours
+
+
+def compute_neighbours_python(orders, favorites, top_k, favorite_weight):
+    """
+    Расчёт соседей на чистом Python (если NumPy и SciPy не установлены).
+    Результат совпадает с compute_neighbours_sparse.
+    """
+    cooccurrence = defaultdict(lambda: defaultdict(float))
+    norms = defaultdict(float)
+    for rows, weight in ((orders, 1.0), (favorites, favorite_weight)):
+        baskets = defaultdict(list)
+        for basket_id, product_id in rows:
+            baskets[basket_id].append(product_id)
+        square = weight * weight
+        for products in baskets.values():
+            for product_id in products:
+                norms[product_id] += square
+                for other_id in products:
+                    if other_id != product_id:
+                        cooccurrence[product_id][other_id] += square
+
+    neighbours = {}
+    for product_id, others in cooccurrence.items():
+        scores = (
+            (other_id, round(value / math.sqrt(norms[product_id] * norms[other_id]), SCORE_PRECISION))
+            for other_id, value in others.items()
+        )
+        neighbours[product_id] = heapq.nsmallest(
+            top_k,
+            scores,
+            key=lambda item: (-item[1], item[0]),
+        )
+    return neighbours
+
+
+@transaction.atomic
+def store_neighbours(neighbours, batch_size=5000):
+    """
+    Заменяет содержимое таблицы похожих товаров рассчитанными соседями.
+    Возвращает количество сохранённых записей.
+    """
+    ProductRecommendation.objects.all().delete()
+    recommendations = (
+        ProductRecommendation(
+            product_id=product_id,
+            recommended_id=recommended_id,
+            rank=rank,
+            score=score,
+        )
+        for product_id, items in neighbours.items()
+        for rank, (recommended_id, score) in enumerate(items)
+    )
+    total = 0
+    for batch in batched(recommendations, batch_size):
+        ProductRecommendation.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def similar_products_queryset(product, limit=3):
+    """
+    Похожие товары из предрасчитанной таблицы (один запрос по индексу product, rank).
+    """
+    return (
+        Product.objects
+        .filter(recommended_for__product=product)
+        .order_by('recommended_for__rank')
+        .prefetch_related('images')
+        [:limit]
+    )
+
+
+def popular_in_category_queryset(product, limit=3):
+    """
+    Самые просматриваемые товары категории - замена, если соседей у товара нет.
+    """
+    return (
+        Product.objects
+        .filter(product_category_id=product.product_category_id)
+        .exclude(pk=product.pk)
+        .order_by('-product_watched', 'pk')
+        .prefetch_related('images')
+        [:limit]
+    )
+
+
+def get_similar_products(product, limit=3):
+    """
+    Возвращает список похожих товаров или популярных товаров той же категории.
+    """
+    products = list(similar_products_queryset(product, limit))
+    if not products:
+        products = list(popular_in_category_queryset(product, limit))
+    return products
+
+
+async def aget_similar_products(product, limit=3):
+    """
+    Асинхронный вариант get_similar_products.
+    """
+    products = [item async for item in similar_products_queryset(product, limit)]
+    if not products:
+        products = [item async for item in popular_in_category_queryset(product, limit)]
+    return products
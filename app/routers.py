@@ -0,0 +1,49 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# Псевдоним базы для чтения в текущем запросе; None - основная база
+read_database = ContextVar('read_database', default=None)
+
+
+def use_replica():
+    """
+    Выбирает реплику для чтения в текущем запросе.
+    Если реплики не настроены, чтение остаётся на основной базе.
+    """
+    replicas = settings.REPLICA_DATABASES
+    read_database.set(random.choice(replicas) if replicas else None)
+
+
+def use_primary():
+    """ Направляет чтение текущего запроса в основную базу """
+    read_database.set(None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Роутер баз данных: запись всегда идёт в основную базу ('default'),
+    чтение - в реплику, выбранную для текущего запроса (см. ReplicaRoutingMiddleware).
+    Сессии всегда читаются из основной базы, чтобы не потерять только что созданную сессию.
+    """
+    primary_only_apps = {'sessions'}
+
+    def db_for_read(self, model, **hints):
+        """ Возвращает базу для чтения """
+        if model._meta.app_label in self.primary_only_apps:
+            return 'default'
+        return read_database.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        """ Возвращает базу для записи """
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """ Основная база и реплики содержат одни и те же данные """
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """ Схема одинакова во всех базах """
+        return True
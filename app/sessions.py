@@ -0,0 +1,37 @@
+from django.contrib.sessions.backends import db, signed_cookies
+from django.contrib.sessions.backends.base import VALID_KEY_CHARS
+
+
+class SessionStore(signed_cookies.SessionStore):
+    """
+    Сессия в подписанной cookie (SESSION_PROFILE = 'signed_cookies').
+
+    Для перехода с сессий в базе данных принимает и старые cookie с ключом сессии
+    из таблицы django_session: данные такой сессии читаются из базы один раз
+    и в том же ответе отправляются клиенту в подписанной cookie.
+    Оставшиеся в базе записи удаляет по истечении срока команда clearsessions.
+    """
+
+    def load(self):
+        session_key = self.session_key
+        session_data = super().load()
+        if not session_data and self.is_db_session_key(session_key):
+            # Флаг modified уже установлен (create() в super().load()),
+            # поэтому данные будут сохранены в cookie в этом же ответе
+            session_data = db.SessionStore(session_key).load()
+        return session_data
+
+    async def aload(self):
+        session_key = self.session_key
+        session_data = super().load()
+        if not session_data and self.is_db_session_key(session_key):
+            session_data = await db.SessionStore(session_key).aload()
+        return session_data
+
+    @staticmethod
+    def is_db_session_key(session_key):
+        """
+        Ключ сессии из базы: строка из строчных латинских букв и цифр
+        (подписанная cookie содержит ":" и другие символы).
+        """
+        return bool(session_key) and set(session_key) <= set(VALID_KEY_CHARS)
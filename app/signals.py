@@ -0,0 +1,55 @@
+import time
+
+from django.core.cache import cache
+from django.dispatch import Signal, receiver
+
+
+# Отправляется один раз на пачку изменений каталога (а не на каждую строку).
+# Аргументы: sender - модель, pks - список изменённых pk или None, если он неизвестен.
+catalog_changed = Signal()
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# Остатки товаров меняются при каждой операции с корзиной, поэтому у них своя версия:
+# её изменение не сбрасывает кэши, зависящие только от данных каталога
+STOCK_VERSION_KEY = 'catalog:stock-version'
+
+
+def get_catalog_version():
+    """
+    Возвращает текущую версию данных каталога.
+    Версия меняется при каждом изменении каталога и служит для сброса кэшей.
+    """
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_stock_version():
+    """
+    Возвращает текущую версию остатков товаров (product_quantity).
+    """
+    return cache.get_or_set(STOCK_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_version(key):
+    """
+    Увеличивает версию.
+    Если ключ был вытеснен из кэша, версия начинается с текущего времени,
+    чтобы не совпасть ни с одной из выданных ранее.
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+@receiver(catalog_changed)
+def bump_catalog_version(sender, **kwargs):
+    """ Увеличивает версию каталога """
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_stock_version():
+    """
+    Увеличивает версию остатков. Вызывается после фиксации транзакции,
+    изменившей product_quantity вне админки и импорта (операции с корзиной).
+    """
+    bump_version(STOCK_VERSION_KEY)
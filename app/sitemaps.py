@@ -0,0 +1,166 @@
+import math
+import os
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.urls import reverse
+
+from .catalog_io import batched
+from .models import Category, Product
+
+
+# Карта сайта по протоколу sitemaps.org: индекс sitemap.xml со ссылками на файлы
+# разделов sitemap-<раздел>-<номер>.xml, до SITEMAP_MAX_URLS адресов в каждом.
+# Строки читаются курсором (values_list + iterator), адреса собираются по шаблону
+# маршрута, полученному одним вызовом reverse(), без создания объектов моделей.
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# Раздел -> (модель, имя маршрута с параметром slug, поле даты изменения или None)
+SECTIONS = {
+    'categories': (Category, 'category', None),
+    'products': (Product, 'product', 'product_updated_at'),
+}
+
+# Подставляется в маршрут вместо slug, чтобы разделить его на начало и конец
+SLUG_PLACEHOLDER = 'sitemap-slug-placeholder'
+
+
+def route_template(route_name):
+    """
+    Возвращает (начало, конец) пути маршрута: путь объекта - начало + slug + конец.
+    """
+    prefix, suffix = reverse(route_name, kwargs={'slug': SLUG_PLACEHOLDER}).split(SLUG_PLACEHOLDER)
+    return prefix, suffix
+
+
+def section_queryset(section):
+    """ Объекты раздела, у которых есть страница (задан slug) """
+    model = SECTIONS[section][0]
+    return model.objects.exclude(slug__isnull=True).exclude(slug='').order_by('pk')
+
+
+def count_pages(section, max_urls=None):
+    """ Количество файлов раздела """
+    max_urls = max_urls or settings.SITEMAP_MAX_URLS
+    return math.ceil(section_queryset(section).count() / max_urls)
+
+
+def iter_entries(section, start=0, stop=None, chunk_size=5000):
+    """
+    Возвращает пары (путь, дата изменения или None) объектов раздела
+    с порядковыми номерами от start до stop.
+    """
+    _, route_name, lastmod_field = SECTIONS[section]
+    prefix, suffix = route_template(route_name)
+    fields = ('slug', lastmod_field) if lastmod_field else ('slug', )
+    rows = section_queryset(section).values_list(*fields)[start:stop].iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield prefix + row[0] + suffix, row[1] if lastmod_field else None
+
+
+def iter_page_entries(section, page, max_urls=None, chunk_size=5000):
+    """ Адреса страницы page (с 1) раздела """
+    max_urls = max_urls or settings.SITEMAP_MAX_URLS
+    start = (page - 1) * max_urls
+    return iter_entries(section, start, start + max_urls, chunk_size)
+
+
+def format_lastmod(value):
+    return f'<lastmod>{value.isoformat(timespec="seconds")}</lastmod>' if value else ''
+
+
+def render_urlset(entries, base_url, batch_size=1000):
+    """
+    Генератор XML файла раздела по частям (по batch_size адресов).
+    entries - пары (путь, дата изменения или None).
+    """
+    base_url = escape(base_url)
+    yield f'{XML_HEADER}<urlset xmlns="{XMLNS}">\n'
+    for batch in batched(entries, batch_size):
+        yield ''.join(
+            f'<url><loc>{base_url}{escape(path)}</loc>{format_lastmod(lastmod)}</url>\n'
+            for path, lastmod in batch
+        )
+    yield '</urlset>\n'
+
+
+def render_index(sitemaps, base_url):
+    """
+    Генератор XML индекса. sitemaps - пары (путь файла раздела, дата изменения или None).
+    """
+    base_url = escape(base_url)
+    yield f'{XML_HEADER}<sitemapindex xmlns="{XMLNS}">\n'
+    for path, lastmod in sitemaps:
+        yield f'<sitemap><loc>{base_url}{escape(path)}</loc>{format_lastmod(lastmod)}</sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def page_path(section, page):
+    """ Путь файла раздела на сайте """
+    return reverse('sitemap', kwargs={'section': section, 'page': page})
+
+
+def iter_index_entries(max_urls=None):
+    """ Файлы разделов для индекса карты сайта, формируемого по запросу """
+    for section in SECTIONS:
+        for page in range(1, count_pages(section, max_urls) + 1):
+            yield page_path(section, page), None
+
+
+def write_sitemaps(directory, base_url, max_urls=None, chunk_size=5000):
+    """
+    Записывает карту сайта в каталог directory за один проход по каждому разделу:
+    индекс sitemap.xml и файлы разделов. Файлы заменяются атомарно,
+    файлы разделов прежней версии, которых нет в новой, удаляются.
+    Возвращает {раздел: количество адресов}.
+    """
+    max_urls = max_urls or settings.SITEMAP_MAX_URLS
+    os.makedirs(directory, exist_ok=True)
+    index, written, totals = [], set(), {}
+    for section in SECTIONS:
+        entries = iter_entries(section, chunk_size=chunk_size)
+        totals[section] = 0
+        page = 0
+        while True:
+            # Следующая порция читается лениво: в памяти одна пачка курсора
+            shard = islice(entries, max_urls)
+            first = next(shard, None)
+            if first is None:
+                break
+            page += 1
+            stats = {'count': 0, 'lastmod': None}
+            name = os.path.basename(page_path(section, page))
+            write_file(directory, name, render_urlset(track(chain([first], shard), stats), base_url))
+            index.append((page_path(section, page), stats['lastmod']))
+            written.add(name)
+            totals[section] += stats['count']
+
+    write_file(directory, 'sitemap.xml', render_index(index, base_url))
+    for name in os.listdir(directory):
+        if name.startswith('sitemap-') and name.endswith('.xml') and name not in written:
+            os.remove(os.path.join(directory, name))
+    return totals
+
+
+def track(entries, stats):
+    """
+    Пропускает через себя адреса файла раздела, считая их количество
+    и наибольшую дату изменения (для индекса).
+    """
+    for path, lastmod in entries:
+        stats['count'] += 1
+        if lastmod and (stats['lastmod'] is None or lastmod > stats['lastmod']):
+            stats['lastmod'] = lastmod
+        yield path, lastmod
+
+
+def write_file(directory, name, chunks):
+    """ Записывает части файла во временный файл и заменяет им name """
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        for chunk in chunks:
+            file.write(chunk)
+    os.replace(path + '.tmp', path)
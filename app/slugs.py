@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+
+from .models import Category, Product
+from .signals import catalog_changed
+
+
+# Кэш slug -> pk для маршрутов товаров и категорий: LRU-словарь в памяти процесса
+# (до SLUG_CACHE_SIZE записей на модель) поверх общего кэша Django.
+# Неизвестные slug тоже запоминаются (значение MISSING) на SLUG_CACHE_MISSING_TIMEOUT
+# секунд, чтобы перебор несуществующих адресов не нагружал базу.
+# Ключи содержат поколение модели - счётчик в общем кэше, который увеличивается
+# при изменении slug; записи других процессов со старым поколением не используются.
+
+MISSING = 0  # pk в базе начинаются с 1
+
+
+class SlugResolver:
+    """
+    Преобразование slug в pk для одной модели.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.max_length = model._meta.get_field('slug').max_length
+        self.generation_key = f'slugs:{model._meta.model_name}:generation'
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cache_key(self, generation, slug):
+        return f'slugs:{self.model._meta.model_name}:{generation}:{slug}'
+
+    def get_local(self, generation, slug):
+        """ Возвращает pk (или MISSING) из памяти процесса либо None """
+        with self.lock:
+            entry = self.local.get(slug)
+            if entry is None:
+                return None
+            entry_generation, pk, expires = entry
+            if entry_generation != generation or expires < time.monotonic():
+                del self.local[slug]
+                return None
+            self.local.move_to_end(slug)
+            return pk
+
+    def set_local(self, generation, slug, pk):
+        """ Запоминает pk в памяти процесса, вытесняя самые давние записи """
+        with self.lock:
+            self.local[slug] = (generation, pk, time.monotonic() + self.timeout(pk))
+            self.local.move_to_end(slug)
+            while len(self.local) > settings.SLUG_CACHE_SIZE:
+                self.local.popitem(last=False)
+
+    @staticmethod
+    def timeout(pk):
+        if pk == MISSING:
+            return settings.SLUG_CACHE_MISSING_TIMEOUT
+        return settings.SLUG_CACHE_TIMEOUT
+
+    def resolve(self, slug):
+        """
+        Возвращает pk объекта с данным slug или None, если такого объекта нет.
+        """
+        if not slug or len(slug) > self.max_length:
+            return None
+        generation = cache.get_or_set(self.generation_key, time.time_ns(), timeout=None)
+        pk = self.get_local(generation, slug)
+        if pk is None:
+            key = self.cache_key(generation, slug)
+            pk = cache.get(key)
+            if pk is None:
+                pk = self.model.objects.filter(slug=slug).values_list('pk', flat=True).first() or MISSING
+                cache.set(key, pk, self.timeout(pk))
+            self.set_local(generation, slug, pk)
+        return pk or None
+
+    async def aresolve(self, slug):
+        """
+        Асинхронный вариант resolve.
+        """
+        if not slug or len(slug) > self.max_length:
+            return None
+        generation = await cache.aget_or_set(self.generation_key, time.time_ns(), timeout=None)
+        pk = self.get_local(generation, slug)
+        if pk is None:
+            key = self.cache_key(generation, slug)
+            pk = await cache.aget(key)
+            if pk is None:
+                pk = await self.model.objects.filter(slug=slug).values_list('pk', flat=True).afirst() or MISSING
+                await cache.aset(key, pk, self.timeout(pk))
+            self.set_local(generation, slug, pk)
+        return pk or None
+
+    def invalidate(self):
+        """
+        Сбрасывает кэш модели во всех процессах (новое поколение ключей).
+        """
+        try:
+            cache.incr(self.generation_key)
+        except ValueError:
+            cache.set(self.generation_key, time.time_ns(), timeout=None)
+        with self.lock:
+            self.local.clear()
+
+
+products = SlugResolver(Product)
+categories = SlugResolver(Category)
+
+RESOLVERS = {
+    Product: products,
+    Category: categories,
+}
+
+
+def get_object_by_slug(queryset, slug):
+    """
+    Возвращает объект выборки по slug (через кэш slug -> pk) или вызывает Http404.
+    """
+    pk = RESOLVERS[queryset.model].resolve(slug)
+    if pk is None:
+        raise Http404('Объект не найден')
+    try:
+        return queryset.get(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise Http404('Объект не найден')
+
+
+async def aget_object_by_slug(queryset, slug):
+    """
+    Асинхронный вариант get_object_by_slug.
+    """
+    pk = await RESOLVERS[queryset.model].aresolve(slug)
+    if pk is None:
+        raise Http404('Объект не найден')
+    try:
+        return await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise Http404('Объект не найден')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def invalidate_on_save(sender, update_fields=None, **kwargs):
+    """
+    Сбрасывает кэш после фиксации транзакции, если мог измениться slug
+    (сохранение только количества товара при работе с корзиной кэш не трогает).
+    """
+    if update_fields is None or 'slug' in update_fields:
+        transaction.on_commit(RESOLVERS[sender].invalidate)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def invalidate_on_delete(sender, **kwargs):
+    """ Сбрасывает кэш после удаления объекта """
+    transaction.on_commit(RESOLVERS[sender].invalidate)
+
+
+@receiver(catalog_changed)
+def invalidate_on_catalog_change(sender, **kwargs):
+    """
+    Сбрасывает кэш после массовых изменений каталога (импорт, админка).
+    Сигнал отправляется уже после фиксации транзакции.
+    """
+    if sender in RESOLVERS:
+        RESOLVERS[sender].invalidate()
@@ -0,0 +1,281 @@
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# Очередь фоновых задач в таблице базы данных, без внешнего брокера.
+# Задача ставится в очередь вставкой строки в текущей транзакции: если транзакция
+# откатится, задачи не будет. Обработчик (команда run_worker) забирает готовые задачи
+# условным UPDATE ... WHERE status = 'pending', поэтому несколько обработчиков
+# не возьмут одну задачу дважды. Задачи выполняются хотя бы один раз: задача,
+# обработчик которой завершился аварийно, через TASK_LOCK_TIMEOUT выполняется снова.
+# Ошибка задачи - повтор с удвоением задержки до max_attempts попыток.
+# Ожидающая задача с dedup_key одна: повторная постановка с тем же ключом ничего не добавляет.
+
+REGISTRY = {}
+
+
+class TaskFunction:
+    """
+    Зарегистрированная задача: вызывается как обычная функция
+    или ставится в очередь через enqueue(**аргументы).
+    """
+
+    def __init__(self, func, name, max_attempts=None, retry_delay=None):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, dedup_key=None, delay=0, **payload):
+        """ Ставит задачу в очередь (см. enqueue) """
+        enqueue(self.name, payload, dedup_key=dedup_key, delay=delay)
+
+    async def aenqueue(self, dedup_key=None, delay=0, **payload):
+        """ Асинхронный вариант enqueue """
+        await Task.objects.abulk_create([build_task(self.name, payload, dedup_key, delay)], ignore_conflicts=True)
+
+
+def task(name=None, max_attempts=None, retry_delay=None):
+    """
+    Декоратор функции задачи. Аргументы задачи передаются как именованные
+    и хранятся в JSON, поэтому должны быть сериализуемы (ключи словарей - строки).
+    """
+    def decorator(func):
+        task_function = TaskFunction(
+            func,
+            name or f'{func.__module__}.{func.__name__}',
+            max_attempts=max_attempts,
+            retry_delay=retry_delay,
+        )
+        REGISTRY[task_function.name] = task_function
+        return task_function
+    return decorator
+
+
+def build_task(name, payload, dedup_key=None, delay=0):
+    if name not in REGISTRY:
+        raise LookupError(f'Неизвестная задача: {name}')
+    return Task(
+        name=name,
+        payload=payload,
+        dedup_key=dedup_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=REGISTRY[name].max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def enqueue(name, payload=None, dedup_key=None, delay=0):
+    """
+    Ставит задачу name в очередь с выполнением не раньше чем через delay секунд.
+    Если задача с тем же dedup_key уже ожидает выполнения, новая не добавляется.
+    """
+    Task.objects.bulk_create([build_task(name, payload or {}, dedup_key, delay)], ignore_conflicts=True)
+
+
+def claim(worker_id, limit):
+    """
+    Забирает до limit готовых к выполнению задач для обработчика worker_id.
+    """
+    now = timezone.now()
+    ids = list(
+        Task.objects
+        .filter(status=Task.PENDING, run_at__lte=now)
+        .order_by('run_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    # Задачи, которые успел забрать другой обработчик, условие status не пропустит
+    Task.objects.filter(pk__in=ids, status=Task.PENDING).update(
+        status=Task.RUNNING,
+        locked_by=worker_id,
+        locked_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(pk__in=ids, status=Task.RUNNING, locked_by=worker_id).order_by('run_at'))
+
+
+def execute(task):
+    """
+    Выполняет забранную задачу и записывает результат: выполнена, повтор или ошибка.
+    """
+    try:
+        task_function = REGISTRY.get(task.name)
+        if task_function is None:
+            raise LookupError(f'Неизвестная задача: {task.name}')
+        task_function.func(**task.payload)
+    except Exception:
+        logger.exception('Ошибка задачи %s', task)
+        fail(task, traceback.format_exc())
+    else:
+        Task.objects.filter(pk=task.pk).update(status=Task.DONE, finished_at=timezone.now(), last_error='')
+
+
+def fail(task, error):
+    """
+    Откладывает повтор задачи с удвоением задержки или, если попытки исчерпаны,
+    отмечает задачу как завершённую с ошибкой.
+    """
+    now = timezone.now()
+    if task.attempts >= task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED, finished_at=now, last_error=error)
+        return
+
+    task_function = REGISTRY.get(task.name)
+    retry_delay = task_function and task_function.retry_delay or settings.TASK_RETRY_DELAY
+    delay = min(retry_delay * 2 ** (task.attempts - 1), settings.TASK_MAX_RETRY_DELAY)
+    try:
+        with transaction.atomic():
+            Task.objects.filter(pk=task.pk).update(
+                status=Task.PENDING,
+                run_at=now + timedelta(seconds=delay),
+                locked_by='',
+                last_error=error,
+            )
+    except IntegrityError:
+        # Пока задача выполнялась, поставили новую с тем же ключом: повтор выполнит она
+        Task.objects.filter(pk=task.pk).update(status=Task.DONE, finished_at=now, last_error=error)
+
+
+def reclaim_stale():
+    """
+    Возвращает в очередь задачи, обработчик которых не завершил их за TASK_LOCK_TIMEOUT
+    (был остановлен аварийно). Возвращает количество таких задач.
+    """
+    now = timezone.now()
+    stale = Task.objects.filter(
+        status=Task.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.TASK_LOCK_TIMEOUT),
+    )
+    error = 'Обработчик не завершил задачу'
+    pending_keys = Task.objects.filter(status=Task.PENDING, dedup_key__isnull=False).values('dedup_key')
+    total = stale.filter(dedup_key__in=pending_keys).update(status=Task.DONE, finished_at=now, last_error=error)
+    total += stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED,
+        finished_at=now,
+        last_error=error,
+    )
+    try:
+        with transaction.atomic():
+            total += stale.update(status=Task.PENDING, run_at=now, locked_by='', last_error=error)
+    except IntegrityError:
+        # Задачу с тем же ключом поставили только что: вернёмся к ней при следующей проверке
+        pass
+    return total
+
+
+def purge():
+    """ Удаляет выполненные задачи старше TASK_RETENTION секунд """
+    deadline = timezone.now() - timedelta(seconds=settings.TASK_RETENTION)
+    deleted, _ = Task.objects.filter(status=Task.DONE, finished_at__lt=deadline).delete()
+    return deleted
+
+
+def stats():
+    """
+    Глубина очереди одним запросом: количество задач по состояниям, готовых
+    к выполнению (due) и задержка самой давней готовой задачи в секундах (lag).
+    """
+    now = timezone.now()
+    due = Q(status=Task.PENDING, run_at__lte=now)
+    result = Task.objects.aggregate(
+        pending=Count('pk', filter=Q(status=Task.PENDING)),
+        due=Count('pk', filter=due),
+        running=Count('pk', filter=Q(status=Task.RUNNING)),
+        failed=Count('pk', filter=Q(status=Task.FAILED)),
+        oldest_due=Min('run_at', filter=due),
+    )
+    oldest_due = result.pop('oldest_due')
+    result['lag'] = round((now - oldest_due).total_seconds(), 1) if oldest_due else 0
+    return result
+
+
+class Worker:
+    """
+    Обработчик очереди: забирает готовые задачи и выполняет их в пуле из threads потоков.
+    """
+
+    def __init__(self, threads=4, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.id = f'{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = threading.Event()
+
+    def stop(self):
+        """ Прекращает забирать задачи; уже начатые будут завершены """
+        self.stopping.set()
+
+    def execute(self, task):
+        """ Выполняет задачу в потоке пула: соединения с базой у каждого потока свои """
+        close_old_connections()
+        try:
+            execute(task)
+        finally:
+            close_old_connections()
+
+    def run_once(self):
+        """
+        Выполняет все готовые задачи и возвращает их количество (для cron).
+        """
+        total = 0
+        with ThreadPoolExecutor(self.threads) as pool:
+            while tasks := claim(self.id, self.threads):
+                list(pool.map(self.execute, tasks))
+                total += len(tasks)
+        return total
+
+    def run(self):
+        """
+        Выполняет задачи до вызова stop(), раз в TASK_MAINTENANCE_INTERVAL секунд
+        возвращая в очередь брошенные задачи, удаляя старые и записывая глубину очереди в журнал.
+        """
+        running = set()
+        next_maintenance = 0
+        with ThreadPoolExecutor(self.threads) as pool:
+            while not self.stopping.is_set():
+                if time.monotonic() >= next_maintenance:
+                    self.maintenance()
+                    next_maintenance = time.monotonic() + settings.TASK_MAINTENANCE_INTERVAL
+
+                tasks = claim(self.id, self.threads - len(running)) if len(running) < self.threads else []
+                running.update(pool.submit(self.execute, task) for task in tasks)
+                if tasks and len(running) < self.threads:
+                    continue
+                # Ждём освобождения потока или появления новых задач
+                if running:
+                    _, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self.stopping.wait(self.poll_interval)
+            wait(running)
+        close_old_connections()
+
+    def maintenance(self):
+        reclaimed = reclaim_stale()
+        purged = purge()
+        logger.info(
+            'Очередь задач: %s, возвращено брошенных: %s, удалено выполненных: %s',
+            ', '.join(f'{key}={value}' for key, value in stats().items()),
+            reclaimed,
+            purged,
+        )
@@ -0,0 +1,186 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.dispatch import receiver
+
+from . import leaderboard, sitemaps
+from .catalog_io import batched
+from .models import Product
+from .signals import catalog_changed
+from .taskqueue import task
+
+
+logger = logging.getLogger(__name__)
+
+# Фоновые задачи магазина (выполняет команда run_worker) и их постановка в очередь
+# вместо работы в запросе: учёт просмотров и покупок в рейтинге, обновление
+# рейтинга и карты сайта после изменения каталога.
+
+# Товаров в одном UPDATE ... CASE при учёте просмотров
+VIEWS_BATCH_SIZE = 500
+
+
+@task()
+def record_views(counts):
+    """
+    Учитывает накопленные просмотры {id товара: количество}: счётчик product_watched
+    и рейтинг популярности, постоянным числом запросов на пачку товаров.
+    """
+    counts = {int(product_id): count for product_id, count in counts.items()}
+    # Повтор после ошибки не должен учесть просмотры дважды
+    with transaction.atomic():
+        for batch in batched(counts.items(), VIEWS_BATCH_SIZE):
+            Product.objects.filter(pk__in=[product_id for product_id, _ in batch]).update(
+                product_watched=F('product_watched') + Case(
+                    *(When(pk=product_id, then=Value(count)) for product_id, count in batch),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            leaderboard.record_many(dict(batch), 'view')
+
+
+@task()
+def record_purchases(amounts):
+    """ Учитывает оплаченную корзину {id товара: количество} в рейтинге популярности """
+    leaderboard.record_many({int(product_id): amount for product_id, amount in amounts.items()}, 'purchase')
+
+
+@task()
+def sync_leaderboard_categories(pks=None):
+    """ Обновляет категории в рейтинге для товаров pks (None - для всех) """
+    leaderboard.sync_categories(pks)
+
+
+@task()
+def bulk_edit_products(pks, changes):
+    """
+    Массовое изменение товаров pks из админ-панели, слишком большое для запроса
+    (см. utils.bulk_update_products). Ход выполнения записывается в журнал.
+    """
+    # utils импортирует этот модуль
+    from .utils import bulk_update_products
+
+    def report_progress(done, total):
+        logger.info('Массовое изменение товаров: %s из %s', done, total)
+
+    updated = bulk_update_products(pks, changes, progress=report_progress)
+    logger.info('Массовое изменение товаров завершено, изменено: %s', updated)
+
+
+@task()
+def rebuild_sitemaps():
+    """ Пересобирает файлы карты сайта, сформированные командой build_sitemap """
+    sitemaps.write_sitemaps(settings.SITEMAP_ROOT, settings.SITE_URL)
+
+
+@receiver(catalog_changed)
+def schedule_catalog_tasks(sender, pks=None, **kwargs):
+    """
+    Ставит в очередь обработку изменения каталога. Полное обновление рейтинга
+    и пересборка карты сайта ставятся с ключом уникальности: серия изменений
+    подряд даёт одну задачу (карта сайта - не раньше SITEMAP_REBUILD_DELAY секунд).
+    """
+    if sender is Product and pks is not None:
+        sync_leaderboard_categories.enqueue(pks=list(pks))
+    else:
+        sync_leaderboard_categories.enqueue(dedup_key='leaderboard:sync-categories')
+    if os.path.isfile(os.path.join(settings.SITEMAP_ROOT, 'sitemap.xml')):
+        rebuild_sitemaps.enqueue(dedup_key='sitemaps:rebuild', delay=settings.SITEMAP_REBUILD_DELAY)
+
+
+class ViewCounter:
+    """
+    Просмотры товаров, накопленные в памяти процесса. Они ставятся в очередь одной
+    задачей record_views вместо двух-трёх UPDATE на каждый просмотр: через
+    VIEW_COUNT_FLUSH_INTERVAL секунд после первого накопленного просмотра (по таймеру,
+    даже если новых просмотров нет), после VIEW_COUNT_FLUSH_SIZE просмотров
+    и при завершении процесса. При аварийной остановке процесса теряются
+    просмотры последнего интервала. Записывает их в базу обработчик задач
+    (команда run_worker).
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.total = 0
+        self.started = None
+        self.timer = None
+        self.exit_registered = False
+        self.lock = threading.Lock()
+
+    def add(self, product_id):
+        """ Учитывает просмотр; возвращает накопленные просмотры, если их пора записать """
+        now = time.monotonic()
+        with self.lock:
+            self.counts[product_id] += 1
+            self.total += 1
+            if self.started is None:
+                self.started = now
+                # Запись при завершении нужна только процессам, которые учитывают просмотры
+                # (веб-серверу), а не командам manage.py и миграциям
+                if not self.exit_registered:
+                    atexit.register(self.flush_in_background)
+                    self.exit_registered = True
+                self.timer = threading.Timer(settings.VIEW_COUNT_FLUSH_INTERVAL, self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+            if (
+                now - self.started < settings.VIEW_COUNT_FLUSH_INTERVAL
+                and self.total < settings.VIEW_COUNT_FLUSH_SIZE
+            ):
+                return None
+            return self.take()
+
+    def take(self):
+        """ Забирает накопленные просмотры (вызывается под блокировкой) """
+        counts = {str(product_id): count for product_id, count in self.counts.items()}
+        self.counts.clear()
+        self.total = 0
+        self.started = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return counts
+
+    def record(self, product_id):
+        if counts := self.add(product_id):
+            record_views.enqueue(counts=counts)
+
+    async def arecord(self, product_id):
+        if counts := self.add(product_id):
+            await record_views.aenqueue(counts=counts)
+
+    def flush(self):
+        """ Ставит в очередь все накопленные просмотры """
+        with self.lock:
+            counts = self.take()
+        if counts:
+            record_views.enqueue(counts=counts)
+
+    def flush_in_background(self):
+        """
+        Запись по таймеру или при завершении процесса: ошибка записывается в журнал,
+        соединение с базой, открытое в потоке таймера, закрывается.
+        """
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Не удалось записать накопленные просмотры товаров')
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    def discard(self):
+        """ Отбрасывает накопленные просмотры (для тестов) """
+        with self.lock:
+            self.take()
+
+
+views = ViewCounter()
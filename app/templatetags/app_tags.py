@@ -1,28 +1,56 @@
 from django import template
-from app.models import FavoriteProduct, OrderProduct, Order, Customer
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from app.models import FavoriteProduct
+from app.utils import CartForAnonymousUser, CartForAuthenticatedUser
 
 
 register = template.Library()
 
 
 @register.simple_tag()
-def get_favorite_products(user):
+def get_favorite_ids(request):
     """
-    Получает список избранных продуктов пользователя.
+    Получает множество id избранных продуктов пользователя.
+    Результат запоминается в запросе, чтобы карточки товаров на странице
+    не повторяли запрос для каждого товара.
     """
-    favorites_products = FavoriteProduct.objects.filter(
-        user=user,
-    )
-    products = [item.product for item in favorites_products]
-    return products
+    if not hasattr(request, 'favorite_ids'):
+        request.favorite_ids = set(
+            FavoriteProduct.objects
+            .filter(user=request.user)
+            .values_list('product_id', flat=True)
+        )
+    return request.favorite_ids
 
 
 @register.simple_tag()
-def get_cart_count(user):
-    try:
-        customer = Customer.objects.get(
-            user=user
-        )
-        return Order.objects.get(pk=customer.pk).get_cart_total_quantity
-    except:
-        return '0'
+def get_cart_count(request):
+    """
+    Возвращает количество товаров в корзине пользователя.
+    """
+    return CartForAuthenticatedUser(request).get_totals()['total_quantity']
+
+
+@register.simple_tag()
+def get_guest_cart_count(request):
+    """
+    Возвращает количество товаров в корзине гостя (хранится в сессии).
+    """
+    return sum(request.session.get(CartForAnonymousUser.session_key, {}).values())
+
+
+@register.simple_tag()
+def static_bundle(name):
+    """
+    Подключает бандл CSS/JS из settings.STATIC_BUNDLES: при settings.STATIC_BUNDLING -
+    одним собранным файлом, иначе - исходными файлами по отдельности.
+    """
+    sources = [name] if settings.STATIC_BUNDLING else settings.STATIC_BUNDLES[name]
+    if name.endswith('.css'):
+        tag = '<link rel="stylesheet" href="{}">'
+    else:
+        tag = '<script src="{}"></script>'
+    return format_html_join('\n', tag, ((static(source),) for source in sources))
@@ -1,3 +1,1292 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import math
+import os
+import re
+import tempfile
+import types
+import unittest
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends import db as db_sessions
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, include, path
+from django.utils import timezone
+
+from . import async_views, leaderboard, ratelimit, recommendations, slugs, taskqueue, tasks, utils
+from .signals import catalog_changed
+from . import urls as app_urls
+from .admin import ProductAdmin
+from .assets import brotli_module
+from .catalog_io import CatalogImporter, Checkpoint
+from .forms import ProductBulkEditForm
+from .middleware import CompressionMiddleware, StaticFilesMiddleware, accepted_encodings
+from .models import Category, Customer, FavoriteProduct, Gallery, Order, OrderProduct, Product, ProductPopularity, Task
+from .routers import PrimaryReplicaRouter, use_primary, use_replica
+from .sessions import SessionStore as CookieSessionStore
+
+
+SIZES = (1, 10, 100)
+
+
+def sql_fingerprint(sql):
+    """
+    Приводит SQL-запрос к виду без конкретных значений: строки, числа
+    и списки IN заменяются на ?, чтобы одинаковые по форме запросы совпадали.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def duplicate_fingerprints(queries):
+    """
+    Возвращает повторяющиеся формы запросов: [(количество, форма), ...] по убыванию количества.
+    """
+    counts = Counter(sql_fingerprint(query['sql']) for query in queries)
+    return [(count, sql) for sql, count in counts.most_common() if count > 1]
+
+
+def clear_caches():
+    """ Очищает кэш по умолчанию (slug -> pk, версии данных) и счётчики ограничения частоты """
+    cache.clear()
+    caches[settings.RATELIMIT_CACHE_ALIAS].clear()
+
+
+def create_catalog(size):
+    """
+    Создаёт данные размера size: size категорий верхнего уровня, у первой -
+    подкатегорию с size товарами (по два изображения у каждого) и рейтинг популярности.
+    """
+    roots = Category.objects.bulk_create([
+        Category(category_name=f'Категория {number}', slug=f'root-{number}')
+        for number in range(size)
+    ])
+    subcategory = Category.objects.create(
+        category_name='Подкатегория',
+        slug='subcategory',
+        parent=roots[0],
+    )
+    products = Product.objects.bulk_create([
+        Product(
+            product_name=f'Товар {number}',
+            slug=f'product-{number}',
+            product_price=Decimal(100 + number),
+            product_quantity=1000,
+            product_category=subcategory,
+        )
+        for number in range(size)
+    ])
+    Gallery.objects.bulk_create([
+        Gallery(image=f'products/product-{product.pk}-{image}.jpg', product=product)
+        for product in products
+        for image in range(2)
+    ])
+    leaderboard.record_many({product.pk: 1 for product in products}, 'view')
+    return products
+
+
+def create_customer(size, products):
+    """
+    Создаёт пользователя с size товарами в корзине и в избранном.
+    """
+    user = User.objects.create_user(username='customer', password='password')
+    order = Order.objects.create(customer=Customer.objects.create(user=user))
+    OrderProduct.objects.bulk_create([
+        OrderProduct.for_product(product, 1, order=order)
+        for product in products
+    ])
+    FavoriteProduct.objects.bulk_create([
+        FavoriteProduct(user=user, product=product)
+        for product in products
+    ])
+    return user
+
+
+# Быстрый хэшер паролей: создание пользователей не должно занимать основное время тестов
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    VIEW_COUNT_FLUSH_INTERVAL=3600,
+)
+class QueryBudgetTests(TestCase):
+    """
+    Количество SQL-запросов каждой страницы не должно расти вместе с объёмом данных.
+    Каждый запрос выполняется на данных размера 1, 10 и 100 (категорий, товаров,
+    строк корзины, избранного); при росте количества запросов тест выводит
+    повторяющиеся формы SQL-запросов, обычно указывающие на N+1.
+    """
+
+    # Имя маршрута -> (метод, адрес, данные, нужен ли вход пользователя)
+    cases = {
+        'index': ('get', '/', None, True),
+        'category': ('get', '/category/root-0/', None, True),
+        'product': ('get', '/product/product-0/', None, True),
+        'user_registration': ('get', '/auth/', None, False),
+        'user_login': ('post', '/login', {'username': 'customer', 'password': 'password'}, False),
+        'user_logout': ('get', '/logout', None, True),
+        'registration': ('post', '/registration', {
+            'username': 'new-customer',
+            'password1': 'Sup3r-secret-pass',
+            'password2': 'Sup3r-secret-pass',
+        }, False),
+        'add_favorite': ('get', '/add_favorite/product-0/', None, True),
+        'favorite_page': ('get', '/user_favorites/', None, True),
+        'cart': ('get', '/cart/', None, True),
+        'to_cart': ('get', '/to_cart/{product_id}/add/', None, True),
+        'cart_api': ('post', '/cart/api/', {'action': 'add'}, True),
+        'checkout': ('get', '/checkout/', None, True),
+        'payment': ('post', '/payment/', {
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'email': 'customer@example.com',
+            'phone': '+79990000000',
+            'city': 'Москва',
+            'state': 'Москва',
+            'street': 'Тверская, 1',
+        }, True),
+        'success': ('get', '/success/', None, True),
+        'search': ('get', '/search/?q=Товар', None, True),
+        'sitemap_index': ('get', '/sitemap.xml', None, False),
+        'sitemap': ('get', '/sitemap-products-1.xml', None, False),
+        'product_feed': ('get', '/feed.csv', None, False),
+        'api_categories': ('get', '/api/categories/', None, False),
+        'api_products': ('get', '/api/products/?category=root-0&fields=id,name,images', None, False),
+        'api_product': ('get', '/api/products/product-0/', None, False),
+    }
+
+    def setUp(self):
+        session = mock.Mock(url='https://checkout.stripe.test/session')
+        patcher = mock.patch('stripe.checkout.Session.create', return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_url_is_covered(self):
+        names = {
+            pattern.name
+            for pattern in app_urls.urlpatterns
+            if isinstance(pattern, URLPattern)
+        }
+        self.assertEqual(names - set(self.cases), set())
+
+    def count_queries(self, name, size):
+        """
+        Выполняет запрос маршрута name на данных размера size и возвращает выполненные SQL-запросы.
+        Данные создаются в точке сохранения и откатываются после запроса.
+        """
+        method, url, data, login = self.cases[name]
+        # Откат данных не отправляет сигналов: кэш slug -> pk сбрасывается вручную
+        clear_caches()
+        with transaction.atomic():
+            products = create_catalog(size)
+            user = create_customer(size, products)
+            if login:
+                self.client.force_login(user)
+                # Первый запрос сессии запоминает id корзины, в замер он не входит
+                self.client.get('/auth/')
+            url = url.format(product_id=products[0].pk)
+            if name == 'cart_api':
+                data = json.dumps({**data, 'product_id': products[0].pk})
+
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'get':
+                    response = self.client.get(url)
+                elif name == 'cart_api':
+                    response = self.client.post(url, data, content_type='application/json')
+                else:
+                    response = self.client.post(url, data)
+                if response.streaming:
+                    # Запросы потокового ответа выполняются при чтении содержимого
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, f'{name}: {response.status_code}')
+
+            self.client.logout()
+            transaction.set_rollback(True)
+        return queries.captured_queries
+
+    def test_query_count_does_not_grow(self):
+        for name in self.cases:
+            with self.subTest(name):
+                captured = {size: self.count_queries(name, size) for size in SIZES}
+                counts = {size: len(queries) for size, queries in captured.items()}
+                # На данных из одного элемента запросов может быть меньше: например,
+                # prefetch_related не выполняет запрос для пустого списка похожих товаров
+                smallest, *larger = counts.values()
+                if len(set(larger)) > 1 or smallest > larger[0]:
+                    duplicates = duplicate_fingerprints(captured[SIZES[-1]])
+                    self.fail(
+                        f'{name}: количество запросов растёт с объёмом данных {counts}\n'
+                        + '\n'.join(f'{count} x {sql}' for count, sql in duplicates)
+                    )
+
+
+class SlugCacheTests(TestCase):
+    """
+    Кэш slug -> pk: повторные запросы не обращаются к базе,
+    изменение slug и удаление сбрасывают кэш.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.category = Category.objects.create(category_name='Категория', slug='category')
+
+    def test_resolve_is_cached(self):
+        self.assertEqual(slugs.categories.resolve('category'), self.category.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(slugs.categories.resolve('category'), self.category.pk)
+
+    def test_unknown_slug_is_cached(self):
+        self.assertIsNone(slugs.categories.resolve('unknown'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(slugs.categories.resolve('unknown'))
+            self.assertIsNone(slugs.categories.resolve('x' * 100))
+
+    def test_slug_change_invalidates(self):
+        slugs.categories.resolve('category')
+        slugs.categories.resolve('renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.slug = 'renamed'
+            self.category.save()
+        self.assertIsNone(slugs.categories.resolve('category'))
+        self.assertEqual(slugs.categories.resolve('renamed'), self.category.pk)
+
+    def test_delete_invalidates(self):
+        slugs.categories.resolve('category')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertIsNone(slugs.categories.resolve('category'))
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+    def test_new_object_replaces_cached_miss(self):
+        self.addCleanup(tasks.views.discard)
+        self.assertIsNone(slugs.products.resolve('new-product'))
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                product_name='Новый товар', slug='new-product', product_price=1, product_category=self.category,
+            )
+        self.assertEqual(slugs.products.resolve('new-product'), product.pk)
+        self.assertEqual(self.client.get('/product/new-product/').status_code, 200)
+
+    def test_unknown_category_is_not_found(self):
+        self.assertEqual(self.client.get('/category/unknown/').status_code, 404)
+
+
+def async_urlconf():
+    """
+    URLconf проекта с асинхронными представлениями каталога и корзины. Настройка
+    ASYNC_VIEWS читается при импорте app/urls.py, поэтому модуль выполняется заново
+    в отдельный объект, не заменяя app.urls в sys.modules.
+    """
+    spec = importlib.util.find_spec('app.urls')
+    module = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_VIEWS=True):
+        spec.loader.exec_module(module)
+    urlconf = types.ModuleType('async_urls')
+    urlconf.urlpatterns = [path('', include(module))]
+    return urlconf
+
+
+@override_settings(
+    ROOT_URLCONF=async_urlconf(),
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    VIEW_COUNT_FLUSH_INTERVAL=3600,
+)
+class AsyncViewsTests(TestCase):
+    """
+    Асинхронные представления (ASYNC_VIEWS) под AsyncClient.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.products = create_catalog(3)
+        self.user = create_customer(2, self.products[:2])
+        self.addCleanup(tasks.views.discard)
+
+    async def test_urlconf_uses_async_views(self):
+        response = await self.async_client.get('/')
+        self.assertIs(response.resolver_match.func.view_class, async_views.MainPage)
+
+    async def test_catalog_pages(self):
+        response = await self.async_client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([category.slug for category in response.context['categories']], ['root-0', 'root-1', 'root-2'])
+
+        response = await self.async_client.get('/category/root-0/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 3)
+        response = await self.async_client.get('/category/root-0/?type=subcategory')
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertEqual((await self.async_client.get('/category/root-0/?page=100')).status_code, 404)
+        self.assertEqual((await self.async_client.get('/category/unknown/')).status_code, 404)
+
+        response = await self.async_client.get('/product/product-1/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'].pk, self.products[1].pk)
+        self.assertEqual(tasks.views.counts, {self.products[1].pk: 1})
+        self.assertEqual((await self.async_client.get('/product/unknown/')).status_code, 404)
+
+    async def test_search(self):
+        for url, found in (('/search/?q=Товар 2', 1), ('/search/?q=', 0), ('/search/', 0)):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['products']), found)
+
+    async def test_cart(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['order_products']), 2)
+
+        response = await self.async_client.get(f'/to_cart/{self.products[2].pk}/add/')
+        self.assertRedirects(response, '/cart/', fetch_redirect_response=False)
+        response = await self.async_client.get('/cart/')
+        self.assertEqual(response.context['cart_total_quantity'], 3)
+        self.assertEqual((await self.async_client.get(f'/to_cart/{self.products[2].pk}/buy/')).status_code, 404)
+
+    async def test_guest_cart(self):
+        response = await self.async_client.get(f'/to_cart/{self.products[0].pk}/add/')
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get('/cart/')
+        self.assertEqual(response.context['cart_total_quantity'], 1)
+
+
+# Реплика для ReplicaRoutingTests - отдельный файл SQLite. Псевдоним добавляется
+# при импорте модуля, до подготовки тестовых баз: тестовый запуск создаёт
+# и удаляет её, как любую базу из DATABASES
+REPLICA_ALIAS = 'replica_test'
+REPLICA_PATH = os.path.join(tempfile.gettempdir(), f'eshop-test-replica-{os.getpid()}.sqlite3')
+connections.settings.setdefault(REPLICA_ALIAS, connections.configure_settings({
+    'default': {},
+    REPLICA_ALIAS: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'NAME': REPLICA_PATH},
+    },
+})[REPLICA_ALIAS])
+
+
+@override_settings(REPLICA_DATABASES=[REPLICA_ALIAS], VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ReplicaRoutingTests(TestCase):
+    """
+    Чтение каталога из реплики и запись в основную базу на двух файлах SQLite:
+    реплика - отдельный файл со своей копией каталога, которая отличается
+    наименованием товара, поэтому по странице видно, из какой базы она прочитана.
+    """
+    databases = {'default', REPLICA_ALIAS}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_catalog(1)[0]
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_write', return_value=REPLICA_ALIAS):
+            create_catalog(1)
+        Product.objects.using(REPLICA_ALIAS).update(product_name='Товар из реплики')
+
+    def setUp(self):
+        clear_caches()
+
+    def test_catalog_reads_from_replica(self):
+        response = self.client.get('/product/product-0/')
+        self.assertContains(response, 'Товар из реплики')
+        self.assertNotIn('primary_pin', response.cookies)
+
+    def test_pinned_client_reads_from_primary(self):
+        self.client.cookies['primary_pin'] = '1'
+        response = self.client.get('/product/product-0/')
+        self.assertContains(response, 'Товар 0')
+        self.assertNotContains(response, 'Товар из реплики')
+
+    def test_writes_go_to_primary(self):
+        use_replica()
+        try:
+            self.assertEqual(Product.objects.get(pk=self.product.pk).product_name, 'Товар из реплики')
+            Product.objects.filter(pk=self.product.pk).update(product_quantity=7)
+        finally:
+            use_primary()
+        self.assertEqual(Product.objects.using('default').get(pk=self.product.pk).product_quantity, 7)
+        self.assertEqual(Product.objects.using(REPLICA_ALIAS).get(pk=self.product.pk).product_quantity, 1000)
+
+        # Изменяющий запрос закрепляет клиента за основной базой
+        response = self.client.post(
+            '/cart/api/',
+            json.dumps({'action': 'add', 'product_id': self.product.pk}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('primary_pin', response.cookies)
+
+
+class FeedTests(TestCase):
+    """
+    Товарный фид: путь категории, первое изображение и адрес товара, сжатие gzip.
+    """
+
+    def setUp(self):
+        root = Category.objects.create(category_name='Одежда', slug='clothes')
+        child = Category.objects.create(category_name='Куртки', slug='jackets', parent=root)
+        self.product = Product.objects.create(
+            product_name='Куртка "Север"',
+            slug='jacket',
+            product_price=Decimal('1999.90'),
+            product_quantity=3,
+            product_category=child,
+        )
+        Gallery.objects.create(image='products/first.jpg', product=self.product)
+        Gallery.objects.create(image='products/second.jpg', product=self.product)
+        Product.objects.create(product_name='Без страницы', product_price=1, product_category=child)
+
+    def test_csv(self):
+        response = self.client.get('/feed.csv')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows, [{
+            'id': str(self.product.pk),
+            'name': 'Куртка "Север"',
+            'price': '1999.90',
+            'stock': '3',
+            'category': 'Одежда > Куртки',
+            'image': 'http://testserver/media/products/first.jpg',
+            'url': 'http://testserver/product/jacket/',
+        }])
+
+    def test_yml_gzip(self):
+        response = self.client.get('/feed.yml.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('<name>Куртка "Север"</name><count>3</count>', content)
+        self.assertIn(f'<offer id="{self.product.pk}" available="true">', content)
+        self.assertEqual(content.count('<offer '), 1)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/feed.json').status_code, 404)
+
+
+class StaticAssetsTests(TestCase):
+    """
+    Сборка статики (app/assets.py) на маленьких файлах: бандлы с хэшем содержимого,
+    сжатые варианты и их раздача StaticFilesMiddleware.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = os.path.join(directory.name, 'source')
+        self.root = os.path.join(directory.name, 'static')
+        os.makedirs(os.path.join(self.source, 'css'))
+        self.write('css/base.css', '/* Основа */\nbody {\n    color: red;\n}\n')
+        self.write('css/page.css', '.page  >  a { margin : 0 ; }\n' * 200)
+        settings_override = self.settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_BUNDLES={'css/bundle.css': ['css/base.css', 'css/page.css']},
+            STORAGES={
+                **settings.STORAGES,
+                'staticfiles': {'BACKEND': 'app.assets.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, content):
+        with open(os.path.join(self.source, name), 'w', encoding='utf-8') as file:
+            file.write(content)
+
+    def collect(self):
+        """ Собирает статику и возвращает имя бандла с хэшем """
+        call_command('collectstatic', interactive=False, clear=True, verbosity=0)
+        return staticfiles_storage.stored_name('css/bundle.css')
+
+    def test_bundle_is_minified_and_hashed(self):
+        name = self.collect()
+        self.assertRegex(name, r'^css/bundle\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, name), encoding='utf-8') as file:
+            content = file.read()
+        self.assertTrue(content.startswith('body{color: red}\n.page > a{margin : 0}.page'))
+
+        # Тот же источник - то же имя, изменённый - другое
+        self.assertEqual(self.collect(), name)
+        self.write('css/base.css', 'body { color: blue; }\n')
+        self.assertNotEqual(self.collect(), name)
+
+    def test_compressed_variants(self):
+        name = self.collect()
+        path = os.path.join(self.root, name)
+        with open(path, 'rb') as file, gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), file.read())
+        self.assertEqual(os.path.exists(path + '.br'), brotli_module() is not None)
+        # Маленький файл сжатием почти не уменьшается, вариант .gz для него не сохраняется
+        self.assertFalse(os.path.exists(os.path.join(self.root, staticfiles_storage.stored_name('css/base.css')) + '.gz'))
+
+    def test_middleware_serves_compressed_variant(self):
+        name = self.collect()
+        middleware = StaticFilesMiddleware(lambda request: HttpResponse('Не статика'))
+        url = f'/static/{name}'
+
+        response = middleware(RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('Content-Disposition', response)
+        with open(os.path.join(self.root, name), 'rb') as file:
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), file.read())
+        response.close()
+
+        # Разные варианты файла имеют разные ETag
+        etag = response['ETag']
+        response = middleware(RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip;q=0', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        response.close()
+        response = middleware(RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+
+        response = middleware(RequestFactory().get('/static/css/base.css'))
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.STATIC_MAX_AGE}')
+        response.close()
+        self.assertEqual(middleware(RequestFactory().get('/cart/')).content.decode(), 'Не статика')
+
+
+class CompressionTests(TestCase):
+    """
+    Сжатие ответов CompressionMiddleware: выбор кодировки по Accept-Encoding,
+    пропускаемые ответы, потоковые ответы и дополнение против BREACH.
+    """
+    content = ('<p>Товар: куртка, цена 100</p>\n' * 200).encode()
+
+    def compress(self, response, accept_encoding='gzip, deflate, br;q=0'):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_accepted_encodings(self):
+        for header, expected in (
+            ('gzip, deflate, br', {'gzip', 'deflate', 'br'}),
+            ('GZIP;q=0.5, br;q=0', {'gzip'}),
+            ('gzip;q=0.0, *', {'*'}),
+            ('gzip;q=abc', set()),
+            ('', set()),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(accepted_encodings(header), expected)
+
+    def test_gzip_with_random_padding(self):
+        response = self.compress(HttpResponse(self.content, headers={'ETag': '"v1"'}))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertTrue(response.content[3] & gzip.FNAME)
+        self.assertEqual(gzip.decompress(response.content), self.content)
+        lengths = {len(self.compress(HttpResponse(self.content)).content) for _ in range(20)}
+        self.assertGreater(len(lengths), 1)
+
+    def test_skipped_responses(self):
+        cases = (
+            ('q=0', HttpResponse(self.content), 'gzip;q=0, br;q=0', 'Accept-Encoding'),
+            ('короткий', HttpResponse(b'<p>ok</p>'), 'gzip', None),
+            ('изображение', HttpResponse(self.content, content_type='image/png'), 'gzip', None),
+            ('уже сжат', HttpResponse(self.content, headers={'Content-Encoding': 'br'}), 'gzip', None),
+        )
+        for name, response, accept_encoding, vary in cases:
+            with self.subTest(name):
+                response = self.compress(response, accept_encoding)
+                self.assertEqual(response.content, self.content if name != 'короткий' else b'<p>ok</p>')
+                self.assertEqual(response.get('Content-Encoding'), 'br' if name == 'уже сжат' else None)
+                self.assertEqual(response.get('Vary'), vary)
+
+    @override_settings(COMPRESSION_STREAM_FLUSH_SIZE=16 * 1024)
+    def test_streaming_is_flushed_by_size(self):
+        chunks = [f'{number:06d},Товар {number},100\n'.encode() for number in range(5000)]
+        response = self.compress(StreamingHttpResponse(iter(chunks), content_type='text/csv'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response)
+        parts = list(response.streaming_content)
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+        # Сброс не после каждой строки, а примерно после каждых 16 КБ
+        self.assertLess(len(parts), len(b''.join(chunks)) // (8 * 1024))
+
+    def test_csrf_pages_are_not_compressed_with_brotli(self):
+        response = HttpResponse(self.content)
+        response.set_cookie(settings.CSRF_COOKIE_NAME, 'token')
+        with mock.patch.object(CompressionMiddleware, 'select_encoding', return_value=None) as select:
+            self.compress(response, 'br, gzip')
+        self.assertIsNone(select.call_args.args[1]['br'])
+        self.assertEqual(select.call_args.args[1]['gzip'], 6)
+
+
+@override_settings(SESSION_ENGINE='app.sessions')
+class SignedCookieSessionTests(TestCase):
+    """
+    Сессии в подписанной cookie (app/sessions.py) и перенос в них сессий из базы.
+    """
+
+    def setUp(self):
+        self.product = create_catalog(1)[0]
+        legacy = db_sessions.SessionStore()
+        legacy['cart'] = {str(self.product.pk): 2}
+        legacy.create()
+        self.legacy_key = legacy.session_key
+
+    def test_cookie_round_trip(self):
+        session = CookieSessionStore()
+        session['cart'] = {str(self.product.pk): 3}
+        session.save()
+        self.assertIn(':', session.session_key)
+        self.assertEqual(CookieSessionStore(session.session_key).load(), {'cart': {str(self.product.pk): 3}})
+        # Изменённая cookie не принимается
+        self.assertEqual(CookieSessionStore(session.session_key[:-1] + 'x').load(), {})
+
+    def test_legacy_db_session_is_moved_to_cookie(self):
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = self.legacy_key
+        response = self.client.get('/cart/api/')
+        self.assertEqual(response.json()['cart']['total_quantity'], 2)
+        cookie = response.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertNotEqual(cookie, self.legacy_key)
+        self.assertEqual(CookieSessionStore(cookie).load(), {'cart': {str(self.product.pk): 2}})
+
+        # Следующие запросы обходятся без базы сессий
+        with self.assertNumQueries(0):
+            self.assertEqual(CookieSessionStore(cookie).load()['cart'], {str(self.product.pk): 2})
+
+    async def test_legacy_db_session_async(self):
+        self.assertEqual(await CookieSessionStore(self.legacy_key).aload(), {'cart': {str(self.product.pk): 2}})
+        self.assertEqual(await CookieSessionStore('unknownkey').aload(), {})
+
+
+class CatalogImportTests(TestCase):
+    """
+    Пакетный импорт товаров: генерация slug и строки с ошибками.
+    """
+
+    def test_generated_slugs_and_bad_price(self):
+        category = Category.objects.create(category_name='Категория', slug='category')
+        Product.objects.create(product_name='Товар 0', slug='tovar-0', product_price=1, product_category=category)
+        rows = [{'name': f'Товар {number}', 'category': 'category', 'price': '10'} for number in range(1200)]
+        rows.append({'slug': 'bad-price', 'name': 'Ошибка', 'category': 'category', 'price': '12,5'})
+        messages = []
+        processed = CatalogImporter(batch_size=1000, report=messages.append).run(iter(rows))
+        self.assertEqual(processed, 1201)
+        self.assertEqual(Product.objects.count(), 1201)
+        self.assertTrue(Product.objects.filter(slug='tovar-0-2').exists())
+        self.assertFalse(Product.objects.filter(slug='bad-price').exists())
+        self.assertIn("Товар bad-price: некорректная цена '12,5', пропущен", messages)
+
+    def test_bad_quantity_and_size(self):
+        Category.objects.create(category_name='Категория', slug='category')
+        rows = [
+            {'slug': 'good', 'name': 'Товар', 'category': 'category', 'quantity': '3', 'size': '1,5'},
+            {'slug': 'bad-quantity', 'name': 'Товар', 'category': 'category', 'quantity': '2.5'},
+            {'slug': 'bad-size', 'name': 'Товар', 'category': 'category', 'size': 'XL'},
+        ]
+        messages = []
+        CatalogImporter(report=messages.append).run(iter(rows))
+        product = Product.objects.get()
+        self.assertEqual((product.slug, product.product_quantity, product.product_size), ('good', 3, 1.5))
+        self.assertIn("Товар bad-quantity: некорректное количество '2.5', пропущен", messages)
+        self.assertIn("Товар bad-size: некорректный размер 'XL', пропущен", messages)
+
+    def test_resume_keeps_pending_parents(self):
+        rows = [
+            {'slug': 'child', 'name': 'Дочерняя', 'parent': 'root'},
+            {'slug': 'other', 'name': 'Другая'},
+            {'slug': 'root', 'name': 'Корневая'},
+        ]
+
+        def interrupted():
+            yield from rows[:2]
+            raise KeyboardInterrupt
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = Checkpoint(os.path.join(directory, 'checkpoint.json'), source='categories.csv')
+            with self.assertRaises(KeyboardInterrupt):
+                CatalogImporter(batch_size=2).run(interrupted(), model='category', checkpoint=checkpoint)
+            skip, pending_parents = checkpoint.load()
+            self.assertEqual((skip, pending_parents), (2, {'child': 'root'}))
+            CatalogImporter(batch_size=2).run(
+                iter(rows), model='category', skip=skip, checkpoint=checkpoint, pending_parents=pending_parents,
+            )
+        self.assertEqual(Category.objects.get(slug='child').parent.slug, 'root')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CartApiTests(TestCase):
+    """
+    JSON API корзины: ответы на некорректные операции и ограничение остатком на складе.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.product = create_catalog(1)[0]
+        self.user = create_customer(0, [])
+
+    def post(self, payload):
+        body = payload if isinstance(payload, (str, bytes)) else json.dumps(payload)
+        return self.client.post('/cart/api/', body, content_type='application/json')
+
+    # Гость и пользователь шлют запросы с одного адреса: вместе они превышают лимит cart_api
+    @override_settings(RATELIMITS={})
+    def test_invalid_operations(self):
+        pk = self.product.pk
+        cases = (
+            ('не JSON', 400, 'Некорректный JSON'),
+            (b'\xff\xfe{', 400, 'Некорректный JSON'),
+            ([], 400, 'Ожидается JSON-объект'),
+            ({'action': 'buy', 'product_id': pk}, 400, 'Неизвестное действие: buy'),
+            ({'action': 'add'}, 400, 'product_id должен быть целым числом'),
+            ({'action': 'add', 'product_id': '1'}, 400, 'product_id должен быть целым числом'),
+            ({'action': 'set', 'product_id': pk}, 400, 'quantity должно быть целым числом'),
+            ({'action': 'set', 'product_id': pk, 'quantity': '3'}, 400, 'quantity должно быть целым числом'),
+            ({'action': 'set', 'product_id': pk, 'quantity': -1}, 400, 'Количество не может быть отрицательным'),
+            ({'action': 'set', 'product_id': pk, 'quantity': 2 ** 40}, 400, 'quantity не может быть больше 2147483647'),
+            ({'action': 'add', 'product_id': 2 ** 70}, 404, f'Товар не найден: {2 ** 70}'),
+            ({'operations': 'add'}, 400, 'Ожидается непустой список операций'),
+            ({'operations': ['add']}, 400, 'Операция должна быть объектом'),
+            ({'action': 'add', 'product_id': 999999}, 404, 'Товар не найден: 999999'),
+            # Ошибка в пачке отменяет и предыдущие операции
+            ({'operations': [
+                {'action': 'add', 'product_id': pk},
+                {'action': 'add', 'product_id': 999999},
+            ]}, 404, 'Товар не найден: 999999'),
+        )
+        for authenticated in (False, True):
+            if authenticated:
+                self.client.force_login(self.user)
+            for payload, status, error in cases:
+                with self.subTest(authenticated=authenticated, payload=payload):
+                    response = self.post(payload)
+                    self.assertEqual(response.status_code, status)
+                    self.assertEqual(response.json(), {'error': error})
+            self.assertEqual(self.client.get('/cart/api/').json()['cart']['total_quantity'], 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.product_quantity, 1000)
+
+    def test_totals_without_order(self):
+        # Строка удалённого заказа (order = NULL) не попадает в итоги пользователя без корзины
+        OrderProduct.objects.create(product=self.product, quantity=7, unit_price=10, total_price=70)
+        Order.objects.filter(customer__user=self.user).delete()
+        self.client.force_login(self.user)
+        self.assertEqual(
+            self.client.get('/cart/api/').json()['cart'],
+            {'total_quantity': 0, 'total_price': '0.00'},
+        )
+
+    def test_quantity_is_capped_by_stock(self):
+        self.client.force_login(self.user)
+        response = self.post({'action': 'set', 'product_id': self.product.pk, 'quantity': 5000})
+        self.assertEqual(response.status_code, 200)
+        line = response.json()['lines'][0]
+        self.assertEqual((line['quantity'], line['in_stock']), (1000, 0))
+        # Склад пуст: добавить больше нельзя, строка корзины не меняется
+        line = self.post({'action': 'add', 'product_id': self.product.pk}).json()['lines'][0]
+        self.assertEqual((line['quantity'], line['in_stock']), (1000, 0))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class GuestCartMergeTests(TestCase):
+    """
+    Перенос корзины гостя из сессии в заказ пользователя при входе.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.products = create_catalog(3)
+        self.user = create_customer(0, self.products[:1])
+
+    def add(self, product, quantity):
+        self.client.post(
+            '/cart/api/',
+            json.dumps({'action': 'set', 'product_id': product.pk, 'quantity': quantity}),
+            content_type='application/json',
+        )
+
+    def test_merge_on_login(self):
+        first, second, third = self.products
+        self.add(first, 3)
+        self.add(second, 5)
+        self.add(third, 2)
+        # Пока гость выбирал, остаток второго товара уменьшился, третий закончился
+        Product.objects.filter(pk=second.pk).update(product_quantity=4)
+        Product.objects.filter(pk=third.pk).update(product_quantity=0)
+
+        response = self.client.post('/login', {'username': 'customer', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+
+        order = Order.objects.get(customer__user=self.user, is_completed=False)
+        # Количество складывается со строкой заказа и ограничивается остатком
+        self.assertEqual(
+            dict(order.ordered.values_list('product_id', 'quantity')),
+            {first.pk: 4, second.pk: 4},
+        )
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'product_quantity')),
+            {first.pk: 997, second.pk: 0, third.pk: 0},
+        )
+        self.assertEqual(self.client.session['cart'], {})
+        self.assertEqual(self.client.get('/cart/api/').json()['cart']['total_quantity'], 8)
+
+    def test_empty_guest_cart_keeps_order(self):
+        self.client.post('/login', {'username': 'customer', 'password': 'password'})
+        order = Order.objects.get(customer__user=self.user, is_completed=False)
+        self.assertEqual(dict(order.ordered.values_list('product_id', 'quantity')), {self.products[0].pk: 1})
+        self.assertNotIn('cart', self.client.session)
+
+
+class BulkEditTests(TestCase):
+    """
+    Массовое изменение товаров.
+    """
+
+    def test_write_off_stops_at_zero(self):
+        products = create_catalog(2)
+        Product.objects.filter(pk=products[0].pk).update(product_quantity=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = utils.bulk_update_products(Product.objects.all(), {'restock': -5})
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('product_quantity', flat=True)),
+            [0, 995],
+        )
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_large_selection_is_queued(self):
+        products = create_catalog(3)
+        admin_user = User.objects.create_superuser('admin', password='password')
+        self.client.force_login(admin_user)
+        data = {
+            'action': 'bulk_edit',
+            'apply': '1',
+            ACTION_CHECKBOX_NAME: [product.pk for product in products],
+            'price_percent': '10.5',
+            'restock': '5',
+        }
+        with mock.patch.object(ProductAdmin, 'bulk_edit_chunk_size', 2):
+            response = self.client.post('/admin/app/product/', data, follow=True)
+            self.assertContains(response, 'Изменение товаров (3) поставлено в очередь фоновых задач')
+            self.assertEqual(Product.objects.filter(product_quantity=1005).count(), 0)
+            with self.captureOnCommitCallbacks(execute=True):
+                for task in taskqueue.claim('test', 10):
+                    taskqueue.execute(task)
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('product_price', 'product_quantity')),
+            [(Decimal('110.50'), 1005), (Decimal('111.61'), 1005), (Decimal('112.71'), 1005)],
+        )
+
+    def test_form_limits(self):
+        form = ProductBulkEditForm(data={'price_percent': '5000', 'restock': '10000000'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('price_percent', form.errors)
+        self.assertIn('restock', form.errors)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CatalogApiTests(TestCase):
+    """
+    JSON API каталога: выборочные поля, курсорная пагинация, ETag из версий данных.
+    """
+
+    def setUp(self):
+        clear_caches()
+        root = Category.objects.create(category_name='Одежда', slug='clothes')
+        self.category = Category.objects.create(category_name='Куртки', slug='jackets', parent=root)
+        self.products = Product.objects.bulk_create([
+            Product(
+                product_name=f'Куртка {number}',
+                slug=f'jacket-{number}',
+                product_price=Decimal(number % 3),
+                product_quantity=number,
+                product_category=self.category,
+            )
+            for number in range(7)
+        ])
+
+    def test_categories_tree(self):
+        data = self.client.get('/api/categories/').json()['results']
+        self.assertEqual([node['slug'] for node in data], ['clothes'])
+        self.assertEqual([node['slug'] for node in data[0]['children']], ['jackets'])
+
+    def test_sparse_fields_skip_text_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/?category=clothes&fields=id,price')
+        self.assertEqual(response.json()['results'][0], {'id': self.products[0].pk, 'price': '0.00'})
+        self.assertNotIn('product_description', ' '.join(query['sql'] for query in queries))
+
+        detail = self.client.get('/api/products/jacket-1/?fields=name,description').json()
+        self.assertEqual(detail, {'name': 'Куртка 1', 'description': 'Здесь скоро будет описание...'})
+
+    def test_cursor_pagination(self):
+        seen, cursor = [], ''
+        while True:
+            data = self.client.get(f'/api/products/?sort=-price&limit=3&fields=id,price&cursor={cursor}').json()
+            seen.extend(data['results'])
+            if not data['next']:
+                break
+            cursor = data['next']
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(
+            [(item['price'], item['id']) for item in seen],
+            sorted(((item['price'], item['id']) for item in seen), reverse=True),
+        )
+        self.assertEqual(self.client.get('/api/products/?cursor=broken').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/?fields=id,unknown').status_code, 400)
+
+    def test_etag(self):
+        response = self.client.get('/api/products/?fields=id,name')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/?fields=id,name', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Операция с корзиной меняет остатки: меняется ETag ответов с полем quantity
+        stock_etag = self.client.get('/api/products/?fields=id,quantity')['ETag']
+        self.client.force_login(create_customer(0, []))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/cart/api/',
+                json.dumps({'action': 'add', 'product_id': self.products[1].pk}),
+                content_type='application/json',
+            )
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/products/?fields=id,name')['ETag'], etag)
+        self.assertNotEqual(self.client.get('/api/products/?fields=id,quantity')['ETag'], stock_etag)
+
+        catalog_changed.send(sender=Product, pks=None)
+        self.assertNotEqual(self.client.get('/api/products/?fields=id,name')['ETag'], etag)
+
+    def test_admin_write_bumps_etag(self):
+        url = f'/api/products/{self.products[1].slug}/?fields=price'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/app/product/', {
+                'action': 'bulk_edit',
+                'apply': '1',
+                ACTION_CHECKBOX_NAME: [self.products[1].pk],
+                'price_percent': '10',
+            })
+        self.client.logout()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), {'price': '1.10'})
+
+
+class RateLimitTests(TestCase):
+    """
+    Ограничение частоты запросов: запас для всплеска, пополнение, ответ 429.
+    """
+
+    def setUp(self):
+        clear_caches()
+
+    def test_burst_and_refill(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, burst=3)
+        self.assertEqual([bucket.consume('ip:1', now=1000) for _ in range(3)], [0, 0, 0])
+        retry_after = bucket.consume('ip:1', now=1000)
+        self.assertGreater(retry_after, 0)
+        # Другой клиент расходует свою корзину
+        self.assertEqual(bucket.consume('ip:2', now=1000), 0)
+        # Отклонённые запросы токены не расходуют: после Retry-After запрос проходит
+        self.assertEqual(bucket.consume('ip:1', now=1000 + retry_after), 0)
+
+    def test_average_rate(self):
+        bucket = ratelimit.TokenBucket('test', rate=2, burst=4)
+        allowed = sum(not bucket.consume('ip:1', now=1000 + step / 10) for step in range(300))
+        # За 30 секунд: запас 4 и 2 запроса в секунду (оценка окнами допускает неточность)
+        self.assertLessEqual(allowed, 4 + 2 * 30 + 2)
+        self.assertGreaterEqual(allowed, 2 * 30 - 2)
+
+    @override_settings(RATELIMITS={'search': (1, 2)})
+    def test_too_many_requests(self):
+        statuses = [self.client.get('/search/?q=x').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.client.get('/search/?q=x')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.client.get('/search/?q=x', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(RATELIMITS={'search': (1, 2)})
+    def test_users_share_ip_limit(self):
+        first = User.objects.create_user(username='first')
+        second = User.objects.create_user(username='second')
+        self.client.force_login(first)
+        self.assertEqual(self.client.get('/search/?q=x').status_code, 200)
+        self.client.force_login(second)
+        self.assertEqual(self.client.get('/search/?q=x').status_code, 200)
+        # Новая учётная запись с того же адреса не получает новый запас
+        self.client.force_login(User.objects.create_user(username='third'))
+        self.assertEqual(self.client.get('/search/?q=x').status_code, 429)
+        # Отказ по IP не расходует запас пользователя: с другого адреса он цел
+        self.client.force_login(second)
+        statuses = [self.client.get('/search/?q=x', REMOTE_ADDR='10.0.0.2').status_code for _ in range(2)]
+        self.assertEqual(statuses, [200, 429])
+
+    def test_refund_on_rejection(self):
+        bucket = ratelimit.TokenBucket('test', rate=1, burst=1)
+        self.assertEqual(bucket.consume('ip:1', now=1000), 0)
+        self.assertGreater(bucket.consume_all(['user:1', 'ip:1'], now=1000), 0)
+        self.assertEqual(bucket.consume('user:1', now=1000), 0)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CartPriceTests(TestCase):
+    """
+    Цена строки заказа запоминается при добавлении товара и меняется только пересчётом.
+    """
+
+    def test_price_snapshot_and_reprice(self):
+        products = create_catalog(2)
+        user = create_customer(0, [])
+        self.client.force_login(user)
+        for product in products:
+            self.client.post(
+                '/cart/api/',
+                json.dumps({'action': 'set', 'product_id': product.pk, 'quantity': 2}),
+                content_type='application/json',
+            )
+        Product.objects.filter(pk=products[0].pk).update(product_price=Decimal('150.50'))
+
+        order = Order.objects.get(customer__user=user)
+        # Итоги считаются по таблице строк заказа, без соединения с товарами
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(order.get_cart_total_price, Decimal('402.00'))
+        self.assertNotIn('app_product', captured.captured_queries[0]['sql'])
+
+        completed = Order.objects.create(customer=order.customer, is_completed=True)
+        OrderProduct.objects.create(order=completed, product=products[0], unit_price=100, total_price=100, quantity=1)
+
+        self.assertEqual(utils.reprice_cart_lines(), 1)
+        line = order.ordered.get(product=products[0])
+        self.assertEqual((line.unit_price, line.total_price), (Decimal('150.50'), Decimal('301.00')))
+        self.assertEqual(order.get_cart_total_price, Decimal('503.00'))
+        self.assertEqual(completed.get_cart_total_price, Decimal('100.00'))
+
+
+class RecommendationTests(TestCase):
+    """
+    Похожие товары: расчёт на чистом Python и разреженными матрицами, замена
+    популярными товарами категории, если соседей нет.
+    """
+
+    def setUp(self):
+        self.products = create_catalog(5)
+        a, b, c, d = self.products[:4]
+        users = [User.objects.create_user(username=f'user-{number}') for number in range(2)]
+        for user, basket in zip(users, ((a, b), (a, b, c))):
+            order = Order.objects.create(customer=Customer.objects.create(user=user))
+            OrderProduct.objects.bulk_create([OrderProduct.for_product(product, 1, order=order) for product in basket])
+        FavoriteProduct.objects.bulk_create([
+            FavoriteProduct(user=users[0], product=product) for product in (a, c, d)
+        ])
+
+    def test_python_scores(self):
+        a, b, c, d = (product.pk for product in self.products[:4])
+        neighbours = recommendations.compute_neighbours(top_k=2, vectorized=False)
+        # Нормы столбцов: a - 1 + 1 + 0.25, b - 2, c - 1 + 0.25, d - 0.25
+        self.assertEqual(neighbours[a], [
+            (b, round(2 / math.sqrt(2.25 * 2), 9)),
+            (c, round(1.25 / math.sqrt(2.25 * 1.25), 9)),
+        ])
+        self.assertEqual(neighbours[d], [
+            (c, round(0.25 / math.sqrt(0.25 * 1.25), 9)),
+            (a, round(0.25 / math.sqrt(0.25 * 2.25), 9)),
+        ])
+
+    @unittest.skipIf(recommendations.sparse_modules()[1] is None, 'NumPy и SciPy не установлены')
+    def test_sparse_matches_python(self):
+        for top_k in (1, 2, 10):
+            with self.subTest(top_k=top_k):
+                self.assertEqual(
+                    recommendations.compute_neighbours(top_k=top_k, vectorized=True),
+                    recommendations.compute_neighbours(top_k=top_k, vectorized=False),
+                )
+
+    def test_fallback_to_popular_in_category(self):
+        a, b, c, d, e = self.products
+        Product.objects.filter(pk=e.pk).update(product_watched=10)
+        Product.objects.filter(pk=c.pk).update(product_watched=5)
+        self.assertEqual(recommendations.get_similar_products(a), [e, c, b])
+
+        recommendations.store_neighbours(recommendations.compute_neighbours(vectorized=False))
+        self.assertEqual(recommendations.get_similar_products(a), [b, c, d])
+        self.assertEqual(recommendations.get_similar_products(e), [c, a, b])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LeaderboardTests(TestCase):
+    """
+    Рейтинг популярности: покупки оплаченных заказов, переход в новую эпоху
+    без переполнения множителя.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.products = create_catalog(2)
+        patcher = mock.patch.object(leaderboard, 'renormalised_era', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_paid_order_is_completed_and_counted(self):
+        user = create_customer(2, self.products)
+        self.client.force_login(user)
+        order = Order.objects.get()
+        self.assertEqual(self.client.get('/success/').status_code, 200)
+        order.refresh_from_db()
+        self.assertTrue(order.is_completed)
+        self.assertEqual(order.ordered.count(), 2)
+        self.assertEqual(self.client.get('/cart/api/').json()['cart']['total_quantity'], 0)
+
+        self.client.get(f'/to_cart/{self.products[0].pk}/add/')
+        self.assertNotEqual(Order.objects.get(is_completed=False).pk, order.pk)
+
+        leaderboard.rebuild()
+        scores = dict(ProductPopularity.objects.values_list('product_id', 'score'))
+        self.assertAlmostEqual(scores[self.products[1].pk] / leaderboard.decay_factor(), 20, places=3)
+
+    def test_half_life_validation(self):
+        with self.settings(LEADERBOARD_HALF_LIFE_DAYS=0.001):
+            self.assertLess(leaderboard.decay_factor(leaderboard.EPOCH + 10 ** 9), 2 ** leaderboard.ERA_HALF_LIVES)
+        for value in (0, -1, float('nan')):
+            with self.subTest(value=value), self.settings(LEADERBOARD_HALF_LIFE_DAYS=value):
+                with self.assertRaises(ImproperlyConfigured):
+                    leaderboard.decay_factor()
+
+    def test_new_era_renormalises_scores(self):
+        first, second = (product.pk for product in self.products)
+        before = dict(ProductPopularity.objects.values_list('product_id', 'score'))
+        era = leaderboard.current_era() + 1
+        half_life = leaderboard.half_life()
+        now = leaderboard.EPOCH + era * half_life * leaderboard.ERA_HALF_LIVES + half_life
+        with mock.patch.object(leaderboard.time, 'time', return_value=now):
+            leaderboard.record(second, 'view')
+        scale = 2.0 ** -leaderboard.ERA_HALF_LIVES
+        self.assertEqual(set(ProductPopularity.objects.values_list('era', flat=True)), {era})
+        after = dict(ProductPopularity.objects.values_list('product_id', 'score'))
+        self.assertAlmostEqual(after[first], before[first] * scale)
+        self.assertAlmostEqual(after[second], before[second] * scale + 2)
+        self.assertEqual([product.pk for product in leaderboard.top_products(limit=2)], [second, first])
+
+
+FAILURES = []
+
+
+@taskqueue.task(name='tests.flaky', retry_delay=5)
+def flaky_task(fail_times):
+    """ Задача, завершающаяся ошибкой первые fail_times раз """
+    if len(FAILURES) < fail_times:
+        FAILURES.append(fail_times)
+        raise RuntimeError('Ошибка задачи')
+
+
+class TaskQueueTests(TestCase):
+    """
+    Очередь фоновых задач: уникальность, отложенный запуск, повторы с удвоением задержки.
+    Задачи выполняются в основном потоке: потоки пула не видят данных тестовой транзакции.
+    """
+
+    def setUp(self):
+        FAILURES.clear()
+        tasks.views.discard()
+
+    def tearDown(self):
+        tasks.views.discard()
+
+    def run_due(self):
+        total = 0
+        while claimed := taskqueue.claim('test-worker', 10):
+            for task in claimed:
+                taskqueue.execute(task)
+            total += len(claimed)
+        return total
+
+    def test_dedup_and_delay(self):
+        flaky_task.enqueue(dedup_key='flaky', fail_times=0)
+        flaky_task.enqueue(dedup_key='flaky', fail_times=0)
+        flaky_task.enqueue(delay=60, fail_times=0)
+        self.assertEqual(Task.objects.count(), 2)
+        self.assertEqual(taskqueue.stats()['due'], 1)
+        self.assertEqual(self.run_due(), 1)
+        # После выполнения задачу с тем же ключом снова можно поставить
+        flaky_task.enqueue(dedup_key='flaky', fail_times=0)
+        self.assertEqual(taskqueue.stats()['pending'], 2)
+
+    def test_retry_backoff(self):
+        flaky_task.enqueue(fail_times=10)
+        delays = []
+        with self.assertLogs('app.taskqueue', 'ERROR'):
+            for _ in range(settings.TASK_MAX_ATTEMPTS):
+                Task.objects.update(run_at=timezone.now())
+                started = timezone.now()
+                self.assertEqual(self.run_due(), 1)
+                task = Task.objects.get()
+                if task.status == Task.PENDING:
+                    delays.append(round((task.run_at - started).total_seconds()))
+        self.assertEqual(delays, [5, 10, 20, 40])
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIn('RuntimeError', task.last_error)
+        self.assertEqual(taskqueue.stats()['failed'], 1)
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+    def test_view_counts(self):
+        category = Category.objects.create(category_name='Категория', slug='category')
+        product = Product.objects.create(
+            product_name='Товар', slug='product', product_price=100, product_category=category,
+        )
+        for _ in range(3):
+            self.assertEqual(self.client.get('/product/product/').status_code, 200)
+        # Просмотры копятся в памяти, пока не пройдёт интервал записи
+        self.assertFalse(Task.objects.exists())
+        tasks.views.flush()
+        self.assertEqual(self.run_due(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.product_watched, 3)
+        self.assertEqual(leaderboard.top_products(limit=1)[0].pk, product.pk)
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600, VIEW_COUNT_FLUSH_SIZE=3)
+    def test_view_counts_flush_by_size(self):
+        tasks.views.record(1)
+        tasks.views.record(2)
+        self.assertFalse(Task.objects.exists())
+        tasks.views.record(1)
+        self.assertEqual(Task.objects.get().payload, {'counts': {'1': 2, '2': 1}})
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=0.05)
+    def test_view_counts_flush_by_timer(self):
+        # Новых просмотров нет, но таймер записывает накопленные
+        with mock.patch.object(tasks.record_views, 'enqueue') as enqueue:
+            tasks.views.record(5)
+            timer = tasks.views.timer
+            timer.join(5)
+        enqueue.assert_called_once_with(counts={'5': 1})
+        self.assertIsNone(tasks.views.timer)
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+    def test_view_counts_register_exit_flush_once(self):
+        # Запись при завершении регистрируется первым просмотром, а не импортом модуля
+        counter = tasks.ViewCounter()
+        with mock.patch('atexit.register') as register:
+            counter.add(1)
+            counter.discard()
+            counter.add(2)
+            counter.discard()
+        register.assert_called_once_with(counter.flush_in_background)
+
+
+def tearDownModule():
+    # Просмотры, накопленные тестами, не должны записываться при завершении процесса
+    tasks.views.discard()
@@ -1,22 +1,27 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+
+# Представления каталога и корзины: асинхронные под ASGI или синхронные
+catalog_views = async_views if settings.ASYNC_VIEWS else views
 
 
 urlpatterns = [
     path(
         '',
-        views.MainPage.as_view(),
+        catalog_views.MainPage.as_view(),
         name='index'
     ),
     path(
         'category/<slug:slug>/',
-        views.SubCategories.as_view(),
+        catalog_views.SubCategories.as_view(),
         name='category'
     ),
     path(
         'product/<slug:slug>/',
-        views.ProductPage.as_view(),
+        catalog_views.ProductPage.as_view(),
         name='product'
     ),
     path(
@@ -51,14 +56,19 @@ urlpatterns = [
     ),
     path(
         'cart/',
-        views.cart,
+        catalog_views.cart,
         name='cart',
     ),
     path(
         'to_cart/<int:product_id>/<str:action>/',
-        views.to_cart,
+        catalog_views.to_cart,
         name='to_cart',
     ),
+    path(
+        'cart/api/',
+        views.cart_api,
+        name='cart_api',
+    ),
     path(
         'checkout/',
         views.checkout,
@@ -76,7 +86,37 @@ urlpatterns = [
     ),
     path(
         'search/',
-        views.search,
+        catalog_views.search,
         name='search',
     ),
+    path(
+        'sitemap.xml',
+        views.sitemap_index,
+        name='sitemap_index',
+    ),
+    path(
+        'sitemap-<slug:section>-<int:page>.xml',
+        views.sitemap,
+        name='sitemap',
+    ),
+    path(
+        'feed.<str:file_format>',
+        views.product_feed,
+        name='product_feed',
+    ),
+    path(
+        'api/categories/',
+        views.api_categories,
+        name='api_categories',
+    ),
+    path(
+        'api/products/',
+        views.api_products,
+        name='api_products',
+    ),
+    path(
+        'api/products/<slug:slug>/',
+        views.api_product,
+        name='api_product',
+    ),
 ]
@@ -1,83 +1,600 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, FilteredRelation, OuterRef, Prefetch, Q, Subquery, Sum, prefetch_related_objects
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.utils import timezone
+
+from . import leaderboard, tasks
+from .catalog_io import batched
 from .models import Product, Order, OrderProduct, Customer
+from .signals import bump_stock_version, catalog_changed
 
 
-class CartForAuthenticatedUser:
+class CartError(Exception):
     """
-    Класс для управления корзиной покупок для аутентифицированных пользователей.
+    Ошибка операции с корзиной: неизвестное действие, товар не найден и т.п.
+    status - код ответа API корзины (404 для несуществующего товара).
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def cart_lines_queryset():
+    """
+    Строки заказа вместе с товарами и изображениями товаров для отображения корзины.
+    """
+    return OrderProduct.objects.select_related('product').prefetch_related('product__images')
+
+
+class BaseCart:
+    """
+    Общий интерфейс корзины для аутентифицированных пользователей и гостей.
+    Наследники реализуют get_cart_info, change_quantity, get_totals, empty и clear.
     """
 
     def __init__(self, request, product_id=None, action=None):
         """
-        Инициализация корзины для аутентифицированного пользователя.
+        Инициализация корзины; если переданы товар и действие, оно сразу выполняется.
         """
-        self.user = request.user
         if product_id and action:
             self.add_or_delete(
                 product_id=product_id,
                 action=action
             )
 
+    def add_or_delete(self, product_id, action):
+        """
+        Добавление, удаление или полное удаление продукта из корзины.
+        """
+        if action == 'add':
+            return self.change_quantity(product_id, delta=1)
+        if action == 'delete':
+            return self.change_quantity(product_id, delta=-1)
+        if action == 'remove':
+            return self.change_quantity(product_id, quantity=0)
+        raise CartError(f'Неизвестное действие: {action}')
+
+    def set_quantity(self, product_id, quantity):
+        """
+        Устанавливает количество товара в корзине.
+        Количество ограничивается остатком товара на складе.
+        """
+        if quantity < 0:
+            raise CartError('Количество не может быть отрицательным')
+        return self.change_quantity(product_id, quantity=quantity)
+
+    def rollback(self):
+        """
+        Отменяет несохранённые в базе изменения после ошибки в пачке операций.
+        Изменения корзины в базе отменяет откат транзакции.
+        """
+
+
+class CartForAuthenticatedUser(BaseCart):
+    """
+    Класс для управления корзиной покупок для аутентифицированных пользователей.
+    """
+
+    session_key = 'cart_ids'
+
+    def __init__(self, request, product_id=None, action=None):
+        """
+        Инициализация корзины для аутентифицированного пользователя.
+        """
+        self.user = request.user
+        self.session = request.session
+        super().__init__(request, product_id, action)
+
+    @staticmethod
+    def ids_queryset(user):
+        """
+        Запрос пары (id покупателя, id незавершённого заказа) одним соединением таблиц.
+        """
+        return (
+            Customer.objects
+            .filter(user=user)
+            .annotate(open_order=FilteredRelation(
+                'order',
+                condition=Q(order__is_completed=False),
+            ))
+            .values_list('pk', 'open_order__pk')
+        )
+
+    def load_ids(self):
+        """
+        Загружает из базы id покупателя и его незавершённого заказа и запоминает их в сессии.
+        """
+        customer_id, order_id = self.ids_queryset(self.user).first() or (None, None)
+        self.remember_ids(customer_id, order_id)
+        return customer_id, order_id
+
+    def remember_ids(self, customer_id, order_id):
+        """ Запоминает id покупателя и заказа-корзины в сессии """
+        self.session[self.session_key] = {
+            'user': self.user.pk,
+            'customer': customer_id,
+            'order': order_id,
+        }
+
+    def resolve_ids(self):
+        """
+        Возвращает (id покупателя, id незавершённого заказа) из сессии,
+        а при их отсутствии - из базы. Любой из id может быть None,
+        если покупатель или заказ ещё не созданы.
+        """
+        ids = self.session.get(self.session_key)
+        if ids and ids.get('user') == self.user.pk:
+            return ids['customer'], ids['order']
+        return self.load_ids()
+
+    def create_order(self, customer_id):
+        """
+        Создаёт незавершённый заказ покупателя. Если его уже создал параллельный
+        запрос, ограничение unique_open_order_per_customer не даст создать второй,
+        и возвращается существующий.
+        """
+        if customer_id is None:
+            customer, created = Customer.objects.get_or_create(
+                user=self.user
+            )
+            customer_id = customer.pk
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(customer_id=customer_id)
+        except IntegrityError:
+            order = Order.objects.get(customer_id=customer_id, is_completed=False)
+        self.remember_ids(customer_id, order.pk)
+        return order
+
+    def get_order(self, create=False):
+        """
+        Получение заказа-корзины пользователя.
+        Заказ создаётся только при create=True (первое добавление товара),
+        иначе при его отсутствии возвращается None.
+        """
+        customer_id, order_id = self.resolve_ids()
+        order = None
+        if order_id is not None:
+            order = Order.objects.filter(
+                pk=order_id,
+                customer_id=customer_id,
+                is_completed=False,
+            ).first()
+            if order is None:
+                # Id в сессии устарел: заказ завершён или удалён
+                customer_id, order_id = self.load_ids()
+                if order_id is not None:
+                    order = Order.objects.get(pk=order_id)
+        elif create:
+            # Заказ мог быть создан в другой сессии пользователя
+            customer_id, order_id = self.load_ids()
+            if order_id is not None:
+                order = Order.objects.get(pk=order_id)
+
+        if order is None and create:
+            order = self.create_order(customer_id)
+        return order
+
     def get_cart_info(self):
         """
         Получение информации о корзине пользователя.
         """
-        customer, created = Customer.objects.get_or_create(
-            user=self.user
-        )
-        order, created = Order.objects.get_or_create(
-            customer=customer
-        )
-        order_products = order.ordered.all()
-        cart_total_quantity = order.get_cart_total_quantity
-        cart_total_price = order.get_cart_total_price
+        order = self.get_order()
+        if order is None:
+            order_products = []
+            order = VirtualOrder(order_products)
+        else:
+            # Строки с товарами и их изображениями загружаются один раз,
+            # итоги заказа и шаблоны используют загруженные строки
+            prefetch_related_objects([order], Prefetch('ordered', queryset=cart_lines_queryset()))
+            order_products = order.ordered.all()
 
         return {
             'order': order,
             'order_products': order_products,
-            'cart_total_quantity': cart_total_quantity,
-            'cart_total_price': cart_total_price,
+            'cart_total_quantity': order.get_cart_total_quantity,
+            'cart_total_price': order.get_cart_total_price,
         }
 
-    def add_or_delete(self, product_id, action):
+    async def aget_cart_info(self):
         """
-        Добавление, удаление или полное удаление продукта из корзины.
+        Асинхронное получение информации о корзине пользователя.
+        """
+        ids = await self.session.aget(self.session_key)
+        if ids and ids.get('user') == self.user.pk:
+            order_id = ids['order']
+        else:
+            customer_id, order_id = await self.ids_queryset(self.user).afirst() or (None, None)
+            await self.session.aset(self.session_key, {
+                'user': self.user.pk,
+                'customer': customer_id,
+                'order': order_id,
+            })
+
+        order = None
+        if order_id is not None:
+            order = await Order.objects.filter(pk=order_id, is_completed=False).afirst()
+        if order is None:
+            order_products = []
+            order = VirtualOrder(order_products)
+        else:
+            order_products = [
+                item async for item in cart_lines_queryset().filter(order=order)
+            ]
+
+        return {
+            'order': order,
+            'order_products': order_products,
+            'cart_total_quantity': sum(item.quantity for item in order_products),
+            'cart_total_price': sum(item.get_total_price for item in order_products),
+        }
+
+    @transaction.atomic
+    def change_quantity(self, product_id, delta=None, quantity=None):
+        """
+        Изменяет количество товара в корзине на delta или до quantity,
+        резервируя или возвращая товар на склад.
+        Возвращает итоговую строку корзины.
         """
-        order = self.get_cart_info().get('order')
-        product = Product.objects.get(pk=product_id)
+        order = self.get_order(create=True)
+        try:
+            product = Product.objects.select_for_update().get(pk=product_id)
+        except Product.DoesNotExist:
+            raise CartError(f'Товар не найден: {product_id}', status=404)
+
+        # Новая строка запоминает текущую цену товара, существующая сохраняет свою
         order_product, created = OrderProduct.objects.get_or_create(
             order=order,
             product=product,
+            defaults={'unit_price': product.product_price},
         )
-        if action == 'add' and product.product_quantity > 0:
-            order_product.quantity += 1
-            product.product_quantity -= 1
-        elif action == 'delete':
-            order_product.quantity -= 1
-            product.product_quantity += 1
-        elif action == 'remove':
-            product.product_quantity += order_product.quantity
-            order_product.quantity -= order_product.quantity
-
-        product.save()
-        order_product.save()
+        current = order_product.quantity or 0
+        if delta is None:
+            delta = quantity - current
+        # Добавить можно не больше, чем осталось на складе
+        delta = max(min(delta, product.product_quantity), -current)
+
+        order_product.set_quantity(current + delta)
+        product.product_quantity -= delta
+        product.save(update_fields=('product_quantity', ))
+        transaction.on_commit(bump_stock_version)
 
         if order_product.quantity < 1:
             order_product.delete()
+        else:
+            order_product.save(update_fields=('quantity', 'total_price'))
+        if delta > 0:
+            leaderboard.record(product.pk, 'cart', delta)
+
+        return {
+            'product_id': product.pk,
+            'quantity': order_product.quantity,
+            'unit_price': order_product.unit_price,
+            'total_price': order_product.total_price,
+            'in_stock': product.product_quantity,
+        }
+
+    def get_totals(self):
+        """
+        Общее количество и стоимость товаров корзины одним агрегирующим запросом
+        к таблице строк заказа (без соединения с товарами).
+        """
+        customer_id, order_id = self.resolve_ids()
+        if order_id is None:
+            # Без заказа фильтр order_id IS NULL сложил бы строки, оставшиеся от удалённых заказов
+            return {'total_quantity': 0, 'total_price': Decimal('0.00')}
+        # Id из сессии может указывать на уже завершённый заказ
+        totals = OrderProduct.objects.filter(
+            order_id=order_id,
+            order__customer_id=customer_id,
+            order__is_completed=False,
+        ).aggregate(
+            total_quantity=Sum('quantity'),
+            total_price=Sum('total_price'),
+        )
+        return {
+            'total_quantity': totals['total_quantity'] or 0,
+            'total_price': Decimal(totals['total_price'] or 0).quantize(Decimal('0.01')),
+        }
+
+    @transaction.atomic
+    def empty(self):
+        """
+        Удаление всех товаров из корзины с возвратом их на склад.
+        """
+        order = self.get_order()
+        if order is None:
+            return
+        for product_id, quantity in order.ordered.values_list('product_id', 'quantity'):
+            Product.objects.filter(pk=product_id).update(
+                product_quantity=F('product_quantity') + quantity
+            )
+        order.ordered.all().delete()
+        transaction.on_commit(bump_stock_version)
+
+    @transaction.atomic
+    def clear(self):
+        """
+        Завершает оплаченный заказ-корзину. Строки заказа остаются историей покупок
+        (по ней пересчитывается рейтинг популярности), следующее добавление товара
+        создаёт новый заказ.
+        """
+        order = self.get_order()
+        if order is None:
+            return
+        amounts = order.ordered.filter(product__isnull=False).values_list('product_id', 'quantity')
+        tasks.record_purchases.enqueue(amounts={str(product_id): quantity for product_id, quantity in amounts})
+        order.is_completed = True
+        order.save(update_fields=('is_completed', ))
+        self.remember_ids(order.customer_id, None)
+
+    @transaction.atomic
+    def merge(self, items):
+        """
+        Переносит гостевую корзину {id товара: количество} в заказ пользователя:
+        строки заказа и остатки товаров обновляются пачкой (bulk_create/bulk_update).
+        """
+        if not items:
+            return
+
+        order = self.get_order(create=True)
+        products = Product.objects.select_for_update().in_bulk(list(items))
+        lines = {
+            line.product_id: line
+            for line in order.ordered.filter(product_id__in=list(products))
+        }
+        to_create, to_update, reserved = [], [], []
+        for product_id, quantity in items.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            quantity = min(quantity, product.product_quantity)
+            if quantity < 1:
+                continue
+
+            product.product_quantity -= quantity
+            reserved.append(product)
+            line = lines.get(product_id)
+            if line:
+                line.set_quantity((line.quantity or 0) + quantity)
+                to_update.append(line)
+            else:
+                to_create.append(OrderProduct.for_product(product, quantity, order=order))
+
+        OrderProduct.objects.bulk_create(to_create)
+        OrderProduct.objects.bulk_update(to_update, fields=('quantity', 'total_price'))
+        Product.objects.bulk_update(reserved, fields=('product_quantity', ))
+        transaction.on_commit(bump_stock_version)
+
+
+class VirtualOrder:
+    """
+    Заказ, не хранящийся в базе (корзина гостя или пустая корзина пользователя),
+    который предоставляет шаблонам те же свойства итогов, что и модель Order.
+    """
+
+    def __init__(self, order_products):
+        self.order_products = order_products
+
+    @property
+    def get_cart_total_price(self):
+        """
+        Возвращает общую стоимость корзины.
+        """
+        return sum(item.get_total_price for item in self.order_products)
+
+    @property
+    def get_cart_total_quantity(self):
+        """
+        Возвращает общее количество товаров в корзине.
+        """
+        return sum(item.quantity for item in self.order_products)
+
+
+class CartForAnonymousUser(BaseCart):
+    """
+    Корзина гостя: хранится в сессии компактным словарём {id товара: количество},
+    строки заказа в базе не создаются. Товар на складе не резервируется,
+    это происходит при переносе корзины в заказ после входа (см. merge).
+    """
+    session_key = 'cart'
+
+    def __init__(self, request, product_id=None, action=None):
+        """
+        Инициализация корзины гостя из сессии.
+        """
+        self.session = request.session
+        # В сессии ключи JSON - строки
+        self.items = {
+            int(product_id): quantity
+            for product_id, quantity in self.session.get(self.session_key, {}).items()
+        }
+        self.initial_items = dict(self.items)
+        super().__init__(request, product_id, action)
+
+    def rollback(self):
+        """ Возвращает корзину гостя к состоянию на момент загрузки из сессии """
+        self.items = dict(self.initial_items)
+        self.save()
+
+    def save(self):
+        """ Сохраняет корзину в сессии """
+        self.session[self.session_key] = {
+            str(product_id): quantity for product_id, quantity in self.items.items()
+        }
+
+    def get_cart_info(self):
+        """
+        Получение информации о корзине гостя: товары загружаются одним запросом.
+        Товар гостю не резервируется, поэтому цены в корзине - текущие цены товаров.
+        """
+        products = Product.objects.prefetch_related('images').in_bulk(list(self.items))
+        order_products = [
+            OrderProduct.for_product(products[product_id], quantity)
+            for product_id, quantity in self.items.items()
+            if product_id in products
+        ]
+        order = VirtualOrder(order_products)
+
+        return {
+            'order': order,
+            'order_products': order_products,
+            'cart_total_quantity': order.get_cart_total_quantity,
+            'cart_total_price': order.get_cart_total_price,
+        }
+
+    def change_quantity(self, product_id, delta=None, quantity=None):
+        """
+        Изменяет количество товара в корзине гостя на delta или до quantity
+        в пределах остатка на складе. Возвращает итоговую строку корзины.
+        """
+        product = Product.objects.only('product_price', 'product_quantity').filter(pk=product_id).first()
+        if product is None:
+            raise CartError(f'Товар не найден: {product_id}', status=404)
+
+        current = self.items.get(product.pk, 0)
+        target = current + delta if quantity is None else quantity
+        target = max(min(target, product.product_quantity), 0)
+        if target:
+            self.items[product.pk] = target
+        else:
+            self.items.pop(product.pk, None)
+        self.save()
+        if target > current:
+            leaderboard.record(product.pk, 'cart', target - current)
+
+        return {
+            'product_id': product.pk,
+            'quantity': target,
+            'unit_price': product.product_price,
+            'total_price': product.product_price * target,
+            'in_stock': product.product_quantity,
+        }
+
+    def get_totals(self):
+        """
+        Общее количество и стоимость товаров корзины гостя.
+        """
+        prices = dict(
+            Product.objects
+            .filter(pk__in=list(self.items))
+            .values_list('pk', 'product_price')
+        )
+        total_price = sum(
+            prices[product_id] * quantity
+            for product_id, quantity in self.items.items()
+            if product_id in prices
+        )
+        return {
+            'total_quantity': sum(self.items.values()),
+            'total_price': Decimal(total_price).quantize(Decimal('0.01')),
+        }
+
+    def empty(self):
+        """ Удаление всех товаров из корзины гостя """
+        self.items = {}
+        self.save()
 
     def clear(self):
-        """ Удаление всех товаров из корзины """
-        order = self.get_cart_info()['order']
-        order_products = order.ordered.all()
-        for product in order_products:
-            product.delete()
-        order.save()
+        """ Удаление всех товаров из корзины гостя """
+        self.empty()
+
+
+def get_cart(request, product_id=None, action=None):
+    """
+    Возвращает корзину текущего пользователя: из базы для вошедших, из сессии для гостей.
+    """
+    if request.user.is_authenticated:
+        return CartForAuthenticatedUser(request, product_id, action)
+    return CartForAnonymousUser(request, product_id, action)
+
+
+def merge_guest_cart(request):
+    """
+    Переносит гостевую корзину из сессии в заказ только что вошедшего пользователя.
+    """
+    guest_cart = CartForAnonymousUser(request)
+    if guest_cart.items:
+        CartForAuthenticatedUser(request).merge(guest_cart.items)
+        guest_cart.empty()
+
+
+CART_API_ACTIONS = (
+    'add',
+    'delete',
+    'set',
+    'remove',
+    'clear',
+)
+
+# Наибольшее количество товара в операции set (дальше его ограничивает остаток на складе)
+MAX_CART_QUANTITY = 2 ** 31 - 1
+
+
+@transaction.atomic
+def apply_cart_operations(cart, operations):
+    """
+    Проверяет и выполняет пачку операций с корзиной в одной транзакции.
+    Операция - словарь вида {"action": "set", "product_id": 1, "quantity": 3}.
+    Возвращает изменённые строки корзины; при ошибке в любой операции
+    вызывает CartError, и ни одна операция пачки не применяется.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartError('Ожидается непустой список операций')
+
+    try:
+        return apply_operations(cart, operations)
+    except CartError:
+        cart.rollback()
+        raise
+
+
+def apply_operations(cart, operations):
+    """
+    Последовательно выполняет операции с корзиной (см. apply_cart_operations).
+    """
+    lines = {}
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise CartError('Операция должна быть объектом')
+        action = operation.get('action')
+        if action not in CART_API_ACTIONS:
+            raise CartError(f'Неизвестное действие: {action}')
+
+        if action == 'clear':
+            cart.empty()
+            lines.clear()
+            continue
+
+        product_id = operation.get('product_id')
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise CartError('product_id должен быть целым числом')
+        # Число вне диапазона первичного ключа не передаётся в базу
+        if not 0 < product_id < 2 ** 63:
+            raise CartError(f'Товар не найден: {product_id}', status=404)
+
+        if action == 'set':
+            quantity = operation.get('quantity')
+            if not isinstance(quantity, int) or isinstance(quantity, bool):
+                raise CartError('quantity должно быть целым числом')
+            if quantity > MAX_CART_QUANTITY:
+                raise CartError(f'quantity не может быть больше {MAX_CART_QUANTITY}')
+            line = cart.set_quantity(product_id, quantity)
+        else:
+            line = cart.add_or_delete(product_id, action)
+        lines[product_id] = line
+
+    return list(lines.values())
 
 
 def get_cart_data(request):
     """
     Получение данных корзины для текущего пользователя.
     """
-    cart = CartForAuthenticatedUser(request=request)
+    cart = get_cart(request=request)
     cart_info = cart.get_cart_info()
 
     return {
@@ -86,3 +603,61 @@ def get_cart_data(request):
         'cart_total_quantity': cart_info['cart_total_quantity'],
         'cart_total_price': cart_info['cart_total_price'],
     }
+
+
+def reprice_cart_lines(product_ids=None):
+    """
+    Пересчитывает по текущим ценам товаров строки незавершённых заказов (корзин)
+    с товарами product_ids (None - со всеми) одним UPDATE без загрузки строк.
+    Оформленные заказы сохраняют цены на момент покупки.
+    Возвращает количество изменённых строк.
+    """
+    lines = OrderProduct.objects.filter(order__is_completed=False, product__isnull=False)
+    if product_ids is not None:
+        lines = lines.filter(product_id__in=product_ids)
+    price = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('product_price')[:1])
+    return lines.exclude(unit_price=F('product__product_price')).update(
+        unit_price=price,
+        total_price=Round(price * Coalesce('quantity', 0), 2),
+    )
+
+
+def bulk_update_products(queryset, changes, chunk_size=5000, progress=None):
+    """
+    Массово изменяет товары выборки (или список их pk) одной транзакцией.
+    Каждая пачка из chunk_size товаров обновляется одним UPDATE,
+    сигнал catalog_changed отправляется один раз на пачку после фиксации транзакции.
+    Возвращает количество обновлённых товаров.
+    """
+    updates = {}
+    if changes.get('price_percent') is not None:
+        factor = 1 + Decimal(changes['price_percent']) / 100
+        updates['product_price'] = Round(F('product_price') * factor, 2)
+    if changes.get('restock') is not None:
+        # Списание не уводит остаток ниже нуля
+        updates['product_quantity'] = Greatest(F('product_quantity') + changes['restock'], 0)
+    for field in ('product_color', 'product_size'):
+        if changes.get(field) is not None:
+            updates[field] = changes[field]
+    if not updates:
+        return 0
+    # update() не обновляет поле auto_now
+    updates['product_updated_at'] = timezone.now()
+
+    # pk выбираются заранее: обновление может менять поля, по которым отфильтрована выборка
+    if isinstance(queryset, list):
+        pks = sorted(queryset)
+    else:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    updated = 0
+    with transaction.atomic():
+        for chunk in batched(pks, chunk_size):
+            Product.objects.filter(pk__in=chunk).update(**updates)
+            updated += len(chunk)
+            transaction.on_commit(
+                lambda chunk=chunk: catalog_changed.send(sender=Product, pks=chunk)
+            )
+            if progress:
+                progress(updated, len(pks))
+
+    return updated
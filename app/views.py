@@ -1,17 +1,28 @@
-import stripe
+import json
+import os
 
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.views.generic import ListView, DetailView
-from django.db.models import F
 from django.contrib.auth import login, logout
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, require_safe
 
 from .forms import LoginForm, RegistrationForm, CustomerForm, ShippingForm, Customer
 from .models import Category, Product, FavoriteProduct
-from .utils import CartForAuthenticatedUser, get_cart_data
-from config import settings
+from . import api, feeds, leaderboard, sitemaps, slugs, tasks
+from .recommendations import get_similar_products
+from .utils import (
+    CartForAuthenticatedUser,
+    CartError,
+    apply_cart_operations,
+    get_cart,
+    get_cart_data,
+    merge_guest_cart,
+)
 
 
 class MainPage(ListView):
@@ -38,7 +49,7 @@ class MainPage(ListView):
         Переопределение метода для добавления дополнительных данных в контекст шаблона.
         """
         context = super().get_context_data()
-        context['top'] = Product.objects.order_by('-product_watched')[:3]
+        context['top'] = leaderboard.top_products(limit=3)
 
         return context
 
@@ -62,37 +73,56 @@ class SubCategories(ListView):
 
         if type_field:
             products = Product.objects.filter(
-                product_category__slug=type_field
+                product_category_id=slugs.categories.resolve(type_field)
+            )
+        else:
+            products = Product.objects.filter(
+                product_category__parent=self.get_category()
             )
-            return products
-
-        parent_category = Category.objects.get(
-            slug=self.kwargs['slug']
-        )
-
-        subcategories = parent_category.subcategories.all()
-        products = Product.objects.filter(
-            product_category__in=subcategories
-        )
 
-        return products
+        # Изображения карточек загружаются одним запросом на страницу
+        return products.order_by('pk').prefetch_related('images')
 
     def get_context_data(self, **kwargs):
         """
         Переопределение метода для добавления дополнительных данных в контекст шаблона.
         """
         context = super().get_context_data(**kwargs)
-        parent_category = Category.objects.get(
-            slug=self.kwargs['slug']
-        )
+        parent_category = self.get_category()
         context['category'] = parent_category
         context['title'] = parent_category.category_name
         context['filters'] = Category.objects.filter(
             parent=parent_category
         )
+        if context['page_obj'].number == 1:
+            context['top'] = self.get_top_products(parent_category)
 
         return context
 
+    def get_category(self):
+        """
+        Категория из адреса: pk берётся из кэша slug -> pk, категория читается
+        по первичному ключу один раз за запрос.
+        """
+        if not hasattr(self, 'category'):
+            self.category = slugs.get_object_by_slug(Category.objects, self.kwargs['slug'])
+        return self.category
+
+    def get_top_products(self, parent_category):
+        """
+        Самые популярные товары выбранной подкатегории или всей категории.
+        """
+        type_field = self.request.GET.get('type')
+        if type_field:
+            category_id = slugs.categories.resolve(type_field)
+            if category_id is None:
+                return []
+            return leaderboard.top_products(limit=3, category=category_id)
+        return leaderboard.top_products(
+            limit=3,
+            root_category=parent_category,
+        )
+
 
 class ProductPage(DetailView):
     """ 
@@ -102,24 +132,24 @@ class ProductPage(DetailView):
     context_object_name = 'product'
     template_name = 'product.html'
 
+    def get_object(self, queryset=None):
+        """
+        Товар по slug из адреса: pk берётся из кэша slug -> pk, товар читается по первичному ключу.
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+        return slugs.get_object_by_slug(queryset, self.kwargs['slug'])
+
     def get_context_data(self, **kwargs):
         """ 
         Метод для добавления дополнительной контекстной информации в шаблон.
         """
-        Product.objects.filter(slug=self.kwargs['slug']).update(product_watched=F('product_watched') + 1)
+        product = self.object
+        # Просмотр учитывается в памяти и записывается фоновой задачей (app/tasks.py)
+        tasks.views.record(product.pk)
         context = super().get_context_data(**kwargs)
-        product = Product.objects.get(
-            slug=self.kwargs['slug']
-        )
         context['title'] = product.product_name
-        products = (
-            Product.objects
-            .all()
-            .exclude(slug=self.kwargs['slug'])
-            .filter(product_category=product.product_category)
-            [:3]
-        )
-        context['products'] = products
+        context['products'] = get_similar_products(product)
 
         return context
 
@@ -148,6 +178,9 @@ def user_login(request):
             request=request,
             user=user
         )
+        merge_guest_cart(
+            request=request
+        )
         return redirect('index')
     else:
         messages.error(
@@ -190,27 +223,21 @@ def save_favorite_product(request, product_slug):
     """
     if request.user.is_authenticated:
         user = request.user
-        product = Product.objects.get(
-            slug=product_slug
-        )
-
-        favorite_products = FavoriteProduct.objects.filter(
-            user=user
-        )
-
-        if product in [item.product for item in favorite_products]:
-            fav_product = FavoriteProduct.objects.get(
-                user=user, product=product
-            )
-            fav_product.delete()
-        else:
+        product_id = slugs.products.resolve(product_slug)
+        if product_id is None:
+            raise Http404('Товар не найден')
+
+        deleted, _ = FavoriteProduct.objects.filter(
+            user=user, product_id=product_id
+        ).delete()
+        if not deleted:
             FavoriteProduct.objects.create(
-                user=user, product=product
+                user=user, product_id=product_id
             )
 
         page = request.META.get(
             'HTTP_REFERER',
-            'category'
+            reverse('product', kwargs={'slug': product_slug})
         )
         return redirect(page)
     else:
@@ -230,60 +257,109 @@ class FavoriteProductsView(LoginRequiredMixin, ListView):
         """
         Получает набор данных для отображения.
         """
-        favorites_products = FavoriteProduct.objects.filter(
-            user=self.request.user
+        return (
+            Product.objects
+            .filter(favoriteproduct__user=self.request.user)
+            .order_by('favoriteproduct__pk')
+            .prefetch_related('images')
         )
-        products = [item.product for item in favorites_products]
-
-        return products
 
 
 def cart(request):
     """
     Функция для отображения страницы корзины.
     """
-    if request.user.is_authenticated:
-        cart_info = get_cart_data(
-            request=request
-        )
-        context = {
-            'title': 'Корзина',
-            'order': cart_info['order'],
-            'order_products': cart_info['order_products'],
-            'cart_total_quantity': cart_info['cart_total_quantity'],
-        }
-        return render(
-            request=request,
-            template_name='cart.html',
-            context=context
-        )
-    else:
-        return redirect('user_registration')
+    cart_info = get_cart_data(
+        request=request
+    )
+    context = {
+        'title': 'Корзина',
+        'order': cart_info['order'],
+        'order_products': cart_info['order_products'],
+        'cart_total_quantity': cart_info['cart_total_quantity'],
+    }
+    return render(
+        request=request,
+        template_name='cart.html',
+        context=context
+    )
 
 
 def to_cart(request, product_id, action):
     """
     Функция для добавления, удаления или полного удаления продукта из корзины.
     """
-    if request.user.is_authenticated:
-        CartForAuthenticatedUser(
+    try:
+        get_cart(
             request=request,
             product_id=product_id,
             action=action
         )
-        return redirect('cart')
-    else:
-        messages.error(
-            request=request,
-            message='Для совершения покупок, авторизуйтесь или зарегистрируйтесь'
-        )
-        return redirect('user_registration')
+    except CartError:
+        raise Http404('Неизвестное действие или товар')
+    return redirect('cart')
+
+
+@require_http_methods(['GET', 'POST'])
+def cart_api(request):
+    """
+    JSON API корзины.
+    GET возвращает итоги корзины. POST выполняет одну операцию или пачку операций
+    в одной транзакции и возвращает изменённые строки вместе с итогами:
+        {"action": "add", "product_id": 1}
+        {"operations": [{"action": "set", "product_id": 1, "quantity": 3},
+                        {"action": "remove", "product_id": 2}]}
+    Действия: add, delete (уменьшить на 1), set, remove, clear.
+    Работает и для гостей: их корзина хранится в сессии.
+    """
+    user_cart = get_cart(
+        request=request
+    )
+    lines = []
+    if request.method == 'POST':
+        # Ошибку разбора тела отделяем от ошибок в полях операций
+        try:
+            payload = json.loads(request.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse(
+                {'error': 'Некорректный JSON'},
+                status=400,
+                json_dumps_params={'ensure_ascii': False},
+            )
+        try:
+            if not isinstance(payload, dict):
+                raise CartError('Ожидается JSON-объект')
+            lines = apply_cart_operations(
+                cart=user_cart,
+                operations=payload['operations'] if 'operations' in payload else [payload],
+            )
+        except CartError as error:
+            return JsonResponse(
+                {'error': str(error)},
+                status=error.status,
+                json_dumps_params={'ensure_ascii': False},
+            )
+
+    return JsonResponse(
+        {
+            'lines': lines,
+            'cart': user_cart.get_totals(),
+        },
+        json_dumps_params={'ensure_ascii': False},
+    )
 
 
 def checkout(request):
     """
     Отображение страницы оформления заказа.
     """
+    if not request.user.is_authenticated:
+        messages.error(
+            request=request,
+            message='Для оформления заказа войдите или зарегистрируйтесь, корзина сохранится'
+        )
+        return redirect('user_registration')
+
     cart_info = get_cart_data(
         request=request
     )
@@ -307,8 +383,14 @@ def checkout_session(request):
     """
     Создаёт платёжную сессию Stripe для оформления заказа пользователя.
     """
+    # SDK Stripe импортируется только при оплате: его загрузка заметно замедляет запуск процесса
+    import stripe
+
     stripe.api_key = settings.STRIPE_SECRET_KEY
 
+    if not request.user.is_authenticated:
+        return redirect('user_registration')
+
     if request.method == 'POST':
         user_cart = CartForAuthenticatedUser(
             request=request
@@ -317,10 +399,10 @@ def checkout_session(request):
         customer_form = CustomerForm(
             data=request.POST
         )
+        customer, created = Customer.objects.get_or_create(
+            user=request.user
+        )
         if customer_form.is_valid():
-            customer = Customer.objects.get(
-                user=request.user
-            )
             customer.first_name = customer_form.cleaned_data['first_name']
             customer.last_name = customer_form.cleaned_data['last_name']
             customer.email = customer_form.cleaned_data['email']
@@ -334,10 +416,8 @@ def checkout_session(request):
             address = shipping_form.save(
                 commit=False
             )
-            address.customer = Customer.objects.get(
-                user=request.user
-            )
-            address.order = user_cart.get_cart_info()['order']
+            address.customer = customer
+            address.order = user_cart.get_order()
             address.save()
 
         total_price = cart_info['cart_total_price']
@@ -383,16 +463,136 @@ def success_payment(request):
 
 
 def search(request):
-    """ Осуществляет поиск товара по названию """
+    """ Осуществляет поиск товара по названию; пустой запрос - пустой результат """
     query = request.GET.get('q')
-    if query != '' and query is not None:
-        products = Product.objects.filter(product_name__icontains=query)        
-        context = {
-            'title': 'Результаты поиска',
-            'products': products,
-        }
-        return render(
-            request=request,
-            template_name='category.html',
-            context=context
+    products = Product.objects.none()
+    if query:
+        products = (
+            Product.objects
+            .filter(product_name__icontains=query)
+            .prefetch_related('images')
+        )
+    context = {
+        'title': 'Результаты поиска',
+        'products': products,
+    }
+    return render(
+        request=request,
+        template_name='category.html',
+        context=context
+    )
+
+
+def stored_sitemap(name):
+    """
+    Готовый файл карты сайта из settings.SITEMAP_ROOT (команда build_sitemap).
+    Возвращает None, если файлы не сформированы и карта строится по запросу.
+    """
+    if not os.path.isfile(os.path.join(settings.SITEMAP_ROOT, 'sitemap.xml')):
+        return None
+    path = os.path.join(settings.SITEMAP_ROOT, name)
+    if not os.path.isfile(path):
+        raise Http404('Файл карты сайта не найден')
+    return FileResponse(open(path, 'rb'), content_type='application/xml')
+
+
+def sitemap_index(request):
+    """
+    Индекс карты сайта со ссылками на файлы разделов.
+    """
+    response = stored_sitemap('sitemap.xml')
+    if response is None:
+        response = StreamingHttpResponse(
+            sitemaps.render_index(
+                sitemaps.iter_index_entries(),
+                request.build_absolute_uri('/')[:-1],
+            ),
+            content_type='application/xml',
+        )
+    return response
+
+
+def sitemap(request, section, page):
+    """
+    Файл раздела карты сайта; адреса читаются из базы курсором по мере отправки.
+    """
+    if section not in sitemaps.SECTIONS:
+        raise Http404('Неизвестный раздел карты сайта')
+    response = stored_sitemap(f'sitemap-{section}-{page}.xml')
+    if response is None:
+        if not 1 <= page <= sitemaps.count_pages(section):
+            raise Http404('Неверная страница карты сайта')
+        response = StreamingHttpResponse(
+            sitemaps.render_urlset(
+                sitemaps.iter_page_entries(section, page),
+                request.build_absolute_uri('/')[:-1],
+            ),
+            content_type='application/xml',
+        )
+    return response
+
+
+def product_feed(request, file_format):
+    """
+    Товарный фид для маркетплейсов (feed.yml, feed.csv, а также feed.yml.gz, feed.csv.gz).
+    Формируется по мере отправки: товары читаются из базы пачками.
+    """
+    name = file_format.removesuffix('.gz')
+    if name not in feeds.FORMATS:
+        raise Http404('Неизвестный формат фида')
+    chunks = feeds.render_feed(name, request.build_absolute_uri('/')[:-1])
+    if name != file_format:
+        response = StreamingHttpResponse(feeds.gzip_chunks(chunks), content_type='application/gzip')
+        response['Content-Disposition'] = f'attachment; filename="feed.{file_format}"'
+    else:
+        response = StreamingHttpResponse(chunks, content_type=f'{feeds.FORMATS[name]}; charset=utf-8')
+    return response
+
+
+@require_safe
+def api_categories(request):
+    """
+    JSON API: дерево категорий.
+    """
+    return api.conditional_response(
+        request,
+        api.data_version(),
+        lambda: {'results': api.category_tree(request.build_absolute_uri('/')[:-1])},
+    )
+
+
+@require_safe
+def api_products(request):
+    """
+    JSON API: список товаров с курсорной пагинацией.
+    Параметры: category, min_price, max_price, in_stock=1, sort (id, price, -price, new),
+    limit, cursor (значение next предыдущей страницы), fields (по умолчанию api.LIST_FIELDS).
+    """
+    try:
+        fields = api.parse_fields(request.GET.get('fields'), api.LIST_FIELDS)
+        return api.conditional_response(
+            request,
+            api.data_version(fields, stock=request.GET.get('in_stock') == '1'),
+            lambda: api.product_list(request.GET, fields, request.build_absolute_uri('/')[:-1]),
+        )
+    except api.ApiError as error:
+        return api.error_response(error)
+
+
+@require_safe
+def api_product(request, slug):
+    """
+    JSON API: карточка товара. Параметр fields (по умолчанию все поля).
+    """
+    try:
+        fields = api.parse_fields(request.GET.get('fields'), api.DETAIL_FIELDS)
+        pk = slugs.products.resolve(slug)
+        if pk is None:
+            raise api.ApiError('Товар не найден', status=404)
+        return api.conditional_response(
+            request,
+            api.data_version(fields),
+            lambda: api.product_detail(pk, fields, request.build_absolute_uri('/')[:-1]),
         )
+    except api.ApiError as error:
+        return api.error_response(error)
@@ -0,0 +1,53 @@
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+
+def iter_template_names(app_label='app'):
+    """
+    Возвращает имена всех шаблонов из каталога templates приложения.
+    """
+    directory = Path(apps.get_app_config(app_label).path) / 'templates'
+    for path in sorted(directory.rglob('*.html')):
+        yield path.relative_to(directory).as_posix()
+
+
+def warm_up_templates(app_label='app'):
+    """
+    Компилирует все шаблоны приложения во всех движках Django-шаблонов.
+    С кэширующим загрузчиком скомпилированные шаблоны остаются в памяти процесса,
+    и первый запрос не тратит время на чтение и разбор шаблонов.
+    Возвращает количество скомпилированных шаблонов.
+    """
+    names = list(iter_template_names(app_label))
+    compiled = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for name in names:
+            engine.get_template(name)
+            compiled += 1
+    return compiled
+
+
+def warm_up():
+    """
+    Прогрев процесса при запуске (вызывается из config/wsgi.py и config/asgi.py).
+    Выполняется только при settings.TEMPLATE_WARMUP.
+    """
+    if not settings.TEMPLATE_WARMUP:
+        return
+    started = time.perf_counter()
+    compiled = warm_up_templates()
+    logger.info(
+        'Скомпилировано шаблонов: %d за %.0f мс',
+        compiled,
+        (time.perf_counter() - started) * 1000,
+    )
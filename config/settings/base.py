@@ -0,0 +1,447 @@
+"""
+Django settings for config project.
+
+Generated by 'django-admin startproject' using Django 5.1.4.
+
+Общие настройки. Для разработки используется config.settings.dev
+(manage.py), для запуска под WSGI/ASGI - config.settings.prod.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.1/ref/settings/
+"""
+import os
+from pathlib import Path
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.getenv('SECRET_KEY')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'app.apps.AppConfig',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'app.middleware.CompressionMiddleware',
+    'app.middleware.ReplicaRoutingMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.middleware.RateLimitMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'config.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+# Компиляция всех шаблонов приложения при запуске процесса (app/warmup.py)
+TEMPLATE_WARMUP = False
+
+WSGI_APPLICATION = 'config.wsgi.application'
+
+# Кэши. Кэш по умолчанию хранит поколения кэша slug (app/slugs.py) и версии каталога
+# и остатков (ETag в API): процесс, не видящий общего кэша, не узнает об изменениях,
+# сделанных другим процессом. Общий кэш - Redis по адресу CACHE_REDIS_URL или
+# memcached по адресам CACHE_MEMCACHED_LOCATION через запятую (нужен пакет redis
+# или pymemcache). Без них кэш хранится в памяти процесса - только для запуска
+# в одном процессе (разработка, тесты; см. проверку в prod.py).
+# Кэш сессий (SESSION_PROFILE = 'cached_db') тоже должен быть общим для всех
+# процессов: в памяти отдельного процесса сессия оставалась бы устаревшей после её
+# изменения другим процессом (например, после выхода пользователя).
+# Для нескольких серверов - Redis по адресу SESSION_REDIS_URL (нужен пакет redis).
+# Без него - файлы, общие для процессов одной машины. Файловый кэш при каждой записи
+# перечисляет весь каталог, поэтому записей в нём немного: вытесненная сессия
+# просто читается из базы
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        },
+    }
+elif os.getenv('CACHE_MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.getenv('CACHE_MEMCACHED_LOCATION').split(','),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+if os.getenv('SESSION_REDIS_URL'):
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('SESSION_REDIS_URL'),
+        'TIMEOUT': 14 * 24 * 60 * 60,  # как SESSION_COOKIE_AGE по умолчанию
+    }
+else:
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SESSION_CACHE_DIR', BASE_DIR / 'cache' / 'sessions'),
+        'TIMEOUT': 14 * 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    }
+
+# Профили хранения сессий (выбираются переменной окружения SESSION_PROFILE).
+# Переход между 'db' и 'cached_db' не требует действий: cached_db читает
+# сессии из той же таблицы django_session при промахе кэша.
+# При переходе с 'db'/'cached_db' на 'signed_cookies' существующие сессии
+# переносятся в cookie при первом запросе пользователя (app/sessions.py);
+# при обратном переходе пользователям придётся войти заново.
+SESSION_PROFILES = {
+    # Таблица django_session читается при каждом запросе с cookie сессии
+    'db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    },
+    # Чтение из кэша 'sessions', база - только при промахе кэша; запись - в кэш и базу
+    'cached_db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'SESSION_CACHE_ALIAS': 'sessions',
+    },
+    # Данные сессии в подписанной cookie, без обращений к базе.
+    # Cookie ограничена ~4 КБ, а завершить сессию на сервере нельзя
+    'signed_cookies': {
+        'SESSION_ENGINE': 'app.sessions',
+    },
+}
+SESSION_PROFILE = os.getenv('SESSION_PROFILE', 'cached_db')
+globals().update(SESSION_PROFILES[SESSION_PROFILE])
+
+# Кэш slug -> pk товаров и категорий (app/slugs.py): записей в памяти процесса на модель
+# и время жизни найденных и неизвестных slug в секундах
+SLUG_CACHE_SIZE = 10000
+SLUG_CACHE_TIMEOUT = 24 * 60 * 60
+SLUG_CACHE_MISSING_TIMEOUT = 5 * 60
+
+# Адрес сайта для абсолютных ссылок вне запроса (карта сайта, формируемая командой)
+SITE_URL = os.getenv('SITE_URL', 'http://localhost:8000')
+
+# Карта сайта (app/sitemaps.py): адресов в одном файле (не больше 50 000 по протоколу)
+# и каталог готовых файлов команды build_sitemap; без файлов карта строится по запросу
+SITEMAP_MAX_URLS = 50000
+SITEMAP_ROOT = BASE_DIR / 'sitemaps'
+
+# Товарный фид для маркетплейсов (app/feeds.py, /feed.yml, /feed.csv, команда export_feed)
+FEED_SHOP_NAME = os.getenv('FEED_SHOP_NAME', 'E-Shop')
+FEED_COMPANY = os.getenv('FEED_COMPANY', 'E-Shop')
+FEED_CURRENCY = 'RUB'
+
+# Очередь фоновых задач (app/taskqueue.py, команда run_worker): попыток на задачу,
+# задержка первого повтора (далее удваивается, но не больше TASK_MAX_RETRY_DELAY),
+# через сколько секунд задача брошенного обработчика возвращается в очередь,
+# сколько хранятся выполненные задачи и как часто обработчик выполняет обслуживание
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+TASK_MAX_RETRY_DELAY = 60 * 60
+TASK_LOCK_TIMEOUT = 10 * 60
+TASK_RETENTION = 7 * 24 * 60 * 60
+TASK_MAINTENANCE_INTERVAL = 60
+# Просмотры товаров копятся в памяти процесса и записываются задачей раз в столько секунд
+# или после стольких просмотров (что наступит раньше), а также при завершении процесса.
+# В базу просмотры попадают, только пока работает обработчик задач (manage.py run_worker)
+VIEW_COUNT_FLUSH_INTERVAL = 10
+VIEW_COUNT_FLUSH_SIZE = 1000
+# Задержка пересборки карты сайта после изменения каталога: серия изменений - одна пересборка
+SITEMAP_REBUILD_DELAY = 60
+
+# JSON API каталога (app/api.py): товаров на странице списка по умолчанию и наибольшее
+CATALOG_API_PAGE_SIZE = 24
+CATALOG_API_MAX_PAGE_SIZE = 100
+
+# Сообщения (messages.success/error) хранятся только в cookie и не затрагивают сессию
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Асинхронные представления каталога и корзины (app/async_views.py) для запуска под ASGI
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '0') == '1'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+
+# Движок выбирается переменной окружения DB_ENGINE: 'sqlite' (по умолчанию) или 'postgresql'.
+# Реплики для чтения перечисляются через запятую: DB_REPLICA_HOSTS для PostgreSQL,
+# DB_REPLICA_NAMES (пути к файлам) для SQLite.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+# Профили настройки SQLite. PRAGMAS применяются к каждому новому соединению
+# обработчиком app.db.apply_sqlite_pragmas (сигнал connection_created).
+SQLITE_PROFILES = {
+    # Настройки Django по умолчанию: новое соединение на каждый запрос, журнал DELETE
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'PRAGMAS': {},
+    },
+    # WAL: читатели не блокируются писателями (счётчик просмотров, корзина)
+    'tuned': {
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 5,
+            # Транзакция сразу берёт блокировку записи и не получает
+            # "database is locked" при повышении уровня блокировки
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,  # в КиБ, то есть 64 МиБ
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'tuned')
+
+
+def env_list(name):
+    """ Читает из окружения список значений, перечисленных через запятую """
+    return [value.strip() for value in os.getenv(name, '').split(',') if value.strip()]
+
+
+if DB_ENGINE == 'postgresql':
+    # Пул соединений psycopg (требуется пакет psycopg[pool]).
+    # С пулом постоянные соединения (CONN_MAX_AGE) не используются.
+    POSTGRES_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME', 'eshop'),
+        'USER': os.getenv('DB_USER', 'postgres'),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+            },
+        },
+    }
+    DATABASES = {
+        'default': {
+            **POSTGRES_DATABASE,
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+        },
+    }
+    for number, host in enumerate(env_list('DB_REPLICA_HOSTS'), start=1):
+        DATABASES[f'replica_{number}'] = {
+            **POSTGRES_DATABASE,
+            'HOST': host,
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            **SQLITE_PROFILES[SQLITE_PROFILE],
+        },
+    }
+    for number, name in enumerate(env_list('DB_REPLICA_NAMES'), start=1):
+        DATABASES[f'replica_{number}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / name,
+            **SQLITE_PROFILES[SQLITE_PROFILE],
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = [
+    'app.routers.PrimaryReplicaRouter',
+]
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+
+# Маршруты (имена из app/urls.py), чтение которых может идти в реплики
+REPLICA_READ_ROUTES = {
+    'index',
+    'category',
+    'product',
+    'search',
+}
+# Маршруты, после которых пользователь закрепляется за основной базой
+PRIMARY_STICKY_ROUTES = {
+    'to_cart',
+    'add_favorite',
+    'user_login',
+    'registration',
+    'payment',
+    'success',
+}
+PRIMARY_STICKY_SECONDS = int(os.getenv('DB_PRIMARY_STICKY_SECONDS', 10))
+
+# Ограничение частоты запросов (app/ratelimit.py, RateLimitMiddleware): имя маршрута
+# из app/urls.py -> (запросов в секунду в среднем, запас для всплеска подряд).
+# Лимит действует на IP-адрес, а для вошедших пользователей - ещё и на id
+RATELIMITS = {
+    'to_cart': (2, 30),
+    'cart_api': (2, 30),
+    'add_favorite': (1, 20),
+    'search': (1, 20),
+    'user_login': (0.1, 10),
+    'registration': (0.02, 5),
+}
+# Кэш счётчиков. Лимит общий для всех процессов сервера только в общем кэше
+# с атомарным incr: адрес Redis в RATELIMIT_REDIS_URL (нужен пакет redis).
+# Без него счётчики хранятся в памяти каждого процесса: при N процессах
+# клиент фактически получает до N-кратного лимита
+RATELIMIT_CACHE_ALIAS = 'ratelimit'
+if os.getenv('RATELIMIT_REDIS_URL'):
+    CACHES[RATELIMIT_CACHE_ALIAS] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('RATELIMIT_REDIS_URL'),
+    }
+else:
+    CACHES[RATELIMIT_CACHE_ALIAS] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+    }
+# Заголовок с адресом клиента за обратным прокси, например HTTP_X_FORWARDED_FOR
+RATELIMIT_IP_HEADER = os.getenv('RATELIMIT_IP_HEADER')
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.1/topics/i18n/
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'Europe/Moscow'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.1/howto/static-files/
+
+STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Бандлы статики (app/assets.py): имя собранного файла -> исходные файлы в порядке подключения.
+# При STATIC_BUNDLING шаблоны подключают собранные файлы, иначе - исходные по отдельности
+STATIC_BUNDLES = {
+    'css/storefront.css': [
+        'css/bootstrap.min.css',
+        'css/templatemo.css',
+        'css/custom.css',
+        'css/fontawesome.min.css',
+    ],
+    'js/storefront.js': [
+        'js/jquery-1.11.0.min.js',
+        'js/jquery-migrate-1.2.1.min.js',
+        'js/bootstrap.bundle.min.js',
+        'js/templatemo.js',
+        'js/custom.js',
+    ],
+}
+STATIC_BUNDLING = False
+# Время кэширования браузером файлов статики без хэша в имени (app.middleware.StaticFilesMiddleware)
+STATIC_MAX_AGE = 60
+
+# Сжатие ответов (app.middleware.CompressionMiddleware): уровни brotli (0-11) и gzip (1-9)
+# по типу содержимого. Типы, которых нет в словаре, не сжимаются.
+# Уровни подобраны командой bench_compression
+COMPRESSION_LEVELS = {
+    content_type: {'br': 4, 'gzip': 6}
+    for content_type in (
+        'text/html',
+        'text/plain',
+        'text/css',
+        'text/csv',
+        'text/xml',
+        'text/javascript',
+        'application/javascript',
+        'application/json',
+        'application/xml',
+        'image/svg+xml',
+    )
+}
+# Более короткие ответы не сжимаются: выигрыш меньше накладных расходов
+COMPRESSION_MIN_LENGTH = 1024
+# Потоковый ответ сбрасывается клиенту не реже, чем через столько несжатых байт
+COMPRESSION_STREAM_FLUSH_SIZE = 64 * 1024
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# stripe
+STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY')
+STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
+
+# Рейтинг популярных товаров (app/leaderboard.py): период полураспада
+# популярности в днях и веса событий
+LEADERBOARD_HALF_LIFE_DAYS = float(os.getenv('LEADERBOARD_HALF_LIFE_DAYS', '7'))
+LEADERBOARD_WEIGHTS = {
+    'view': 1,
+    'cart': 5,
+    'purchase': 20,
+}
@@ -0,0 +1,19 @@
+"""
+Настройки для разработки: отладка и переменные окружения из файла .env.
+"""
+from dotenv import load_dotenv
+
+# Файл .env читается до импорта base: базовые настройки берут значения из окружения
+load_dotenv()
+
+from .base import *  # noqa: E402,F401,F403
+
+DEBUG = True
+
+ALLOWED_HOSTS = env_list('ALLOWED_HOSTS') or ['localhost', '127.0.0.1', '[::1]']  # noqa: F405
+
+# Сервер разработки работает в одном процессе: кэш сессий в памяти, без файлов
+CACHES['sessions'] = {  # noqa: F405
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'sessions',
+}
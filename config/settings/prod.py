@@ -0,0 +1,66 @@
+"""
+Настройки для запуска под WSGI/ASGI.
+
+Переменные окружения задаются окружением процесса (файл .env не читается).
+Обязательны SECRET_KEY и ALLOWED_HOSTS (через запятую).
+Кэш по умолчанию должен быть общим для процессов: CACHE_REDIS_URL или
+CACHE_MEMCACHED_LOCATION (CACHE_PROCESS_LOCAL=1 - сервер работает в одном процессе).
+На нескольких серверах кэш сессий тоже должен быть общим: задаётся SESSION_REDIS_URL.
+Статика собирается перед запуском:
+    DJANGO_SETTINGS_MODULE=config.settings.prod python manage.py collectstatic --noinput
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+
+DEBUG = False
+
+if not SECRET_KEY:  # noqa: F405
+    raise ImproperlyConfigured('Не задана переменная окружения SECRET_KEY')
+
+# Кэш в памяти процесса в нескольких процессах сервера даёт устаревшие данные:
+# 404 для новых товаров из кэша неизвестных slug и 304 со старым ETag
+if (
+    CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'  # noqa: F405
+    and os.getenv('CACHE_PROCESS_LOCAL') != '1'  # noqa: F405
+):
+    raise ImproperlyConfigured(
+        'Кэш по умолчанию хранится в памяти процесса: задайте CACHE_REDIS_URL или '
+        'CACHE_MEMCACHED_LOCATION (CACHE_PROCESS_LOCAL=1, если сервер работает в одном процессе)'
+    )
+
+ALLOWED_HOSTS = env_list('ALLOWED_HOSTS')  # noqa: F405
+CSRF_TRUSTED_ORIGINS = env_list('CSRF_TRUSTED_ORIGINS')  # noqa: F405
+
+# Шаблоны компилируются один раз за время жизни процесса: кэширующий загрузчик
+# без отладочной информации и прогрев всех шаблонов приложения при запуске
+TEMPLATES[0]['APP_DIRS'] = False  # noqa: F405
+TEMPLATES[0]['OPTIONS'].update({  # noqa: F405
+    'debug': False,
+    'loaders': [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ],
+})
+TEMPLATE_WARMUP = True
+
+# Cookie сессии и CSRF передаются только по HTTPS (SECURE_COOKIES=0 отключает)
+SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = os.getenv('SECURE_COOKIES', '1') == '1'  # noqa: F405
+
+# Статика: бандлы, хэши в именах файлов и сжатые варианты .gz/.br (app/assets.py);
+# раздаётся из STATIC_ROOT до обработки сессий и остальных middleware
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'app.assets.CompressedManifestStaticFilesStorage',
+    },
+}
+STATIC_BUNDLING = True
+MIDDLEWARE.insert(  # noqa: F405
+    MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,  # noqa: F405
+    'app.middleware.StaticFilesMiddleware',
+)
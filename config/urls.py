@@ -18,7 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 
 from django.conf.urls.static import static
-from config import settings
+from django.conf import settings
 
 
 urlpatterns = [
@@ -11,6 +11,11 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.prod')
 
 application = get_wsgi_application()
+
+# Компиляция шаблонов до первого запроса (при TEMPLATE_WARMUP)
+from app.warmup import warm_up  # noqa: E402
+
+warm_up()